@@ -1,36 +1,72 @@
 import asyncio
-import random
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from strategies import create_strategy
+import tasks
+from common.webhook import webhook_from_env
 
 # Загружаем переменные окружения
 load_dotenv()
 
 # Телеграм токен бота
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Стратегия балансировки: least_loaded, round_robin, weighted_least_connections, power_of_two
+BALANCING_STRATEGY = os.getenv("BALANCING_STRATEGY", "least_loaded")
+# Пул узла: process - для CPU-нагрузки, thread - для блокирующего ввода-вывода
+NODE_EXECUTOR = os.getenv("NODE_EXECUTOR", "process")
+NODE_COUNT = int(os.getenv("NODE_COUNT", "3"))
+# По умолчанию ядра процессора делятся между узлами поровну
+NODE_WORKERS = int(os.getenv("NODE_WORKERS", str(max(1, (os.cpu_count() or 1) // NODE_COUNT))))
 bot = Bot(token=TOKEN)
 dp = Dispatcher()
 
+webhook_server = webhook_from_env(dp, bot)
+
 # Определение класса узла (сервер обработки)
 class Node:
-    def __init__(self, node_id):
+    def __init__(self, node_id, max_load=100, executor="process", workers=1):
         self.node_id = node_id
-        self.load = 0  # Текущая нагрузка
+        self.load = 0  # Текущая нагрузка: задачи в очереди пула и в работе
+        self.max_load = max_load  # Емкость узла (вес для weighted_least_connections)
+        self.workers = workers
         self.lock = asyncio.Lock()  # Блокировка для корректного обновления load
+        self.balancer = None  # Балансировщик, который нужно уведомлять об изменении load
+        # Собственный пул узла: задачи действительно выполняются параллельно
+        if executor == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        elif executor == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"node{node_id}")
+        else:
+            raise ValueError(f"Неизвестный тип пула узла: {executor}")
 
-    async def process_request(self, request_data):
-        """Обрабатывает запрос и уменьшает нагрузку после выполнения."""
+    async def process_request(self, func, *args):
+        """Выполняет func(*args) в пуле узла; нагрузка уменьшается и при ошибке."""
         async with self.lock:  # Блокируем изменение load, чтобы избежать ошибок
             self.load += 1
+            self._notify_balancer()
 
-        await asyncio.sleep(random.uniform(1, 3))  # Имитация обработки
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(func, *args))
+        finally:
+            async with self.lock:
+                self.load -= 1  # Уменьшаем нагрузку после выполнения
+                self._notify_balancer()
 
-        async with self.lock:
-            self.load -= 1  # Уменьшаем нагрузку после выполнения
+    def shutdown(self):
+        """Останавливает пул узла"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
-        return f"✅ Node {self.node_id} обработал запрос: {request_data} (Load: {self.load})"
+    def _notify_balancer(self):
+        """Сообщает стратегии балансировщика о новой нагрузке (например, для обновления кучи)"""
+        if self.balancer is not None:
+            self.balancer.strategy.on_load_change(self)
 
     def get_load(self):
         """Возвращает текущую нагрузку узла."""
@@ -38,38 +74,52 @@ class Node:
 
 # Класс балансировщика нагрузки
 class LoadBalancer:
-    def __init__(self, nodes):
+    def __init__(self, nodes, strategy="least_loaded"):
         self.nodes = nodes  # Список узлов
+        # Стратегия выбора узла (по умолчанию - наименее загруженный, среди равных случайный)
+        self.strategy = create_strategy(strategy) if isinstance(strategy, str) else strategy
+        self.strategy.attach(nodes)
+        for node in nodes:
+            node.balancer = self
 
     def select_node(self):
-        """Выбирает узел с наименьшей загрузкой. Если несколько, выбирает случайный."""
-        min_load = min(node.get_load() for node in self.nodes)  # Ищем минимальную загрузку
-        available_nodes = [node for node in self.nodes if node.get_load() == min_load]  # Узлы с минимальной загрузкой
-        selected_node = random.choice(available_nodes)  # Выбираем случайный из свободных узлов
+        """Выбирает узел согласно стратегии балансировки."""
+        selected_node = self.strategy.select()
         
         print(f"🔀 Выбран узел: Node {selected_node.node_id} (Load: {selected_node.get_load()})")  
         return selected_node
 
-    async def handle_request(self, request_data):
-        """Выбирает узел и отправляет ему запрос."""
+    async def handle_request(self, func, *args):
+        """Выбирает узел и выполняет на нем func(*args)."""
         node = self.select_node()
-        return await node.process_request(request_data)
+        return await node.process_request(func, *args)
+
+    def shutdown(self):
+        for node in self.nodes:
+            node.shutdown()
 
-# Создаём 3 узла для обработки
-nodes = [Node(i) for i in range(3)]
-balancer = LoadBalancer(nodes)
+# Создаём узлы для обработки, каждый со своим пулом
+nodes = [Node(i, executor=NODE_EXECUTOR, workers=NODE_WORKERS) for i in range(NODE_COUNT)]
+balancer = LoadBalancer(nodes, BALANCING_STRATEGY)
 
 # Обработчик команды /check
 @dp.message(Command("check"))
 async def check_request(message: types.Message):
     """Команда /check - проверяет данные с балансировкой нагрузки."""
     await message.answer("🔄 Запрос отправлен на обработку...")
-    response = await balancer.handle_request("Запрос от пользователя")
-    await message.answer(response)
+    task = tasks.check_request if NODE_EXECUTOR == "process" else tasks.simulate_io
+    response = await balancer.handle_request(task, "Запрос от пользователя")
+    await message.answer(f"✅ Запрос обработан: {response}")
 
 # Запуск бота
 async def main():
-    await dp.start_polling(bot)
+    try:
+        if webhook_server:
+            await webhook_server.run()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        balancer.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Микробенчмарк выбора наименее загруженного узла: линейный просмотр против индексированной кучи.
+
+Запуск: python bench_select.py --sizes 3 100 1000 10000 --ops 20000
+"""
+import argparse
+import random
+import time
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from common.node_registry import NodeRegistry
+
+
+class BenchNode:
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.load = 0
+
+
+def scan_select(nodes, rng):
+    """Прежний LoadBalancer.select_node: два прохода по списку и случайный выбор среди минимальных"""
+    min_load = min(node.load for node in nodes)
+    available_nodes = [node for node in nodes if node.load == min_load]
+    return rng.choice(available_nodes)
+
+
+def run_scan(size, ops, seed):
+    rng = random.Random(seed)
+    nodes = [BenchNode(i) for i in range(size)]
+    busy = []
+    started = time.perf_counter()
+    for _ in range(ops):
+        node = scan_select(nodes, rng)
+        node.load += 1
+        busy.append(node)
+        # Примерно половина запросов завершается - нагрузка остается в равновесии
+        if len(busy) > size and rng.random() < 0.5:
+            done = busy.pop(rng.randrange(len(busy)))
+            done.load -= 1
+    return time.perf_counter() - started
+
+
+def run_heap(size, ops, seed):
+    rng = random.Random(seed)
+    nodes = [BenchNode(i) for i in range(size)]
+    registry = NodeRegistry(nodes, rng=random.Random(seed))
+    busy = []
+    started = time.perf_counter()
+    for _ in range(ops):
+        node = registry.peek()
+        node.load += 1
+        registry.update(node)
+        busy.append(node)
+        if len(busy) > size and rng.random() < 0.5:
+            done = busy.pop(rng.randrange(len(busy)))
+            done.load -= 1
+            registry.update(done)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 100, 1000, 10000])
+    parser.add_argument("--ops", type=int, default=20000, help="Выборов узла на каждый размер")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'узлов':>8} {'просмотр, оп/с':>16} {'куча, оп/с':>14} {'ускорение':>10}")
+    for size in args.sizes:
+        scan_time = run_scan(size, args.ops, args.seed)
+        heap_time = run_heap(size, args.ops, args.seed)
+        print(
+            f"{size:>8} {args.ops / scan_time:>16,.0f} {args.ops / heap_time:>14,.0f} "
+            f"{scan_time / heap_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
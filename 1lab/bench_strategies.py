@@ -0,0 +1,135 @@
+"""Сравнение стратегий балансировки: пропускная способность и хвостовые задержки.
+
+Дискретно-событийная модель: узлы разной емкости (max_load), пуассоновский поток
+запросов, экспоненциальное время обслуживания. Параметр --staleness задает, как
+часто балансировщик получает свежие данные о нагрузке (0 - всегда актуальные).
+
+Запуск: python bench_strategies.py --nodes 16 --requests 50000 --staleness 0 0.5
+"""
+import argparse
+import heapq
+import random
+import os
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from strategies import STRATEGIES, create_strategy
+
+
+class SimNode:
+    def __init__(self, node_id, max_load, slots):
+        self.node_id = node_id
+        self.max_load = max_load
+        self.slots = slots  # Параллельных обработчиков
+        self.busy = 0
+        self.queue = deque()  # Время поступления ожидающих запросов
+        self.in_flight = 0  # Фактическая нагрузка
+        self.load = 0  # Нагрузка, которую видит балансировщик
+
+    def get_load(self):
+        return self.load
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def simulate(strategy_name, args, staleness):
+    rng = random.Random(args.seed)
+    weights = [100, 50, 25]
+    nodes = [
+        SimNode(i, weights[i % len(weights)], max(1, weights[i % len(weights)] // 25))
+        for i in range(args.nodes)
+    ]
+    strategy = create_strategy(strategy_name, rng=random.Random(args.seed))
+    strategy.attach(nodes)
+
+    capacity = sum(node.slots for node in nodes) / args.service_mean
+    arrival_rate = capacity * args.utilization
+
+    def publish(node):
+        node.load = node.in_flight
+        strategy.on_load_change(node)
+
+    events = []  # (время, порядковый номер, тип, данные)
+    seq = 0
+
+    def push(time, kind, data=None):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (time, seq, kind, data))
+
+    def start_service(node, now, arrived):
+        node.busy += 1
+        push(now + rng.expovariate(1 / args.service_mean), "done", (node, arrived))
+
+    push(rng.expovariate(arrival_rate), "arrival")
+    if staleness > 0:
+        push(staleness, "refresh")
+
+    latencies = []
+    sent = 0
+    now = 0.0
+    while events:
+        now, _, kind, data = heapq.heappop(events)
+        if kind == "arrival":
+            node = strategy.select()
+            node.in_flight += 1
+            if staleness == 0:
+                publish(node)
+            if node.busy < node.slots:
+                start_service(node, now, now)
+            else:
+                node.queue.append(now)
+            sent += 1
+            if sent < args.requests:
+                push(now + rng.expovariate(arrival_rate), "arrival")
+        elif kind == "done":
+            node, arrived = data
+            node.busy -= 1
+            node.in_flight -= 1
+            latencies.append(now - arrived)
+            if staleness == 0:
+                publish(node)
+            if node.queue:
+                start_service(node, now, node.queue.popleft())
+        elif kind == "refresh":
+            for node in nodes:
+                publish(node)
+            if sent < args.requests:
+                push(now + staleness, "refresh")
+
+    latencies.sort()
+    return {
+        'throughput': len(latencies) / now,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--utilization", type=float, default=0.85, help="Доля от суммарной емкости узлов")
+    parser.add_argument("--service-mean", type=float, default=0.05, help="Среднее время обслуживания, с")
+    parser.add_argument("--staleness", type=float, nargs="+", default=[0.0, 0.5],
+                        help="Период обновления данных о нагрузке, с")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for staleness in args.staleness:
+        print(f"\nУстаревание данных о нагрузке: {staleness} с")
+        print(f"{'стратегия':<28} {'запр/с':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+        for name in STRATEGIES:
+            result = simulate(name, args, staleness)
+            print(
+                f"{name:<28} {result['throughput']:>9.1f} {result['p50'] * 1000:>9.1f} "
+                f"{result['p95'] * 1000:>9.1f} {result['p99'] * 1000:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
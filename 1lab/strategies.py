@@ -0,0 +1,111 @@
+import random
+
+from common.node_registry import NodeRegistry
+
+
+class BalancingStrategy:
+    """Базовый класс стратегии выбора узла"""
+
+    name = ""
+
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+        self.nodes = []
+
+    def attach(self, nodes):
+        """Вызывается балансировщиком при создании"""
+        self.nodes = list(nodes)
+
+    def select(self):
+        raise NotImplementedError
+
+    def on_load_change(self, node):
+        """Вызывается узлом после изменения нагрузки"""
+
+
+class LeastLoadedStrategy(BalancingStrategy):
+    """Глобальный минимум нагрузки, среди равных - случайный узел (прежнее поведение)"""
+
+    name = "least_loaded"
+
+    def attach(self, nodes):
+        super().attach(nodes)
+        self.registry = NodeRegistry(self.nodes, key=lambda node: node.get_load(), rng=self.rng)
+
+    def select(self):
+        return self.registry.peek()
+
+    def on_load_change(self, node):
+        self.registry.update(node)
+
+
+class RoundRobinStrategy(BalancingStrategy):
+    """Узлы по кругу, без учета нагрузки"""
+
+    name = "round_robin"
+
+    def attach(self, nodes):
+        super().attach(nodes)
+        self.index = 0
+
+    def select(self):
+        node = self.nodes[self.index]
+        self.index = (self.index + 1) % len(self.nodes)
+        return node
+
+
+class WeightedLeastConnectionsStrategy(BalancingStrategy):
+    """Минимум отношения нагрузки к весу узла (вес - max_load)"""
+
+    name = "weighted_least_connections"
+
+    def attach(self, nodes):
+        super().attach(nodes)
+        self.registry = NodeRegistry(
+            self.nodes, key=lambda node: node.get_load() / node.max_load, rng=self.rng
+        )
+
+    def select(self):
+        return self.registry.peek()
+
+    def on_load_change(self, node):
+        self.registry.update(node)
+
+
+class PowerOfTwoChoicesStrategy(BalancingStrategy):
+    """Два случайных узла, выбирается менее загруженный.
+
+    Не требует глобально согласованного взгляда на нагрузку и не сгоняет
+    все запросы на один узел, когда данные о нагрузке устарели.
+    """
+
+    name = "power_of_two"
+
+    def select(self):
+        if len(self.nodes) < 2:
+            return self.nodes[0]
+        first, second = self.rng.sample(self.nodes, 2)
+        if first.get_load() == second.get_load():
+            return first  # sample уже выбрал пару в случайном порядке
+        return first if first.get_load() < second.get_load() else second
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (
+        LeastLoadedStrategy,
+        RoundRobinStrategy,
+        WeightedLeastConnectionsStrategy,
+        PowerOfTwoChoicesStrategy
+    )
+}
+
+
+def create_strategy(name, rng=None):
+    """Создает стратегию по имени; неизвестное имя - ValueError"""
+    try:
+        return STRATEGIES[name](rng=rng)
+    except KeyError:
+        raise ValueError(
+            f"Неизвестная стратегия балансировки: {name}. Доступны: {', '.join(STRATEGIES)}"
+        ) from None
@@ -0,0 +1,23 @@
+"""Задачи, которые узлы выполняют в своих пулах.
+
+Функции объявлены на уровне модуля, чтобы их можно было передать в
+ProcessPoolExecutor (они должны сериализоваться через pickle).
+"""
+import hashlib
+import os
+import random
+import time
+
+
+def simulate_io(request_data):
+    """Блокирующая операция ввода-вывода (подходит для пула потоков)"""
+    time.sleep(random.uniform(1, 3))
+    return f"{request_data} (поток процесса {os.getpid()})"
+
+
+def check_request(request_data, rounds=200_000):
+    """CPU-нагрузка: многократное хеширование данных запроса"""
+    digest = request_data.encode()
+    for _ in range(rounds):
+        digest = hashlib.sha256(digest).digest()
+    return f"{request_data} (процесс {os.getpid()}, хеш {digest.hex()[:16]})"
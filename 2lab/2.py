@@ -2,13 +2,21 @@ import asyncio
 import os
 import json
 import logging
-import aiohttp
 import base64
+import sys
 from aiogram import Bot, Dispatcher, types
 from aiogram.types import Message, BotCommand, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.filters import Command
 from dotenv import load_dotenv
 from datetime import datetime
+from storage import AsyncStorage
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from common.persistence import JsonFileWriter
+from common.node_registry import NodeRegistry
+from common.http_sessions import ProviderSessions
+from common.metrics import MetricsRegistry, MetricsServer
+from common.router import ButtonRouter, classify_indicator, with_scheme, has_text
+from common.webhook import webhook_from_env
 
 load_dotenv()
 
@@ -16,15 +24,53 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 LEAKCHECK_API_KEY = os.getenv("LEAKCHECK_API_KEY")
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
 IPQS_API_KEY = os.getenv("IPQS_API_KEY")
+# Адреса внешних API (переопределяются, например, для нагрузочного теста с локальной заглушкой)
+LEAKCHECK_API_URL = os.getenv("LEAKCHECK_API_URL", "https://leakcheck.io").rstrip("/")
+VIRUSTOTAL_API_URL = os.getenv("VIRUSTOTAL_API_URL", "https://www.virustotal.com").rstrip("/")
+IPQS_API_URL = os.getenv("IPQS_API_URL", "https://ipqualityscore.com").rstrip("/")
 
 bot = Bot(token=TOKEN)
 dp = Dispatcher()
+# Кнопки клавиатуры: текст -> обработчик
+buttons = ButtonRouter()
+
+webhook_server = webhook_from_env(dp, bot)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 SUBSCRIBERS_FILE = "subscribers.json"
 HISTORY_FILE = "history.json"
 NODE_LOADS_FILE = "node_loads.json"
+DB_FILE = "bot.db"
+
+# Настройки пула HTTP-соединений к внешним API
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+PROVIDERS = ("leakcheck", "virustotal", "ipqs")
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - сервер выключен)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+metrics = MetricsRegistry("bot")
+handler_latency = metrics.histogram(
+    "handler_seconds", "Время обработки сообщения", ("handler", "type"))
+provider_latency = metrics.histogram(
+    "provider_request_seconds", "Время запроса к внешнему API до получения ответа", ("provider", "status"))
+node_load_gauge = metrics.gauge("node_load", "Нагрузка узла", ("node",))
+persistence_latency = metrics.histogram(
+    "persistence_write_seconds", "Время записи состояния", ("target",))
+metrics_server = MetricsServer(metrics, METRICS_PORT, METRICS_HOST)
+
+
+http_sessions = ProviderSessions(
+    PROVIDERS, provider_latency,
+    limit_per_host=HTTP_LIMIT_PER_HOST,
+    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    ttl_dns_cache=HTTP_DNS_CACHE_TTL
+)
 
 def load_node_loads():
     """Загружает состояние узлов из файла"""
@@ -36,77 +82,48 @@ def load_node_loads():
                     node_info = node_data.get(str(node.node_id))
                     if node_info:
                         node.load = node_info["load"]
+                        node_registry.update(node)
                         node.last_update = datetime.strptime(
                             node_info["last_update"], "%Y-%m-%d %H:%M:%S"
                         )
     except Exception as e:
         logging.error(f"Ошибка при загрузке данных о загрузке узлов: {e}")
 
-def save_node_loads():
-    """Сохраняет текущее состояние узлов в файл"""
-    try:
-        node_data = {
-            str(node.node_id): {
-                "load": node.load,
-                "last_update": node.last_update.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            for node in NODES
+def node_loads_snapshot():
+    """Состояние узлов для записи в NODE_LOADS_FILE"""
+    return {
+        str(node.node_id): {
+            "load": node.load,
+            "last_update": node.last_update.strftime("%Y-%m-%d %H:%M:%S")
         }
-        with open(NODE_LOADS_FILE, "w") as file:
-            json.dump(node_data, file, indent=4)
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении данных о загрузке узлов: {e}")
-
-
-def load_subscribers():
-    try:
-        if os.path.exists(SUBSCRIBERS_FILE):
-            with open(SUBSCRIBERS_FILE, "r") as file:
-                return json.load(file)
-        return []
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        logging.error(f"Ошибка загрузки подписчиков: {e}")
-        return []
+        for node in NODES
+    }
 
+node_loads_writer = JsonFileWriter(
+    NODE_LOADS_FILE,
+    node_loads_snapshot,
+    on_write=lambda seconds: persistence_latency.observe(seconds, "node_loads")
+)
 
-def save_subscribers(subscribers):
+async def save_node_loads():
+    """Сохраняет текущее состояние узлов в файл, не блокируя цикл событий"""
     try:
-        with open(SUBSCRIBERS_FILE, "w") as file:
-            json.dump(subscribers, file, indent=4)
+        await node_loads_writer.write()
     except Exception as e:
-        logging.error(f"Ошибка сохранения подписчиков: {e}")
+        logging.error(f"Ошибка при сохранении данных о загрузке узлов: {e}")
 
 
-def load_history():
-    try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, "r") as file:
-                return json.load(file)
-        return {}
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        logging.error(f"Ошибка загрузки истории: {e}")
-        return {}
+# Подписчики и история хранятся в SQLite; запросы выполняются вне цикла событий
+storage = AsyncStorage(DB_FILE)
 
 
-def save_history(history):
+async def add_to_history(user_id, data_type, value):
+    """Добавляет запись в историю пользователя"""
     try:
-        with open(HISTORY_FILE, "w") as file:
-            json.dump(history, file, indent=4)
+        with persistence_latency.time("history"):
+            await storage.add_history(user_id, data_type, value)
     except Exception as e:
-        logging.error(f"Ошибка сохранения истории: {e}")
-
-
-def add_to_history(user_id, data_type, value):
-    history = load_history()
-    user_id_str = str(user_id)
-
-    if user_id_str not in history:
-        history[user_id_str] = {"email": [], "ip": [], "phone": []}
-
-    if value not in history[user_id_str][data_type]:
-        history[user_id_str][data_type].append(value)
-
-    save_history(history)
+        logging.error(f"Ошибка при добавлении в историю: {e}")
 
 
 # Устанавливаем команды, доступные в боте
@@ -149,13 +166,16 @@ async def start(message: Message):
         await message.answer("Произошла ошибка, попробуйте позже.")
 
 
-@dp.message(lambda message: message.text == "🔔 Подписаться на уведомления")
+@dp.message(buttons)
+async def handle_button(message: Message, button_handler):
+    """Нажатие кнопки клавиатуры: обработчик найден по тексту одним поиском в словаре"""
+    await button_handler(message)
+
+
+@buttons.button("🔔 Подписаться на уведомления")
 async def subscribe(message: Message):
     try:
-        subscribers = load_subscribers()
-        if message.from_user.id not in subscribers:
-            subscribers.append(message.from_user.id)
-            save_subscribers(subscribers)
+        if await storage.add_subscriber(message.from_user.id):
             await message.answer("✅ Вы подписались на уведомления о новых утечках!")
         else:
             await message.answer("⚠️ Вы уже подписаны на уведомления.")
@@ -164,13 +184,10 @@ async def subscribe(message: Message):
         await message.answer("❌ Произошла ошибка при подписке. Попробуйте позже.")
 
 
-@dp.message(lambda message: message.text == "🚫 Отписаться от уведомлений")
+@buttons.button("🚫 Отписаться от уведомлений")
 async def unsubscribe(message: Message):
     try:
-        subscribers = load_subscribers()
-        if message.from_user.id in subscribers:
-            subscribers.remove(message.from_user.id)
-            save_subscribers(subscribers)
+        if await storage.remove_subscriber(message.from_user.id):
             await message.answer("✅ Вы отписались от уведомлений.")
         else:
             await message.answer("⚠️ Вы не были подписаны.")
@@ -182,13 +199,9 @@ async def unsubscribe(message: Message):
 @dp.message(Command("status"))
 async def status(message: Message):
     logging.info("Команда /status получена")
-    subscribers = load_subscribers()
-    history = load_history()
-    user_id_str = str(message.from_user.id)
-
-    is_subscribed = "✅ Подписаны" if message.from_user.id in subscribers else "❌ Не подписаны"
+    subscribed, user_history = await storage.get_user_status(message.from_user.id)
 
-    user_history = history.get(user_id_str, {"email": [], "ip": [], "phone": []})
+    is_subscribed = "✅ Подписаны" if subscribed else "❌ Не подписаны"
 
     email_list = "\n".join(user_history["email"]) if user_history["email"] else "Нет данных"
     ip_list = "\n".join(user_history["ip"]) if user_history["ip"] else "Нет данных"
@@ -199,7 +212,7 @@ async def status(message: Message):
     await message.answer(response)
 
 
-@dp.message(lambda message: message.text == "💡 Советы по безопасности")
+@buttons.button("💡 Советы по безопасности")
 async def send_tips(message: Message):
     tips = [
         "✅ Используй сложные пароли и менеджеры паролей.",
@@ -212,22 +225,22 @@ async def send_tips(message: Message):
 
 
 # Обработчики для проверки данных (URL, email, телефон, IP)
-@dp.message(lambda message: message.text == "🔍 Проверка URL")
+@buttons.button("🔍 Проверка URL")
 async def check_url(message: Message):
     await message.answer("Введите URL для проверки:")
 
 
-@dp.message(lambda message: message.text == "📧 Проверка Email")
+@buttons.button("📧 Проверка Email")
 async def check_email(message: Message):
     await message.answer("Введите email для проверки:")
 
 
-@dp.message(lambda message: message.text == "📱 Проверка телефона")
+@buttons.button("📱 Проверка телефона")
 async def check_phone(message: Message):
     await message.answer("Введите номер телефона для проверки:")
 
 
-@dp.message(lambda message: message.text == "🌐 Проверка IP")
+@buttons.button("🌐 Проверка IP")
 async def check_ip(message: Message):
     await message.answer("Введите IP-адрес для проверки:")
 
@@ -244,6 +257,7 @@ class Node:
         if self.load > self.max_load:
             self.load = self.max_load
         self.last_update = datetime.now()
+        node_registry.update(self)
 
     def decrease_load(self, decrement=1):
         """Уменьшает нагрузку на узле"""
@@ -251,6 +265,7 @@ class Node:
         if self.load < 0:
             self.load = 0
         self.last_update = datetime.now()
+        node_registry.update(self)
 
     def get_status(self):
         """Возвращает статус узла в виде словаря"""
@@ -264,9 +279,19 @@ class Node:
 # Создаем список узлов
 NODES = [Node(i) for i in range(3)]
 
+# Min-куча узлов по нагрузке: выбор за O(1), обновление за O(log n)
+node_registry = NodeRegistry(NODES)
+
+def collect_node_metrics():
+    """Нагрузка узлов для /metrics"""
+    for node in NODES:
+        node_load_gauge.set(node.load, node.node_id)
+
+metrics.add_collector(collect_node_metrics)
+
 def select_node():
     """Выбирает узел с наименьшей нагрузкой"""
-    return min(NODES, key=lambda node: node.load)
+    return node_registry.peek()
 
 @dp.message(Command("node_status"))
 async def node_status(message: types.Message):
@@ -280,6 +305,7 @@ async def node_status(message: types.Message):
                 f"Загрузка: {status['current_load']}%\n"
                 f"Последнее обновление: {status['last_update']}\n\n"
             )
+        status_text += http_sessions.format_stats()
         
         await message.answer(status_text)
     except Exception as e:
@@ -296,27 +322,38 @@ async def check_data_breach(email):
         node.update_load()
         
         # Проверяем данные через LeakCheck API
-        url = f"https://leakcheck.io/api?key={LEAKCHECK_API_KEY}&check={email}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("success") and data.get("found"):
-                        return True
-                    return False
-                else:
-                    logging.error("Ошибка при проверке email")
-                    return False
+        url = f"{LEAKCHECK_API_URL}/api?key={LEAKCHECK_API_KEY}&check={email}"
+        session = http_sessions.get("leakcheck")
+        async with session.get(url) as response:
+            if response.status == 200:
+                data = await response.json()
+                if data.get("success") and data.get("found"):
+                    return True
+                return False
+            else:
+                logging.error("Ошибка при проверке email")
+                return False
     except Exception as e:
         logging.error(f"Ошибка при проверке email: {e}")
         return False
 
-@dp.message(lambda message: message.text)
+@dp.message.middleware()
+async def handler_metrics(handler, event, data):
+    """Время работы обработчика; для handle_data_input - с типом индикатора"""
+    callback = data.get("button_handler") or data["handler"].callback
+    data_type = "-"
+    if callback is handle_data_input and event.text:
+        data_type = classify_indicator(event.text.strip()) or "unknown"
+    with handler_latency.time(callback.__name__, data_type):
+        return await handler(event, data)
+
+@dp.message(has_text)
 async def handle_data_input(message: Message):
     text = message.text.strip()
+    data_type = classify_indicator(text)
     
     # Проверка email
-    if "@" in text:
+    if data_type == "email":
         # Выбираем узел с наименьшей нагрузкой
         node = select_node()
         
@@ -327,7 +364,7 @@ async def handle_data_input(message: Message):
         
         # Уменьшаем нагрузку после выполнения запроса
         node.decrease_load()
-        save_node_loads()
+        await save_node_loads()
         
         if is_breached:
             await message.answer(f"⚠️ Этот email найден в базе утечек!")
@@ -335,11 +372,11 @@ async def handle_data_input(message: Message):
             await message.answer(f"✅ Email {text} не найден в утечках.")
     
     # Проверка телефона
-    elif text.isdigit() and len(text) >= 10:
+    elif data_type == "phone":
         await message.answer("� Телефон проверяется...")
     
     # Проверка URL
-    elif text.startswith("http"):
+    elif data_type == "url":
         # Выбираем узел с наименьшей нагрузкой
         node = select_node()
         
@@ -350,12 +387,12 @@ async def handle_data_input(message: Message):
         
         # Уменьшаем нагрузку после выполнения запроса
         node.decrease_load()
-        save_node_loads()
+        await save_node_loads()
         
         await message.answer(safety_message)
     
     # Проверка IP
-    elif text.count(".") == 3 and all(part.isdigit() for part in text.split(".")):
+    elif data_type == "ip":
         # Выбираем узел с наименьшей нагрузкой
         node = select_node()
         
@@ -366,7 +403,7 @@ async def handle_data_input(message: Message):
         
         # Уменьшаем нагрузку после выполнения запроса
         node.decrease_load()
-        save_node_loads()
+        await save_node_loads()
         
         await message.answer(result)
     else:
@@ -374,6 +411,7 @@ async def handle_data_input(message: Message):
 
 # Проверка URL через VirusTotal API
 async def check_url_virustotal(url):
+    url = with_scheme(url)  # Имя хоста без схемы проверяем как http://
     try:
         # Выбираем узел с наименьшей нагрузкой
         node = select_node()
@@ -381,24 +419,24 @@ async def check_url_virustotal(url):
         # Обновляем нагрузку на узле
         node.update_load()
         
-        async with aiohttp.ClientSession() as session:
-            url = f"https://www.virustotal.com/api/v3/urls"
-            headers = {"x-apikey": VIRUSTOTAL_API_KEY}
-            data = {"url": url}
-            
-            async with session.post(url, headers=headers, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    if result.get("data", {}).get("attributes", {}).get("last_analysis_stats", {}).get("malicious") > 0:
-                        result_text = "⚠️ URL может быть вредоносным!"
-                    else:
-                        result_text = "✅ URL безопасен"
+        session = http_sessions.get("virustotal")
+        endpoint = f"{VIRUSTOTAL_API_URL}/api/v3/urls"
+        headers = {"x-apikey": VIRUSTOTAL_API_KEY}
+        data = {"url": url}
+
+        async with session.post(endpoint, headers=headers, json=data) as response:
+            if response.status == 200:
+                result = await response.json()
+                if result.get("data", {}).get("attributes", {}).get("last_analysis_stats", {}).get("malicious") > 0:
+                    result_text = "⚠️ URL может быть вредоносным!"
                 else:
-                    result_text = "❌ Ошибка при проверке URL"
+                    result_text = "✅ URL безопасен"
+            else:
+                result_text = "❌ Ошибка при проверке URL"
 
         # Уменьшаем нагрузку после выполнения запроса
         node.decrease_load()
-        save_node_loads()
+        await save_node_loads()
         
         return result_text
     except Exception as e:
@@ -414,29 +452,29 @@ async def check_ip_reputation(ip_address):
         # Обновляем нагрузку на узле
         node.update_load()
         
-        async with aiohttp.ClientSession() as session:
-            url = f"https://ipqualityscore.com/api/json/ip/{IPQS_API_KEY}/{ip_address}"
-            
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get("success", False):
-                        risk = data.get("fraud_score", 0)
-                        if risk > 80:
-                            result_text = f"❌ IP-адрес {ip_address} имеет высокий риск: {risk}/100."
-                        elif risk > 50:
-                            result_text = f"⚠️ IP-адрес {ip_address} имеет средний риск: {risk}/100."
-                        else:
-                            result_text = f"✅ IP-адрес {ip_address} безопасен: {risk}/100."
+        session = http_sessions.get("ipqs")
+        url = f"{IPQS_API_URL}/api/json/ip/{IPQS_API_KEY}/{ip_address}"
+
+        async with session.get(url) as response:
+            if response.status == 200:
+                data = await response.json()
+
+                if data.get("success", False):
+                    risk = data.get("fraud_score", 0)
+                    if risk > 80:
+                        result_text = f"❌ IP-адрес {ip_address} имеет высокий риск: {risk}/100."
+                    elif risk > 50:
+                        result_text = f"⚠️ IP-адрес {ip_address} имеет средний риск: {risk}/100."
                     else:
-                        result_text = "❌ Ошибка при проверке IP-адреса"
+                        result_text = f"✅ IP-адрес {ip_address} безопасен: {risk}/100."
                 else:
                     result_text = "❌ Ошибка при проверке IP-адреса"
+            else:
+                result_text = "❌ Ошибка при проверке IP-адреса"
 
         # Уменьшаем нагрузку после выполнения запроса
         node.decrease_load()
-        save_node_loads()
+        await save_node_loads()
         
         return result_text
     except Exception as e:
@@ -445,17 +483,31 @@ async def check_ip_reputation(ip_address):
 
 async def main():
     logging.info("Запуск бота...")
-    await set_bot_commands()
-    logging.info("Бот зарегистрировал команды.")
-    await dp.start_polling(bot)
+    await http_sessions.start()
+    await metrics_server.start()
+    await storage.import_json(SUBSCRIBERS_FILE, HISTORY_FILE)
+    try:
+        await set_bot_commands()
+        logging.info("Бот зарегистрировал команды.")
+        if webhook_server:
+            await webhook_server.run()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await metrics_server.stop()
+        await http_sessions.close()
+        await storage.close()
 
 
 # Алгоритм "Эхо"
 async def echo_algorithm(node_id, load_data):
     """Имитация волнового алгоритма 'Эхо' для сбора данных о загрузке узлов"""
-    node_loads = load_node_loads()
-    node_loads[node_id] = load_data
-    save_node_loads(node_loads)
+    node = NODES[node_id]
+    node.load = max(0, min(node.max_load, load_data))
+    node.last_update = datetime.now()
+    node_registry.update(node)
+    await save_node_loads()
+    node_loads = {node.node_id: node.load for node in NODES}
     logging.info(f"Собрана информация о загрузке узла {node_id}: {load_data}")
 
     # После сбора данных алгоритм принимает решение о балансировке
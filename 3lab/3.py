@@ -2,14 +2,39 @@ import asyncio
 import os
 import json
 import logging
-import aiohttp
 import base64
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import Message, BotCommand, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.filters import Command
 from dotenv import load_dotenv
 from datetime import datetime
 import random
+import math
+import signal
+import time
+import sys
+from contextlib import asynccontextmanager
+from cache import ResultCache, normalize_email, canonical_url, pack_ip
+from singleflight import SingleFlight
+from ratelimit import RateLimiter, RateLimitBusy, TokenBucket, parse_retry_after
+from bulk import BulkChecker
+from storage import AsyncStorage
+from monitoring import LoopLagMonitor
+from broadcast import Broadcaster
+from wave import WaveEngine, TOPOLOGIES
+from watermarks import Watermarks, RebalanceTrigger, NORMAL, HIGH
+from shared_state import STATE_BACKENDS, StateSync
+from workers import WorkerPool, WorkerServer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from common.persistence import WriteBehindPersister
+from common.node_registry import NodeRegistry
+from common.http_sessions import ProviderSessions
+from common.scheduler import BalancingScheduler
+from common.metrics import MetricsRegistry, MetricsServer
+from common.router import ButtonRouter, classify_indicator, with_scheme, has_document
+from common.webhook import webhook_from_env
 
 load_dotenv()
 
@@ -17,15 +42,138 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 LEAKCHECK_API_KEY = os.getenv("LEAKCHECK_API_KEY")
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
 IPQS_API_KEY = os.getenv("IPQS_API_KEY")
+# Адреса внешних API (переопределяются, например, для нагрузочного теста с локальной заглушкой)
+LEAKCHECK_API_URL = os.getenv("LEAKCHECK_API_URL", "https://leakcheck.io").rstrip("/")
+VIRUSTOTAL_API_URL = os.getenv("VIRUSTOTAL_API_URL", "https://www.virustotal.com").rstrip("/")
+IPQS_API_URL = os.getenv("IPQS_API_URL", "https://ipqs.io").rstrip("/")
+# Пользователи, которым разрешена команда /broadcast (через запятую)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
 
-bot = Bot(token=TOKEN)
+# Адрес Bot API: по умолчанию api.telegram.org, можно указать локальный сервер telegram-bot-api
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+bot = Bot(
+    token=TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+)
 dp = Dispatcher()
+# Кнопки клавиатуры: текст -> обработчик
+buttons = ButtonRouter()
+
+webhook_server = webhook_from_env(dp, bot)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Многопроцессный режим: при WORKERS > 1 этот процесс только принимает обновления и раздает
+# их воркерам по user_id; воркер - этот же скрипт, запущенный пулом с WORKER_INDEX и WORKER_SOCKET
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_INDEX = os.getenv("WORKER_INDEX")
+WORKER_SOCKET = os.getenv("WORKER_SOCKET")
+WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", "50"))
+# Балансировку, массовые проверки и рассылки ведет один процесс: единственный или воркер 0
+BALANCING_OWNER = WORKER_INDEX in (None, "0")
+
+LOG_PREFIX = "" if WORKER_INDEX is None else f"воркер {WORKER_INDEX} - "
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format=f'%(asctime)s - {LOG_PREFIX}%(levelname)s - %(message)s'
+)
 
 SUBSCRIBERS_FILE = "subscribers.json"
 HISTORY_FILE = "history.json"
 NODE_LOADS_FILE = "node_loads.json"
+DB_FILE = "bot.db"
+
+# Настройки пула HTTP-соединений к внешним API
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+PROVIDERS = ("leakcheck", "virustotal", "ipqs")
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - сервер выключен)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+if METRICS_PORT and WORKER_INDEX is not None:
+    METRICS_PORT += int(WORKER_INDEX)  # У каждого воркера свой порт: METRICS_PORT, METRICS_PORT + 1, ...
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+WAVE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+metrics = MetricsRegistry("bot")
+handler_latency = metrics.histogram(
+    "handler_seconds", "Время обработки сообщения", ("handler", "type"))
+provider_latency = metrics.histogram(
+    "provider_request_seconds", "Время запроса к внешнему API до получения ответа", ("provider", "status"))
+node_load_gauge = metrics.gauge("node_load", "Нагрузка узла", ("node",))
+node_in_flight_gauge = metrics.gauge("node_in_flight", "Запросов, выполняющихся на узле", ("node",))
+wave_duration = metrics.histogram(
+    "wave_seconds", "Длительность волны Финна", buckets=WAVE_BUCKETS)
+persistence_latency = metrics.histogram(
+    "persistence_write_seconds", "Время записи состояния", ("target",))
+metrics_server = MetricsServer(metrics, METRICS_PORT, METRICS_HOST)
+
+
+http_sessions = ProviderSessions(
+    PROVIDERS, provider_latency,
+    limit_per_host=HTTP_LIMIT_PER_HOST,
+    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    ttl_dns_cache=HTTP_DNS_CACHE_TTL
+)
+
+# Кэш результатов проверок: TTL (в секундах) для каждого провайдера
+result_cache = ResultCache(
+    ttls={
+        "leakcheck": int(os.getenv("CACHE_TTL_LEAKCHECK", "86400")),
+        "virustotal": int(os.getenv("CACHE_TTL_VIRUSTOTAL", "3600")),
+        "ipqs": int(os.getenv("CACHE_TTL_IPQS", "1800"))
+    },
+    negative_ttls={
+        "leakcheck": int(os.getenv("CACHE_NEGATIVE_TTL_LEAKCHECK", "3600")),
+        "virustotal": int(os.getenv("CACHE_NEGATIVE_TTL_VIRUSTOTAL", "600"))
+    },
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+)
+
+# Объединение одновременных проверок одного и того же индикатора
+single_flight = SingleFlight()
+
+
+class ProviderError(Exception):
+    """Ошибка ответа внешнего API (не кэшируется)"""
+
+
+def create_bucket(provider, per_minute, burst):
+    """Token bucket провайдера; лимиты можно переопределить через .env.
+
+    Лимит провайдера общий для всех процессов, а корзина у каждого воркера своя, поэтому
+    при WORKERS > 1 воркер получает 1/WORKERS скорости и всплеска. Средняя скорость
+    соблюдается точно; всплеск не меньше одного запроса, так что при WORKERS больше
+    всплеска суммарный всплеск может превысить его на WORKERS - burst запросов.
+    """
+    env_name = provider.upper()
+    rate = float(os.getenv(f"RATE_LIMIT_{env_name}", str(per_minute))) / 60
+    capacity = int(os.getenv(f"RATE_BURST_{env_name}", str(burst)))
+    return TokenBucket(
+        provider,
+        rate=rate / WORKERS,
+        capacity=max(1, capacity // WORKERS),
+        max_queue=int(os.getenv("RATE_MAX_QUEUE", "100")),
+        max_wait=float(os.getenv("RATE_MAX_WAIT", "30"))
+    )
+
+
+# Лимиты запросов к внешним API (запросов в минуту, размер всплеска)
+rate_limiter = RateLimiter([
+    create_bucket("leakcheck", 60, 5),
+    create_bucket("virustotal", 4, 4),
+    create_bucket("ipqs", 60, 5)
+])
+
+
+def check_throttled(provider, response):
+    """Обрабатывает ответ 429: приостанавливает провайдера и сообщает о занятости"""
+    if response.status == 429:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        rate_limiter.pause(provider, retry_after)
+        raise RateLimitBusy(provider, retry_after)
 
 def load_node_loads():
     """Загружает состояние узлов из файла"""
@@ -37,82 +185,86 @@ def load_node_loads():
                     node_info = node_data.get(str(node.node_id))
                     if node_info:
                         node.load = node_info["load"]
+                        node_registry.update(node)
                         node.last_update = datetime.strptime(
                             node_info["last_update"], "%Y-%m-%d %H:%M:%S"
                         )
     except Exception as e:
         logging.error(f"Ошибка при загрузке данных о загрузке узлов: {e}")
 
-def save_node_loads():
-    """Сохраняет текущее состояние узлов в файл"""
-    try:
-        node_data = {
-            str(node.node_id): {
-                "load": node.load,
-                "last_update": node.last_update.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            for node in NODES
+def node_loads_snapshot():
+    """Текущее состояние узлов для записи в файл"""
+    return {
+        str(node.node_id): {
+            "load": node.load,
+            "last_update": node.last_update.strftime("%Y-%m-%d %H:%M:%S")
         }
-        with open(NODE_LOADS_FILE, "w") as file:
-            json.dump(node_data, file, indent=4)
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении данных о загрузке узлов: {e}")
+        for node in NODES
+    }
 
+# Отложенная запись node_loads.json: не чаще раза в NODE_LOADS_FLUSH_MS и при остановке
+node_loads_persister = WriteBehindPersister(
+    NODE_LOADS_FILE,
+    node_loads_snapshot,
+    interval=int(os.getenv("NODE_LOADS_FLUSH_MS", "500")) / 1000,
+    on_write=lambda seconds: persistence_latency.observe(seconds, "node_loads")
+)
 
-def load_subscribers():
-    try:
-        if os.path.exists(SUBSCRIBERS_FILE):
-            with open(SUBSCRIBERS_FILE, "r") as file:
-                return json.load(file)
-        return []
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        logging.error(f"Ошибка загрузки подписчиков: {e}")
-        return []
+# Замер задержки цикла событий (показывает, блокирует ли что-то обработчики)
+loop_lag_monitor = LoopLagMonitor()
 
+# Общее состояние воркеров: local - только этот процесс, sqlite - общий файл SQLite
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite" if WORKERS > 1 else "local")
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", DB_FILE)
+shared_state = STATE_BACKENDS[STATE_BACKEND](STATE_DB_FILE)
 
-def save_subscribers(subscribers):
-    try:
-        with open(SUBSCRIBERS_FILE, "w") as file:
-            json.dump(subscribers, file, indent=4)
-    except Exception as e:
-        logging.error(f"Ошибка сохранения подписчиков: {e}")
 
+def apply_shared_loads(loads, pending):
+    """Нагрузка узлов после сверки: общая плюс приращения, еще не отправленные в хранилище"""
+    for node in NODES:
+        if node.node_id in loads:
+            node.load = max(0, min(node.max_load, loads[node.node_id] + pending.get(node.node_id, 0)))
+            node_registry.update(node)
+            node.check_watermarks()
 
-def load_history():
-    try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, "r") as file:
-                return json.load(file)
-        return {}
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        logging.error(f"Ошибка загрузки истории: {e}")
-        return {}
 
+# Сверка с общим хранилищем раз в STATE_SYNC_MS (в режиме sqlite вместо записи node_loads.json)
+state_sync = StateSync(
+    shared_state,
+    apply_shared_loads,
+    interval=int(os.getenv("STATE_SYNC_MS", "100")) / 1000,
+    on_sync=lambda seconds: persistence_latency.observe(seconds, "shared_state")
+)
+if shared_state.shared:
+    result_cache.on_set = state_sync.add_cache
 
-def save_history(history):
-    try:
-        with open(HISTORY_FILE, "w") as file:
-            json.dump(history, file, indent=4)
-    except Exception as e:
-        logging.error(f"Ошибка сохранения истории: {e}")
+
+def save_node_loads(node, delta):
+    """Помечает состояние узлов измененным; запись выполняется в фоне"""
+    if shared_state.shared:
+        state_sync.add_load(node.node_id, delta)
+    else:
+        node_loads_persister.mark_dirty()
+
+
+# Подписчики и история хранятся в SQLite; запросы выполняются вне цикла событий
+storage = AsyncStorage(DB_FILE)
+
+
+# Рассылка уведомлений подписчикам
+broadcaster = Broadcaster(
+    bot,
+    storage,
+    rate=float(os.getenv("BROADCAST_RATE", "25")),
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+)
 
 
-def add_to_history(user_id: int, data_type: str, value: str):
+async def add_to_history(user_id, data_type, value):
     """Добавляет запись в историю пользователя"""
     try:
-        user_id_str = str(user_id)
-        
-        # Создаем структуру, если её нет
-        if user_id_str not in history:
-            history[user_id_str] = {}
-        
-        if data_type not in history[user_id_str]:
-            history[user_id_str][data_type] = []
-        
-        # Добавляем значение, если его еще нет
-        if value not in history[user_id_str][data_type]:
-            history[user_id_str][data_type].append(value)
-            save_history()
+        with persistence_latency.time("history"):
+            await storage.add_history(user_id, data_type, value)
     except Exception as e:
         logging.error(f"Ошибка при добавлении в историю: {e}")
 
@@ -149,7 +301,8 @@ async def start(message: Message):
     try:
         await message.answer(
             "🔐 Привет! Я бот для защиты персональных данных.\n"
-            "Выберите одну из опций для проверки:\n",
+            "Выберите одну из опций для проверки:\n"
+            "📄 Для массовой проверки отправьте файл .txt или .csv (по одному индикатору в строке)\n",
             reply_markup=start_keyboard
         )
     except Exception as e:
@@ -157,13 +310,16 @@ async def start(message: Message):
         await message.answer("Произошла ошибка, попробуйте позже.")
 
 
-@dp.message(lambda message: message.text == "🔔 Подписаться на уведомления")
+@dp.message(buttons)
+async def handle_button(message: Message, button_handler):
+    """Нажатие кнопки клавиатуры: обработчик найден по тексту одним поиском в словаре"""
+    await button_handler(message)
+
+
+@buttons.button("🔔 Подписаться на уведомления")
 async def subscribe(message: Message):
     try:
-        subscribers = load_subscribers()
-        if message.from_user.id not in subscribers:
-            subscribers.append(message.from_user.id)
-            save_subscribers(subscribers)
+        if await storage.add_subscriber(message.from_user.id):
             await message.answer("✅ Вы подписались на уведомления о новых утечках!")
         else:
             await message.answer("⚠️ Вы уже подписаны на уведомления.")
@@ -172,13 +328,10 @@ async def subscribe(message: Message):
         await message.answer("❌ Произошла ошибка при подписке. Попробуйте позже.")
 
 
-@dp.message(lambda message: message.text == "🚫 Отписаться от уведомлений")
+@buttons.button("🚫 Отписаться от уведомлений")
 async def unsubscribe(message: Message):
     try:
-        subscribers = load_subscribers()
-        if message.from_user.id in subscribers:
-            subscribers.remove(message.from_user.id)
-            save_subscribers(subscribers)
+        if await storage.remove_subscriber(message.from_user.id):
             await message.answer("✅ Вы отписались от уведомлений.")
         else:
             await message.answer("⚠️ Вы не были подписаны.")
@@ -190,13 +343,9 @@ async def unsubscribe(message: Message):
 @dp.message(Command("status"))
 async def status(message: Message):
     logging.info("Команда /status получена")
-    subscribers = load_subscribers()
-    history = load_history()
-    user_id_str = str(message.from_user.id)
-
-    is_subscribed = "✅ Подписаны" if message.from_user.id in subscribers else "❌ Не подписаны"
+    subscribed, user_history = await storage.get_user_status(message.from_user.id)
 
-    user_history = history.get(user_id_str, {"email": [], "ip": [], "phone": []})
+    is_subscribed = "✅ Подписаны" if subscribed else "❌ Не подписаны"
 
     email_list = "\n".join(user_history["email"]) if user_history["email"] else "Нет данных"
     ip_list = "\n".join(user_history["ip"]) if user_history["ip"] else "Нет данных"
@@ -207,7 +356,27 @@ async def status(message: Message):
     await message.answer(response)
 
 
-@dp.message(lambda message: message.text == "💡 Советы по безопасности")
+@dp.message(Command("broadcast"))
+async def broadcast(message: Message):
+    """Команда /broadcast <текст> - рассылка уведомления всем подписчикам (только для администраторов)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Команда доступна только администраторам.")
+        return
+
+    text = message.text.partition(" ")[2].strip()
+    if not text:
+        await message.answer("Использование: /broadcast <текст уведомления>")
+        return
+
+    try:
+        broadcast_id = await broadcaster.start(text)
+        await message.answer(f"📢 Рассылка #{broadcast_id} запущена")
+    except Exception as e:
+        logging.error(f"Ошибка запуска рассылки: {e}")
+        await message.answer("❌ Не удалось запустить рассылку.")
+
+
+@buttons.button("💡 Советы по безопасности")
 async def send_tips(message: Message):
     tips = [
         "✅ Используй сложные пароли и менеджеры паролей.",
@@ -220,100 +389,211 @@ async def send_tips(message: Message):
 
 
 # Обработчики для проверки данных (URL, email, телефон, IP)
-@dp.message(lambda message: message.text == "🔍 Проверка URL")
+@buttons.button("🔍 Проверка URL")
 async def check_url(message: Message):
     await message.answer("Введите URL для проверки:")
 
 
-@dp.message(lambda message: message.text == "📧 Проверка Email")
+@buttons.button("📧 Проверка Email")
 async def check_email(message: Message):
     await message.answer("Введите email для проверки:")
 
 
-@dp.message(lambda message: message.text == "📱 Проверка телефона")
+@buttons.button("📱 Проверка телефона")
 async def check_phone(message: Message):
     await message.answer("Введите номер телефона для проверки:")
 
 
-@dp.message(lambda message: message.text == "🌐 Проверка IP")
+@buttons.button("🌐 Проверка IP")
 async def check_ip(message: Message):
     await message.answer("Введите IP-адрес для проверки:")
 
+# Начальная оценка времени ответа узла и постоянная затухания EWMA, секунды
+NODE_EWMA_INITIAL = float(os.getenv("NODE_EWMA_INITIAL", "0.5"))
+NODE_EWMA_DECAY = float(os.getenv("NODE_EWMA_DECAY", "10"))
+# Модельная нагрузка - затухающий счетчик запросов: каждая аренда узла добавляет
+# NODE_LEASE_LOAD, а раз в NODE_LOAD_DECAY_INTERVAL нагрузка убывает с постоянной NODE_LOAD_DECAY
+NODE_LEASE_LOAD = int(os.getenv("NODE_LEASE_LOAD", "1"))
+NODE_LOAD_DECAY = float(os.getenv("NODE_LOAD_DECAY", "10"))
+NODE_LOAD_DECAY_INTERVAL = float(os.getenv("NODE_LOAD_DECAY_INTERVAL", "1"))
+
 class Node:
     def __init__(self, node_id):
         self.node_id = node_id
-        self.load = 0  # Текущая нагрузка
+        self.load = 0  # Модельная нагрузка: растет от аренд, затухает со временем, ее переносит балансировка
         self.max_load = 100  # Максимальная нагрузка
         self.last_update = datetime.now()
         self.neighbors = []  # Список соседних узлов
-        self.visited = False  # Флаг для волнового алгоритма
-        self.distance = float('inf')  # Расстояние до центрального узла
+        self.load_state = NORMAL  # normal | high | low относительно порогов нагрузки
+        self.in_flight = 0  # Запросов, выполняющихся на узле прямо сейчас (только через lease)
+        self.ewma_latency = NODE_EWMA_INITIAL  # Сглаженное время ответа, секунды
+        self.ewma_updated = time.monotonic()
 
     def update_load(self, increment=1):
+        previous = self.load
         self.load = min(self.max_load, self.load + increment)
         self.last_update = datetime.now()
-        save_node_loads()
+        node_registry.update(self)
+        save_node_loads(self, self.load - previous)
+        self.check_watermarks()
 
     def decrease_load(self, decrement=1):
+        previous = self.load
         self.load = max(0, self.load - decrement)
         self.last_update = datetime.now()
-        save_node_loads()
+        node_registry.update(self)
+        save_node_loads(self, self.load - previous)
+        self.check_watermarks()
+
+    def transfer_load(self, target, amount):
+        """Переносит модельную нагрузку на target; возвращает, сколько перенесено.
+
+        Сколько отдал один узел, столько же получил другой: перенос ограничен и
+        нагрузкой источника, и свободным местом получателя.
+        """
+        amount = min(amount, self.load, target.max_load - target.load)
+        if amount > 0:
+            self.decrease_load(amount)
+            target.update_load(amount)
+        return max(amount, 0)
+
+    def check_watermarks(self):
+        """Сообщает о пересечении порогов нагрузки (с гистерезисом); вызывается из update_load/decrease_load"""
+        state = watermarks.classify(self.load_state, self.load)
+        if state != self.load_state:
+            self.load_state = state
+            if BALANCING_OWNER:
+                rebalance_trigger.notify(self, state)
+
+    def observe_latency(self, latency):
+        """Обновляет peak-EWMA времени ответа: рост учитывается сразу, снижение - плавно"""
+        now = time.monotonic()
+        if latency > self.ewma_latency:
+            self.ewma_latency = latency
+        else:
+            weight = math.exp(-(now - self.ewma_updated) / NODE_EWMA_DECAY)
+            self.ewma_latency = self.ewma_latency * weight + latency * (1 - weight)
+        self.ewma_updated = now
+        node_registry.update(self)
+
+    def expected_completion(self):
+        """Ожидаемое время выполнения нового запроса: (запросов в работе + 1) × EWMA времени ответа"""
+        return (self.in_flight + 1) * self.ewma_latency
+
+    @asynccontextmanager
+    async def lease(self):
+        """Занимает узел на время запроса: счетчик in_flight всегда возвращается, даже при исключении.
+
+        Аренда добавляет узлу NODE_LEASE_LOAD модельной нагрузки (с проверкой порогов),
+        но обратно ее не вычитает: нагрузка убывает затуханием decay_node_loads. Парные
+        +1/-1 перестали бы сходиться после переноса нагрузки между узлами.
+        """
+        self.in_flight += 1
+        self.update_load(NODE_LEASE_LOAD)
+        started = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+            self.observe_latency(time.monotonic() - started)
 
     def get_status(self):
         return {
             'node_id': self.node_id,
             'load': self.load,
             'max_load': self.max_load,
+            'in_flight': self.in_flight,
+            'ewma_ms': round(self.ewma_latency * 1000),
+            'load_state': self.load_state,
             'last_update': self.last_update.strftime("%Y-%m-%d %H:%M:%S")
         }
 
+# Параметры сети узлов
+NODE_COUNT = int(os.getenv("NODE_COUNT", "3"))
+NODE_TOPOLOGY = os.getenv("NODE_TOPOLOGY", "complete")  # complete | ring
+# off - без журнала, summary - одна строка на волну, hops - каждый узел волны
+WAVE_LOG = os.getenv("WAVE_LOG", "summary")
+
+# Раунды повторяются, пока разброс или коэффициент вариации выше порога
+BALANCE_EPSILON_SPREAD = int(os.getenv("BALANCE_EPSILON_SPREAD", "10"))
+BALANCE_EPSILON_CV = float(os.getenv("BALANCE_EPSILON_CV", "0.1"))
+BALANCE_MAX_ROUNDS = int(os.getenv("BALANCE_MAX_ROUNDS", "10"))
+# Пауза между проверками растет от MIN до MAX, пока сеть сбалансирована
+BALANCE_MIN_INTERVAL = float(os.getenv("BALANCE_MIN_INTERVAL", "5"))
+BALANCE_MAX_INTERVAL = float(os.getenv("BALANCE_MAX_INTERVAL", "300"))
+
+# Пороги нагрузки узла; узел выходит из состояния high/low только по *_CLEAR
+NODE_HIGH_WATERMARK = int(os.getenv("NODE_HIGH_WATERMARK", "70"))
+NODE_HIGH_CLEAR = int(os.getenv("NODE_HIGH_CLEAR", "60"))
+NODE_LOW_WATERMARK = int(os.getenv("NODE_LOW_WATERMARK", "30"))
+NODE_LOW_CLEAR = int(os.getenv("NODE_LOW_CLEAR", "40"))
+# Сколько нагрузки переносит точечная балансировка за раз
+REBALANCE_AMOUNT = int(os.getenv("REBALANCE_AMOUNT", "10"))
+REBALANCE_MAX_STEPS = int(os.getenv("REBALANCE_MAX_STEPS", "5"))
+
+watermarks = Watermarks(NODE_HIGH_WATERMARK, NODE_HIGH_CLEAR, NODE_LOW_WATERMARK, NODE_LOW_CLEAR)
+
 # Создаем список узлов
-NODES = [Node(i) for i in range(3)]
+NODES = [Node(i) for i in range(NODE_COUNT)]
+wave_engine = None
+
+# Min-куча узлов по ожидаемому времени выполнения: выбор за O(1), обновление за O(log n)
+node_registry = NodeRegistry(NODES, key=lambda node: node.expected_completion())
+
+def select_node():
+    """Выбирает узел с наименьшим ожидаемым временем выполнения запроса"""
+    return node_registry.peek()
+
+def collect_node_metrics():
+    """Нагрузка узлов для /metrics"""
+    for node in NODES:
+        node_load_gauge.set(node.load, node.node_id)
+        node_in_flight_gauge.set(node.in_flight, node.node_id)
+
+metrics.add_collector(collect_node_metrics)
+
+def decay_node_loads(elapsed):
+    """Затухание модельной нагрузки за elapsed секунд; убыль округляется вверх, чтобы нагрузка доходила до нуля"""
+    factor = 1 - math.exp(-elapsed / NODE_LOAD_DECAY)
+    for node in NODES:
+        if node.load > 0:
+            node.decrease_load(math.ceil(node.load * factor))
+
+async def node_load_decay():
+    """Фоновое затухание нагрузки; ведет один процесс, иначе воркеры гасили бы общую нагрузку N раз"""
+    last = time.monotonic()
+    while True:
+        await asyncio.sleep(NODE_LOAD_DECAY_INTERVAL)
+        now = time.monotonic()
+        decay_node_loads(now - last)
+        last = now
 
 # Функция для инициализации сети
 async def initialize_network():
-    NODES[0].neighbors = [NODES[1], NODES[2]]
-    NODES[1].neighbors = [NODES[0], NODES[2]]
-    NODES[2].neighbors = [NODES[0], NODES[1]]
+    global wave_engine
+    adjacency = TOPOLOGIES[NODE_TOPOLOGY](len(NODES))
+    for node, neighbors in zip(NODES, adjacency):
+        node.neighbors = [NODES[index] for index in neighbors]
+    wave_engine = WaveEngine.from_adjacency(adjacency)
 
 # Волновой алгоритм Финна для сбора данных о загрузке
 async def finn_wave_algorithm(source_node):
-    logging.info(f"Запуск волнового алгоритма от узла {source_node.node_id}")
-    # Сбрасываем флаги посещения
-    for node in NODES:
-        node.visited = False
-        node.distance = float('inf')
-    
-    source_node.visited = True
-    source_node.distance = 0
+    with wave_duration.time():
+        order = wave_engine.run(source_node.node_id)
     
-    # Очередь для обработки узлов
-    queue = [source_node]
-    
-    while queue:
-        current_node = queue.pop(0)
-        logging.info(f"Обработка узла {current_node.node_id} с нагрузкой {current_node.load}")
-        
-        # Обновляем данные о загрузке
-        current_node.update_load()
-        
-        # Передаем информацию соседям
-        for neighbor in current_node.neighbors:
-            if not neighbor.visited:
-                neighbor.visited = True
-                neighbor.distance = current_node.distance + 1
-                queue.append(neighbor)
-                logging.info(f"Передача данных от узла {current_node.node_id} к узлу {neighbor.node_id}")
-                
-                # Обновляем данные о загрузке у соседа
-                neighbor.update_load()
-                
-    # Логируем итоговое состояние узлов
-    for node in NODES:
-        logging.info(f"Итоговое состояние узла {node.node_id}: нагрузка {node.load}")
+    if WAVE_LOG == "hops":
+        for index in order:
+            logging.info(
+                f"Обработка узла {index} (расстояние {wave_engine.distance[index]}) "
+                f"с нагрузкой {NODES[index].load}"
+            )
+    if WAVE_LOG != "off":
+        logging.info(
+            f"Волна от узла {source_node.node_id} обошла {len(order)} из {len(NODES)} узлов"
+        )
     
     # Возвращаем собранную информацию
-    return [node.get_status() for node in NODES]
+    return [NODES[index].get_status() for index in order]
 
 # Централизованное принятие решения о балансировке
 async def make_balancing_decision(node_loads):
@@ -328,7 +608,7 @@ async def make_balancing_decision(node_loads):
     logging.info(f"Узел с минимальной нагрузкой: {min_load_node['node_id']} ({min_load_node['load']}%)")
     
     # Проверяем, нужно ли переносить задачу
-    if max_load_node['load'] > 70 and min_load_node['load'] < 30:
+    if max_load_node['load'] > NODE_HIGH_WATERMARK and min_load_node['load'] < NODE_LOW_WATERMARK:
         logging.info("Превышены пороги нагрузки - требуется перенос задачи")
         
         # Имитация переноса задачи
@@ -336,43 +616,85 @@ async def make_balancing_decision(node_loads):
         min_load_node = [node for node in NODES if node.node_id == min_load_node['node_id']][0]
         
         # Переносим задачу
-        max_load_node.decrease_load(10)
-        min_load_node.update_load(10)
+        transferred = max_load_node.transfer_load(min_load_node, 10)
         
-        logging.info(f"Перенос 10% нагрузки с узла {max_load_node.node_id} на узел {min_load_node.node_id}")
+        logging.info(f"Перенос {transferred}% нагрузки с узла {max_load_node.node_id} на узел {min_load_node.node_id}")
         
         return {
             'action': 'transfer',
             'from_node': max_load_node.node_id,
             'to_node': min_load_node.node_id,
-            'load_transferred': 10
+            'load_transferred': transferred
         }
     else:
         logging.info("Пороги нагрузки не превышены - нет необходимости в переносе")
     
     return {'action': 'no_action'}
 
-# Периодическая проверка балансировки
+# Точечная балансировка по событию порога: обмен только с соседями узла.
+# Порог проверяется при каждом изменении load: аренда узла запросом поднимает нагрузку
+# сразу (всплеск виден без ожидания волны), затухание опускает ее раз в NODE_LOAD_DECAY_INTERVAL.
+# Переносится модельная нагрузка load; запросы в работе (in_flight) остаются на своих узлах
+async def rebalance_around(node):
+    transfers = []
+    # Несколько шагов, пока узел не вернется в норму (порог *_CLEAR)
+    for _ in range(REBALANCE_MAX_STEPS):
+        if node.load_state == NORMAL or not node.neighbors:
+            break
+        
+        if node.load_state == HIGH:
+            # Отдаем нагрузку наименее загруженному соседу
+            source, target = node, min(node.neighbors, key=lambda neighbor: neighbor.load)
+        else:
+            # Забираем нагрузку у наиболее загруженного соседа
+            source, target = max(node.neighbors, key=lambda neighbor: neighbor.load), node
+        
+        amount = min(REBALANCE_AMOUNT, (source.load - target.load) // 2)
+        if amount <= 0:
+            # Соседи в том же положении - нужна волна по всей сети
+            logging.info(f"Узел {node.node_id} ({node.load_state}): соседи не могут помочь, запускаем волну")
+            balancing_scheduler.wake()
+            break
+        
+        amount = source.transfer_load(target, amount)
+        if amount <= 0:
+            break
+        transfers.append({'from_node': source.node_id, 'to_node': target.node_id, 'load_transferred': amount})
+        logging.info(
+            f"Точечная балансировка узла {node.node_id}: "
+            f"перенос {amount}% с узла {source.node_id} на узел {target.node_id}"
+        )
+    return transfers
+
+rebalance_trigger = RebalanceTrigger(rebalance_around)
+
+# Один раунд балансировки: волна от случайного узла и решение о переносе
+async def balancing_round():
+    # Выбираем случайный узел как источник волны
+    source_node = random.choice(NODES)
+    
+    # Запускаем волновой алгоритм
+    node_loads = await finn_wave_algorithm(source_node)
+    
+    # Принимаем решение о балансировке
+    decision = await make_balancing_decision(node_loads)
+    
+    if decision['action'] == 'transfer':
+        logging.info(f"Перенос задачи с узла {decision['from_node']} на узел {decision['to_node']}")
+    return decision
+
+balancing_scheduler = BalancingScheduler(
+    balancing_round, lambda: [node.load for node in NODES],
+    epsilon_spread=BALANCE_EPSILON_SPREAD,
+    epsilon_cv=BALANCE_EPSILON_CV,
+    max_rounds=BALANCE_MAX_ROUNDS,
+    min_interval=BALANCE_MIN_INTERVAL,
+    max_interval=BALANCE_MAX_INTERVAL
+)
+
+# Периодическая проверка балансировки: раунды до баланса, затем пауза с нарастанием
 async def periodic_balancing():
-    while True:
-        try:
-            # Выбираем случайный узел как источник волны
-            source_node = random.choice(NODES)
-            
-            # Запускаем волновой алгоритм
-            node_loads = await finn_wave_algorithm(source_node)
-            
-            # Принимаем решение о балансировке
-            decision = await make_balancing_decision(node_loads)
-            
-            if decision['action'] == 'transfer':
-                logging.info(f"Перенос задачи с узла {decision['from_node']} на узел {decision['to_node']}")
-            
-        except Exception as e:
-            logging.error(f"Ошибка при балансировке: {e}")
-            
-        # Ждем перед следующей проверкой
-        await asyncio.sleep(60)  # Проверяем каждую минуту
+    await balancing_scheduler.run()
 
 @dp.message(Command("node_status"))
 async def node_status(message: types.Message):
@@ -383,55 +705,158 @@ async def node_status(message: types.Message):
             status = node.get_status()
             status_text += (
                 f"Узел {status['node_id']}:\n"
-                f"Загрузка: {status['load']}%\n"
+                f"Модельная нагрузка: {status['load']}%\n"
+                f"Состояние: {status['load_state']}\n"
+                f"Запросов в работе: {status['in_flight']}\n"
+                f"Время ответа (EWMA): {status['ewma_ms']} мс\n"
                 f"Последнее обновление: {status['last_update']}\n\n"
             )
+        status_text += http_sessions.format_stats() + "\n\n"
+        status_text += result_cache.format_stats()
+        status_text += "\n\n" + single_flight.format_stats()
+        status_text += "\n\n" + rate_limiter.format_stats()
+        status_text += "\n\n" + (
+            state_sync.format_stats() if shared_state.shared else node_loads_persister.format_stats()
+        )
+        status_text += "\n\n" + loop_lag_monitor.format_stats()
+        status_text += "\n\n" + broadcaster.format_stats()
+        if wave_engine:
+            status_text += "\n\n" + wave_engine.format_stats()
+        status_text += "\n\n" + balancing_scheduler.format_stats()
+        status_text += "\n\n" + rebalance_trigger.format_stats()
         
         await message.answer(status_text)
     except Exception as e:
         logging.error(f"Ошибка при получении статуса узлов: {e}")
         await message.answer("❌ Произошла ошибка при получении статуса узлов")
 
+async def cached_result(provider, key):
+    """Результат из кэша процесса, при промахе - из общего кэша воркеров"""
+    cached = result_cache.get(provider, key)
+    if cached is None and shared_state.shared:
+        entry = await shared_state.cache_get(provider, key)
+        if entry:
+            cached, ttl = entry
+            result_cache.store(provider, key, cached, ttl)
+    return cached
+
+async def _fetch_data_breach(email, key):
+    """Запрос к LeakCheck API (выполняется один раз для одновременных проверок)"""
+    # Ждем свободный токен, пока не занят слот узла
+    await rate_limiter.acquire("leakcheck")
+
+    # Занимаем узел с наименьшим ожидаемым временем ответа на время запроса
+    async with select_node().lease():
+        # Проверка через LeakCheck API
+        session = http_sessions.get("leakcheck")
+        async with session.get(
+            f"{LEAKCHECK_API_URL}/api/v2/search",
+            params={"key": LEAKCHECK_API_KEY, "query": email}
+        ) as response:
+            check_throttled("leakcheck", response)
+            if response.status == 200:
+                data = await response.json()
+                if data.get("success", False):
+                    result = {
+                        'found': data.get("found", False),
+                        'sources': data.get("sources", [])
+                    }
+                    result_cache.set("leakcheck", key, result, negative=not result['found'])
+                    return result
+            raise ProviderError("Ошибка при проверке через LeakCheck API")
+
 async def check_data_breach(email):
     """Проверяет email на наличие в утечках через LeakCheck API"""
+    key = normalize_email(email)
+    cached = await cached_result("leakcheck", key)
+    if cached is not None:
+        return cached
+
     try:
-        # Выбираем узел с наименьшей нагрузкой
-        node = min(NODES, key=lambda node: node.load)
-        
-        # Обновляем нагрузку на узле
-        node.update_load()
-        
-        # Проверка через LeakCheck API
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://leakcheck.io/api/v2/search",
-                params={"key": LEAKCHECK_API_KEY, "query": email}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("success", False):
-                        return {
-                            'found': data.get("found", False),
-                            'sources': data.get("sources", [])
-                        }
-                    else:
-                        return {'error': "Ошибка при проверке через LeakCheck API"}
-                else:
-                    return {'error': "Ошибка при проверке через LeakCheck API"}
+        return await single_flight.do(("leakcheck", key), lambda: _fetch_data_breach(email, key))
+    except RateLimitBusy as e:
+        logging.warning(f"Проверка email отложена: {e}")
+        return {'busy': True, 'retry_after': e.retry_after}
     except Exception as e:
         logging.error(f"Ошибка при проверке утечек: {e}")
         return {'error': str(e)}
 
+async def bulk_check_line(text):
+    """Проверяет одну строку файла и возвращает строку отчета [индикатор, тип, статус, детали]"""
+    data_type = classify_indicator(text)
+    checks = {"email": check_data_breach, "url": check_url_virustotal, "ip": check_ip_reputation}
+    if data_type not in checks:
+        return [text, data_type or "unknown", "skipped", ""]
+
+    # В фоновом задании не отказываем, а ждем освобождения лимита
+    result = await checks[data_type](text)
+    while result.get('busy'):
+        await asyncio.sleep(result['retry_after'])
+        result = await checks[data_type](text)
+
+    # Сбой провайдера - отдельный статус, а не вердикт clean/risky
+    if 'error' in result:
+        return [text, data_type, "error", result['error']]
+    if data_type == "email":
+        status = "found" if result['found'] else "not_found"
+        return [text, data_type, status, "; ".join(map(str, result['sources']))]
+    elif data_type == "url":
+        status = "malicious" if result['malicious'] else "clean"
+        return [text, data_type, status,
+                f"reputation={result['reputation']} positives={result['positive_checks']}/{result['total_checks']}"]
+    else:
+        status = "risky" if result['fraud_score'] > 50 else "clean"
+        return [text, data_type, status,
+                f"fraud_score={result['fraud_score']} proxy={result['is_proxy']} "
+                f"tor={result['is_tor']} bot={result['is_bot']}"]
+
+bulk_checker = BulkChecker(
+    bot,
+    bulk_check_line,
+    jobs_dir=os.getenv("BULK_JOBS_DIR", "bulk_jobs"),
+    concurrency=int(os.getenv("BULK_CONCURRENCY", "5"))
+)
+
+@dp.message(has_document)
+async def handle_document(message: Message):
+    """Массовая проверка: .txt или .csv файл с индикаторами, по одному в строке"""
+    file_name = (message.document.file_name or "").lower()
+    if not file_name.endswith((".txt", ".csv")):
+        await message.answer("❌ Поддерживаются только файлы .txt и .csv")
+        return
+    try:
+        await bulk_checker.start_job(message)
+    except Exception as e:
+        logging.error(f"Ошибка запуска массовой проверки: {e}")
+        await message.answer("❌ Не удалось начать проверку файла. Попробуйте позже.")
+
+def busy_text(result):
+    """Ответ пользователю, когда очередь провайдера заполнена"""
+    return f"⏳ Сервис проверки сейчас занят, повторите через {result['retry_after']} с"
+
+@dp.message.middleware()
+async def handler_metrics(handler, event, data):
+    """Время работы обработчика; для handle_data_input - с типом индикатора"""
+    callback = data.get("button_handler") or data["handler"].callback
+    data_type = "-"
+    if callback is handle_data_input and event.text:
+        data_type = classify_indicator(event.text.strip()) or "unknown"
+    with handler_latency.time(callback.__name__, data_type):
+        return await handler(event, data)
+
 @dp.message()
 async def handle_data_input(message: Message):
     """Обработчик введенных данных"""
     text = message.text.strip()
+    data_type = classify_indicator(text)
     
     # Проверка email
-    if "@" in text:
+    if data_type == "email":
         await message.answer("📧 Проверяется email...")
         result = await check_data_breach(text)
-        if 'error' in result:
+        if result.get('busy'):
+            await message.answer(busy_text(result))
+        elif 'error' in result:
             await message.answer(f"❌ Ошибка при проверке: {result['error']}")
         else:
             if result['found']:
@@ -445,20 +870,24 @@ async def handle_data_input(message: Message):
                 await message.answer("✅ Этот email не найден в утечках")
         
         # Сохраняем историю
-        add_to_history(message.from_user.id, "email", text)
+        await add_to_history(message.from_user.id, "email", text)
     
     # Проверка телефона
-    elif text.isdigit() and len(text) >= 10:
+    elif data_type == "phone":
         await message.answer("📞 Телефон проверяется...")
         # Здесь должна быть реализация проверки телефона
         await message.answer("⚠️ Проверка телефона временно недоступна")
     
     # Проверка URL
-    elif text.startswith("http"):
+    elif data_type == "url":
         await message.answer("🌐 URL проверяется...")
         result = await check_url_virustotal(text)
         
-        if isinstance(result, dict):
+        if isinstance(result, dict) and result.get('busy'):
+            await message.answer(busy_text(result))
+        elif isinstance(result, dict) and 'error' in result:
+            await message.answer(f"❌ Ошибка при проверке URL: {result['error']}")
+        elif isinstance(result, dict):
             if result['malicious']:
                 await message.answer(
                     f"⚠️ URL может быть вредоносным!\n"
@@ -477,14 +906,18 @@ async def handle_data_input(message: Message):
             await message.answer("❌ Ошибка при проверке URL")
         
         # Сохраняем историю
-        add_to_history(message.from_user.id, "url", text)
+        await add_to_history(message.from_user.id, "url", text)
     
     # Проверка IP
-    elif text.count(".") == 3 and all(part.isdigit() for part in text.split(".")):               
+    elif data_type == "ip":
         await message.answer("📍 IP проверяется...")
         result = await check_ip_reputation(text)
         
-        if isinstance(result, dict):
+        if isinstance(result, dict) and result.get('busy'):
+            await message.answer(busy_text(result))
+        elif isinstance(result, dict) and 'error' in result:
+            await message.answer(f"❌ Ошибка при проверке IP-адреса: {result['error']}")
+        elif isinstance(result, dict):
             if result['fraud_score'] > 50:
                 await message.answer(
                     f"⚠️ IP-адрес может быть подозрительным!\n"
@@ -505,120 +938,208 @@ async def handle_data_input(message: Message):
             await message.answer("❌ Ошибка при проверке IP-адреса")
         
         # Сохраняем историю
-        add_to_history(message.from_user.id, "ip", text)
+        await add_to_history(message.from_user.id, "ip", text)
     
     else:
         await message.answer("❌ Пожалуйста, введите корректные данные для проверки.")
 
+async def _fetch_url_virustotal(url, key):
+    """Запрос к VirusTotal API (выполняется один раз для одновременных проверок)"""
+    # Ждем свободный токен, пока не занят слот узла
+    await rate_limiter.acquire("virustotal")
+
+    # Занимаем узел с наименьшим ожидаемым временем ответа на время запроса
+    async with select_node().lease():
+        # Проверка через VirusTotal API
+        session = http_sessions.get("virustotal")
+        async with session.get(
+            f"{VIRUSTOTAL_API_URL}/api/v3/urls/{url}",
+            headers={"x-apikey": VIRUSTOTAL_API_KEY}
+        ) as response:
+            check_throttled("virustotal", response)
+            if response.status == 200:
+                data = await response.json()
+                stats = data.get("data", {}).get("attributes", {}).get("last_analysis_stats", {})
+                total = sum(stats.values())
+                malicious = stats.get("malicious", 0)
+                suspicious = stats.get("suspicious", 0)
+
+                result = {
+                    'malicious': malicious > 0,
+                    'reputation': int((1 - (malicious + suspicious) / total) * 100) if total > 0 else 100,
+                    'total_checks': total,
+                    'positive_checks': malicious + suspicious
+                }
+                result_cache.set("virustotal", key, result)
+                return result
+            elif response.status == 404:
+                # URL неизвестен VirusTotal - кэшируем как отрицательный результат
+                result = {
+                    'malicious': False,
+                    'reputation': 0,
+                    'total_checks': 0,
+                    'positive_checks': 0
+                }
+                result_cache.set("virustotal", key, result, negative=True)
+                return result
+            else:
+                raise ProviderError(f"VirusTotal API вернул статус {response.status}")
+
 async def check_url_virustotal(url):
     """Проверка URL через VirusTotal API"""
+    url = with_scheme(url)  # Имя хоста без схемы проверяем как http://
+    key = canonical_url(url)
+    cached = await cached_result("virustotal", key)
+    if cached is not None:
+        return cached
+
     try:
-        # Выбираем узел с наименьшей нагрузкой
-        node = min(NODES, key=lambda node: node.load)
-        
-        # Обновляем нагрузку на узле
-        node.update_load()
-        
-        # Проверка через VirusTotal API
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://www.virustotal.com/api/v3/urls/{url}",
-                headers={"x-apikey": VIRUSTOTAL_API_KEY}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    stats = data.get("data", {}).get("attributes", {}).get("last_analysis_stats", {})
-                    total = sum(stats.values())
-                    malicious = stats.get("malicious", 0)
-                    suspicious = stats.get("suspicious", 0)
-                    
-                    return {
-                        'malicious': malicious > 0,
-                        'reputation': int((1 - (malicious + suspicious) / total) * 100) if total > 0 else 100,
-                        'total_checks': total,
-                        'positive_checks': malicious + suspicious
-                    }
-                else:
-                    return {
-                        'malicious': False,
-                        'reputation': 0,
-                        'total_checks': 0,
-                        'positive_checks': 0
-                    }
+        return await single_flight.do(("virustotal", key), lambda: _fetch_url_virustotal(url, key))
+    except RateLimitBusy as e:
+        logging.warning(f"Проверка URL отложена: {e}")
+        return {'busy': True, 'retry_after': e.retry_after}
     except Exception as e:
         logging.error(f"Ошибка при проверке URL: {e}")
-        return {
-            'malicious': False,
-            'reputation': 0,
-            'total_checks': 0,
-            'positive_checks': 0
-        }
+        return {'error': str(e)}
+
+async def _fetch_ip_reputation(ip_address, key):
+    """Запрос к IPQS API (выполняется один раз для одновременных проверок)"""
+    # Ждем свободный токен, пока не занят слот узла
+    await rate_limiter.acquire("ipqs")
+
+    # Занимаем узел с наименьшим ожидаемым временем ответа на время запроса
+    async with select_node().lease():
+        # Проверка через IPQS API
+        session = http_sessions.get("ipqs")
+        async with session.get(
+            f"{IPQS_API_URL}/ip-api/json/{ip_address}",
+            params={"key": IPQS_API_KEY}
+        ) as response:
+            check_throttled("ipqs", response)
+            if response.status != 200:
+                raise ProviderError(f"IPQS API вернул статус {response.status}")
+
+            data = await response.json()
+            if not data.get("success", False):
+                raise ProviderError("IPQS API вернул неуспешный ответ")
+
+            result = {
+                'fraud_score': data.get("fraud_score", 0),
+                'is_proxy': data.get("proxy", False),
+                'is_tor': data.get("tor", False),
+                'is_bot': data.get("bot", False)
+            }
+            result_cache.set("ipqs", key, result)
+            return result
 
 async def check_ip_reputation(ip_address):
     """Проверка репутации IP-адреса через IPQS API"""
+    key = pack_ip(ip_address)
+    cached = await cached_result("ipqs", key)
+    if cached is not None:
+        return cached
+
     try:
-        # Выбираем узел с наименьшей нагрузкой
-        node = min(NODES, key=lambda node: node.load)
-        
-        # Обновляем нагрузку на узле
-        node.update_load()
-        
-        # Проверка через IPQS API
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://ipqs.io/ip-api/json/{ip_address}",
-                params={"key": IPQS_API_KEY}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("success", False):
-                        return {
-                            'fraud_score': data.get("fraud_score", 0),
-                            'is_proxy': data.get("proxy", False),
-                            'is_tor': data.get("tor", False),
-                            'is_bot': data.get("bot", False)
-                        }
-                    else:
-                        return {
-                            'fraud_score': 100,
-                            'is_proxy': True,
-                            'is_tor': True,
-                            'is_bot': True
-                        }
-                else:
-                    return {
-                        'fraud_score': 100,
-                        'is_proxy': True,
-                        'is_tor': True,
-                        'is_bot': True
-                    }
+        return await single_flight.do(("ipqs", key), lambda: _fetch_ip_reputation(ip_address, key))
+    except RateLimitBusy as e:
+        logging.warning(f"Проверка IP отложена: {e}")
+        return {'busy': True, 'retry_after': e.retry_after}
     except Exception as e:
         logging.error(f"Ошибка при проверке IP: {e}")
-        return {
-            'fraud_score': 100,
-            'is_proxy': True,
-            'is_tor': True,
-            'is_bot': True
-        }
+        return {'error': str(e)}
 
-        # Уменьшаем нагрузку после выполнения запроса
-        node.decrease_load()
-        save_node_loads()
+async def start_services():
+    """Запуск фоновых служб (единственный процесс или воркер)"""
+    # Инициализируем сеть
+    await initialize_network()
+    
+    # Открываем общие HTTP-сессии к внешним API
+    await http_sessions.start()
+    
+    # Сервер метрик (если задан METRICS_PORT)
+    await metrics_server.start()
+    
+    # Нагрузка узлов: сверка с общим хранилищем воркеров или фоновая запись node_loads.json
+    if shared_state.shared:
+        loads = await shared_state.seed_loads({node.node_id: (node.load, node.max_load) for node in NODES})
+        apply_shared_loads(loads, {})
+        state_sync.start()
+    else:
+        node_loads_persister.start()
+    
+    # Замер задержки цикла событий
+    loop_lag_monitor.start()
+    
+    if BALANCING_OWNER:
+        # Затухание модельной нагрузки и периодическая балансировка в отдельных тасках
+        asyncio.create_task(node_load_decay())
+        asyncio.create_task(periodic_balancing())
         
-        return result_text
-    except Exception as e:
-        logging.error(f"Ошибка при проверке IP-адреса: {e}")
-        return "❌ Ошибка при проверке IP-адреса"
+        # Возобновляем прерванные массовые проверки и рассылки
+        await bulk_checker.resume_jobs()
+        await broadcaster.resume()
+
+async def stop_services():
+    await metrics_server.stop()
+    await http_sessions.close()
+    if shared_state.shared:
+        await state_sync.stop()
+    else:
+        await node_loads_persister.stop()
+    await shared_state.close()
+    await loop_lag_monitor.stop()
+    await storage.close()
+
+async def receive_updates():
+    """Получение обновлений от Telegram: webhook или long polling"""
+    if webhook_server:
+        await webhook_server.run()
+    else:
+        await dp.start_polling(bot)
+
+async def run_receiver():
+    """Приемник многопроцессного режима: обновления уходят воркерам, обработчики здесь не выполняются"""
+    await storage.import_json(SUBSCRIBERS_FILE, HISTORY_FILE)
+    pool = WorkerPool(os.path.abspath(__file__), WORKERS)
+    await pool.start()
+    dp.update.outer_middleware(pool)
+    try:
+        await receive_updates()
+    finally:
+        # Воркеры дообрабатывают уже переданные обновления и сохраняют состояние
+        await pool.stop()
+        logging.info(pool.format_stats())
+        await shared_state.close()
+        await storage.close()
+
+async def run_worker():
+    """Воркер многопроцессного режима: обработчики для своей доли пользователей"""
+    # Ctrl+C получает вся группа процессов; воркер завершается по команде shutdown от приемника
+    asyncio.get_running_loop().add_signal_handler(signal.SIGINT, lambda: None)
+    await start_services()
+    try:
+        await WorkerServer(dp, bot, WORKER_SOCKET, WORKER_MAX_CONCURRENCY).serve()
+    finally:
+        await stop_services()
+        await bot.session.close()
 
 async def main():
-    # Инициализируем сеть
-    await initialize_network()
+    if WORKER_INDEX is not None:
+        await run_worker()
+        return
+    if WORKERS > 1:
+        await run_receiver()
+        return
     
-    # Запускаем периодическую балансировку в отдельном таске
-    asyncio.create_task(periodic_balancing())
+    # Однократно переносим подписчиков и историю из JSON в SQLite
+    await storage.import_json(SUBSCRIBERS_FILE, HISTORY_FILE)
+    await start_services()
     
     # Запускаем бота
-    await dp.start_polling(bot)
+    try:
+        await receive_updates()
+    finally:
+        await stop_services()
 
 if __name__ == "__main__":
     asyncio.run(main())
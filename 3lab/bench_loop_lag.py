@@ -0,0 +1,105 @@
+"""Сравнение задержки цикла событий: синхронная запись JSON против асинхронного хранилища.
+
+Запуск: python bench_loop_lag.py --users 20000 --messages 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import sys
+
+from monitoring import LoopLagMonitor
+from storage import AsyncStorage
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from common.persistence import WriteBehindPersister
+
+
+def make_history(users):
+    return {
+        str(user_id): {"email": [f"user{user_id}@example.com"], "ip": [], "phone": []}
+        for user_id in range(users)
+    }
+
+
+async def run_sync_json(workdir, users, messages, concurrency):
+    """Старый вариант: полная перезапись history.json и node_loads.json в обработчике"""
+    history_file = os.path.join(workdir, "history.json")
+    node_loads_file = os.path.join(workdir, "node_loads.json")
+    with open(history_file, "w") as file:
+        json.dump(make_history(users), file, indent=4)
+
+    async def handler(i):
+        with open(history_file, "r") as file:
+            history = json.load(file)
+        history.setdefault(str(i), {"email": [], "ip": [], "phone": []})["email"].append(f"new{i}@example.com")
+        with open(history_file, "w") as file:
+            json.dump(history, file, indent=4)
+        with open(node_loads_file, "w") as file:
+            json.dump({str(n): {"load": i % 100} for n in range(3)}, file, indent=4)
+        await asyncio.sleep(0)
+
+    await run_handlers(handler, messages, concurrency)
+
+
+async def run_async_storage(workdir, users, messages, concurrency):
+    """Новый вариант: SQLite в отдельном потоке и отложенная запись node_loads.json"""
+    storage = AsyncStorage(os.path.join(workdir, "bot.db"))
+    history_file = os.path.join(workdir, "history.json")
+    with open(history_file, "w") as file:
+        json.dump(make_history(users), file)
+    await storage.import_json(os.path.join(workdir, "subscribers.json"), history_file)
+
+    loads = {str(n): {"load": 0} for n in range(3)}
+    persister = WriteBehindPersister(os.path.join(workdir, "node_loads.json"), lambda: loads, interval=0.05)
+    persister.start()
+
+    async def handler(i):
+        await storage.add_history(i, "email", f"new{i}@example.com")
+        loads["0"]["load"] = i % 100
+        persister.mark_dirty()
+
+    await run_handlers(handler, messages, concurrency)
+    await persister.stop()
+    await storage.close()
+
+
+async def run_handlers(handler, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            await handler(i)
+
+    await asyncio.gather(*(limited(i) for i in range(messages)))
+
+
+async def measure(name, scenario, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        monitor = LoopLagMonitor(interval=0.005, window=100000)
+        monitor.start()
+        started = time.perf_counter()
+        await scenario(workdir, args.users, args.messages, args.concurrency)
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+    stats = monitor.get_stats()
+    print(
+        f"{name:<16} {args.messages / elapsed:>10.1f} сообщ/с   "
+        f"lag ср. {stats['avg_ms']:>7.2f} мс   p99 {stats['p99_ms']:>8.2f} мс   макс. {stats['max_ms']:>8.2f} мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000, help="Пользователей в истории")
+    parser.add_argument("--messages", type=int, default=300, help="Обработанных сообщений")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременных обработчиков")
+    args = parser.parse_args()
+
+    await measure("sync json", run_sync_json, args)
+    await measure("async storage", run_async_storage, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Пропускная способность волнового обхода: прежняя реализация против WaveEngine.
+
+Прежняя реализация - объекты узлов со списками соседей, сброс visited/distance
+у всех узлов перед волной и очередь на list.pop(0). Ее запускаем только на
+графах до --legacy-max узлов: pop(0) делает обход квадратичным.
+
+Запуск: python bench_wave.py --sizes 10000 100000 1000000 --waves 5
+"""
+import argparse
+import random
+import time
+
+from wave import WaveEngine, grid_edges, random_edges
+
+
+class LegacyNode:
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.neighbors = []
+        self.visited = False
+        self.distance = float('inf')
+
+
+def legacy_wave(nodes, source_node):
+    """Копия прежнего finn_wave_algorithm без логирования и изменения нагрузки"""
+    for node in nodes:
+        node.visited = False
+        node.distance = float('inf')
+    source_node.visited = True
+    source_node.distance = 0
+    queue = [source_node]
+    visited = 0
+    while queue:
+        current_node = queue.pop(0)
+        visited += 1
+        for neighbor in current_node.neighbors:
+            if not neighbor.visited:
+                neighbor.visited = True
+                neighbor.distance = current_node.distance + 1
+                queue.append(neighbor)
+    return visited
+
+
+def build_legacy(size, edges):
+    nodes = [LegacyNode(i) for i in range(size)]
+    for a, b in edges:
+        nodes[a].neighbors.append(nodes[b])
+        nodes[b].neighbors.append(nodes[a])
+    return nodes
+
+
+def measure(run, sources):
+    started = time.perf_counter()
+    for source in sources:
+        run(source)
+    return len(sources) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--graph", choices=("random", "grid"), default="random")
+    parser.add_argument("--degree", type=int, default=4, help="Средняя степень случайного графа")
+    parser.add_argument("--waves", type=int, default=5, help="Волн на каждый размер")
+    parser.add_argument("--legacy-max", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'узлов':>9} {'ребер':>9} {'построение, с':>14} {'прежний, волн/с':>16} {'WaveEngine, волн/с':>19}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        if args.graph == "grid":
+            side = int(size ** 0.5)
+            size = side * side
+            edges = grid_edges(side)
+        else:
+            edges = random_edges(size, args.degree, rng)
+        sources = [rng.randrange(size) for _ in range(args.waves)]
+
+        started = time.perf_counter()
+        engine = WaveEngine.from_edges(size, edges)
+        build_time = time.perf_counter() - started
+        engine_rate = measure(engine.run, sources)
+
+        legacy_rate = "-"
+        if size <= args.legacy_max:
+            nodes = build_legacy(size, edges)
+            legacy_rate = f"{measure(lambda source: legacy_wave(nodes, nodes[source]), sources):.2f}"
+
+        print(f"{size:>9} {len(edges):>9} {build_time:>14.2f} {legacy_rate:>16} {engine_rate:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
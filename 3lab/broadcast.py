@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from ratelimit import TokenBucket
+
+
+class ChatRateLimiter:
+    """Ограничивает частоту сообщений в один чат"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.next_allowed = {}  # chat_id -> время, когда можно отправить следующее сообщение
+
+    async def wait(self, chat_id):
+        now = time.monotonic()
+        next_allowed = self.next_allowed.get(chat_id, now)
+        self.next_allowed[chat_id] = max(now, next_allowed) + self.interval
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+        # Периодически забываем чаты, для которых ограничение уже истекло
+        if len(self.next_allowed) > 10000:
+            self.next_allowed = {
+                chat: moment for chat, moment in self.next_allowed.items() if moment > now
+            }
+
+
+class Broadcaster:
+    """Рассылка уведомлений подписчикам с ограничением частоты и курсором для возобновления"""
+
+    def __init__(self, bot, storage, rate=25.0, per_chat_interval=1.0, concurrency=20,
+                 page_size=100, max_retries=3):
+        self.bot = bot
+        self.storage = storage
+        # Общий лимит Telegram - около 30 сообщений в секунду
+        self.global_bucket = TokenBucket(
+            "telegram", rate=rate, capacity=max(1, int(rate)),
+            max_queue=float("inf"), max_wait=float("inf")
+        )
+        self.chat_limiter = ChatRateLimiter(per_chat_interval)
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.tasks = {}  # id рассылки -> задача
+        self.progress = {}  # id рассылки -> счетчики
+
+    async def start(self, text):
+        """Создает рассылку и запускает ее в фоне"""
+        broadcast_id = await self.storage.create_broadcast(text)
+        self._spawn(broadcast_id, text, 0, {'sent': 0, 'failed': 0, 'removed': 0})
+        return broadcast_id
+
+    async def resume(self):
+        """Продолжает рассылки, прерванные перезапуском бота"""
+        for broadcast_id, text, cursor, sent, failed, removed in await self.storage.get_active_broadcasts():
+            logging.info(f"Возобновление рассылки {broadcast_id} после пользователя {cursor}")
+            self._spawn(broadcast_id, text, cursor, {'sent': sent, 'failed': failed, 'removed': removed})
+
+    def _spawn(self, broadcast_id, text, cursor, counters):
+        self.progress[broadcast_id] = counters
+        task = asyncio.create_task(self.run(broadcast_id, text, cursor))
+        self.tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(broadcast_id, None))
+
+    async def run(self, broadcast_id, text, cursor):
+        """Проходит подписчиков страницами по возрастанию user_id"""
+        counters = self.progress[broadcast_id]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            while True:
+                page = await self.storage.get_broadcast_page(broadcast_id, cursor, self.page_size)
+                if not page:
+                    break
+
+                results = await asyncio.gather(*(
+                    self._deliver(semaphore, broadcast_id, chat_id, text) for chat_id in page
+                ))
+                for result in results:
+                    counters[result] += 1
+
+                cursor = page[-1]
+                await self.storage.advance_broadcast(
+                    broadcast_id, cursor, counters['sent'], counters['failed'], counters['removed']
+                )
+
+            await self.storage.finish_broadcast(broadcast_id)
+            logging.info(
+                f"Рассылка {broadcast_id} завершена: отправлено {counters['sent']}, "
+                f"ошибок {counters['failed']}, удалено заблокировавших {counters['removed']}"
+            )
+        except asyncio.CancelledError:
+            logging.info(f"Рассылка {broadcast_id} прервана на пользователе {cursor}")
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка рассылки {broadcast_id}: {e}")
+        finally:
+            self.progress.pop(broadcast_id, None)
+
+    async def _deliver(self, semaphore, broadcast_id, chat_id, text):
+        """Отправляет одно сообщение; возвращает 'sent', 'failed' или 'removed'"""
+        async with semaphore:
+            for _ in range(self.max_retries + 1):
+                await self.chat_limiter.wait(chat_id)
+                await self.global_bucket.acquire()
+                try:
+                    await self.bot.send_message(chat_id, text)
+                    await self.storage.mark_delivered(broadcast_id, chat_id)
+                    return 'sent'
+                except TelegramRetryAfter as e:
+                    # Telegram просит подождать - приостанавливаем всю рассылку
+                    logging.warning(f"Flood control при рассылке, пауза {e.retry_after} с")
+                    self.global_bucket.pause(e.retry_after)
+                except TelegramForbiddenError:
+                    await self.storage.remove_subscriber(chat_id)
+                    return 'removed'
+                except TelegramBadRequest as e:
+                    if "chat not found" in str(e).lower():
+                        await self.storage.remove_subscriber(chat_id)
+                        return 'removed'
+                    logging.error(f"Ошибка отправки пользователю {chat_id}: {e}")
+                    return 'failed'
+                except Exception as e:
+                    logging.error(f"Ошибка отправки пользователю {chat_id}: {e}")
+                    return 'failed'
+            return 'failed'
+
+    def format_stats(self):
+        """Состояние активных рассылок для /node_status"""
+        if not self.progress:
+            return "📢 Активных рассылок нет"
+        lines = [
+            f"#{broadcast_id}: отправлено {counters['sent']}, ошибок {counters['failed']}, "
+            f"удалено {counters['removed']}"
+            for broadcast_id, counters in self.progress.items()
+        ]
+        return "📢 Рассылки:\n" + "\n".join(lines)
@@ -0,0 +1,203 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+import uuid
+
+from aiogram.types import FSInputFile
+
+REPORT_HEADER = ["line", "indicator", "type", "status", "details"]
+
+
+class BulkChecker:
+    """Массовая проверка индикаторов из файла с контрольными точками"""
+
+    def __init__(self, bot, check_line, jobs_dir="bulk_jobs", concurrency=5, batch_size=50,
+                 progress_interval=3.0):
+        self.bot = bot
+        self.check_line = check_line  # async (строка) -> [индикатор, тип, статус, детали]
+        self.jobs_dir = jobs_dir
+        self.concurrency = concurrency
+        self.batch_size = batch_size  # Строк между контрольными точками
+        self.progress_interval = progress_interval  # Секунд между обновлениями прогресса
+        self.tasks = {}  # job_id -> задача
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write_job(self, job):
+        """Атомарно сохраняет контрольную точку задания"""
+        path = self._job_path(job["job_id"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(job, file)
+        os.replace(tmp_path, path)
+
+    async def _save_job(self, job):
+        # Файловые операции выполняются в отдельном потоке, чтобы не блокировать бота
+        await asyncio.to_thread(self._write_job, dict(job))
+
+    async def start_job(self, message):
+        """Скачивает документ из сообщения и запускает проверку"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        input_path = os.path.join(self.jobs_dir, f"{job_id}.input")
+        await self.bot.download(message.document, destination=input_path)
+
+        progress = await message.answer("📄 Файл получен, начинаю проверку...")
+        job = {
+            "job_id": job_id,
+            "chat_id": message.chat.id,
+            "progress_message_id": progress.message_id,
+            "filename": message.document.file_name or "indicators.txt",
+            "input": input_path,
+            "output": os.path.join(self.jobs_dir, f"{job_id}.csv"),
+            "total_bytes": os.path.getsize(input_path),
+            "offset": 0,  # Байтовая позиция первой необработанной строки
+            "report_offset": 0,  # Размер отчета на момент контрольной точки
+            "line_no": 0,
+            "checked": 0
+        }
+        job["report_offset"] = await asyncio.to_thread(self._create_report, job["output"])
+        await self._save_job(job)
+        self._spawn(job)
+        return job_id
+
+    @staticmethod
+    def _create_report(path):
+        """Создает отчет с заголовком и возвращает его размер"""
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            csv.writer(file).writerow(REPORT_HEADER)
+        return os.path.getsize(path)
+
+    def _read_jobs(self):
+        jobs = []
+        if not os.path.isdir(self.jobs_dir):
+            return jobs
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r") as file:
+                    jobs.append(json.load(file))
+            except (json.JSONDecodeError, OSError) as e:
+                logging.error(f"Не удалось прочитать задание {name}: {e}")
+        return jobs
+
+    async def resume_jobs(self):
+        """Возобновляет незавершенные задания после перезапуска"""
+        for job in await asyncio.to_thread(self._read_jobs):
+            logging.info(f"Возобновление массовой проверки {job['job_id']} со строки {job['line_no']}")
+            self._spawn(job)
+
+    def _spawn(self, job):
+        task = asyncio.create_task(self.run_job(job))
+        self.tasks[job["job_id"]] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job["job_id"], None))
+
+    @staticmethod
+    def _parse_line(raw, is_csv):
+        """Извлекает индикатор из строки файла (для CSV - первая непустая ячейка)"""
+        text = raw.decode("utf-8", errors="replace").strip()
+        if is_csv and text:
+            cells = next(csv.reader(io.StringIO(text)), [])
+            text = next((cell.strip() for cell in cells if cell.strip()), "")
+        return text
+
+    def _read_batch(self, source, is_csv):
+        """Читает до batch_size строк: возвращает [(номер, индикатор)] и число прочитанных строк"""
+        batch = []
+        read = 0
+        for _ in range(self.batch_size):
+            raw = source.readline()
+            if not raw:
+                break
+            read += 1
+            text = self._parse_line(raw, is_csv)
+            if text:
+                batch.append((read, text))
+        return batch, read
+
+    @staticmethod
+    def _write_rows(report, writer, rows):
+        """Дописывает строки в отчет и возвращает его размер"""
+        writer.writerows(rows)
+        report.flush()
+        return report.tell()
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            os.remove(path)
+
+    async def _check(self, semaphore, line_no, text):
+        async with semaphore:
+            try:
+                return [line_no] + await self.check_line(text)
+            except Exception as e:
+                logging.error(f"Ошибка массовой проверки строки {line_no}: {e}")
+                return [line_no, text, "", "error", str(e)]
+
+    async def _report_progress(self, job, final=False):
+        percent = job["offset"] * 100 // job["total_bytes"] if job["total_bytes"] else 100
+        text = (
+            f"{'✅ Проверка завершена' if final else '🔄 Идет проверка'}: {job['filename']}\n"
+            f"Строк обработано: {job['line_no']} ({percent}%)\n"
+            f"Индикаторов проверено: {job['checked']}"
+        )
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=job["chat_id"], message_id=job["progress_message_id"]
+            )
+        except Exception as e:
+            logging.warning(f"Не удалось обновить прогресс задания {job['job_id']}: {e}")
+
+    async def run_job(self, job):
+        """Читает файл пакетами, проверяет строки и дописывает отчет"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        is_csv = job["filename"].lower().endswith(".csv")
+        last_progress = 0.0
+        try:
+            # Отбрасываем строки отчета, записанные после последней контрольной точки
+            await asyncio.to_thread(os.truncate, job["output"], job["report_offset"])
+            with open(job["input"], "rb") as source, \
+                    open(job["output"], "a", newline="", encoding="utf-8") as report:
+                source.seek(job["offset"])
+                writer = csv.writer(report)
+                while True:
+                    # Читаем не больше batch_size строк - память не зависит от размера файла
+                    batch, read = await asyncio.to_thread(self._read_batch, source, is_csv)
+                    if not read:
+                        break
+
+                    rows = await asyncio.gather(*(
+                        self._check(semaphore, job["line_no"] + number, text) for number, text in batch
+                    ))
+                    job["report_offset"] = await asyncio.to_thread(self._write_rows, report, writer, rows)
+                    job["offset"] = source.tell()
+                    job["line_no"] += read
+                    job["checked"] += len(rows)
+                    await self._save_job(job)
+
+                    if time.monotonic() - last_progress >= self.progress_interval:
+                        last_progress = time.monotonic()
+                        await self._report_progress(job)
+
+            await self._report_progress(job, final=True)
+            await self.bot.send_document(
+                job["chat_id"],
+                FSInputFile(job["output"], filename=f"report_{os.path.splitext(job['filename'])[0]}.csv"),
+                caption="📊 Отчет массовой проверки"
+            )
+            await asyncio.to_thread(
+                self._remove_files, (job["input"], job["output"], self._job_path(job["job_id"]))
+            )
+            logging.info(f"Массовая проверка {job['job_id']} завершена: {job['checked']} индикаторов")
+        except asyncio.CancelledError:
+            logging.info(f"Массовая проверка {job['job_id']} прервана на строке {job['line_no']}")
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка массовой проверки {job['job_id']}: {e}")
@@ -0,0 +1,133 @@
+import ipaddress
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+
+def normalize_email(email):
+    """Email в нижнем регистре без пробелов по краям"""
+    return email.strip().lower()
+
+
+def canonical_url(url):
+    """Каноническая форма URL: схема и хост в нижнем регистре, без порта по умолчанию и фрагмента"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    return urlunsplit((scheme, host, path, parts.query, ""))
+
+
+def pack_ip(ip_address):
+    """Упакованное (байтовое) представление IP-адреса; некорректный адрес возвращается как строка"""
+    try:
+        return ipaddress.ip_address(ip_address.strip()).packed
+    except ValueError:
+        return ip_address.strip()
+
+
+class ResultCache:
+    """LRU-кэш результатов проверок с TTL для каждого провайдера"""
+
+    def __init__(self, ttls, negative_ttls=None, max_entries=10000, max_bytes=16 * 1024 * 1024,
+                 clock=time.monotonic, on_set=None):
+        self.ttls = ttls  # TTL положительных результатов по провайдерам, секунды
+        self.negative_ttls = negative_ttls or {}  # TTL результатов "не найдено"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.on_set = on_set  # Вызывается с (провайдер, ключ, результат, TTL) для новых результатов
+        self.entries = OrderedDict()  # (провайдер, ключ) -> (истекает, размер, результат)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _size(key, value):
+        """Приблизительный размер записи в байтах"""
+        key_size = len(key) if isinstance(key, (bytes, str)) else len(repr(key))
+        return key_size + len(json.dumps(value, ensure_ascii=False).encode())
+
+    def _remove(self, cache_key):
+        _, size, _ = self.entries.pop(cache_key)
+        self.bytes -= size
+
+    def get(self, provider, key):
+        """Возвращает результат из кэша или None"""
+        cache_key = (provider, key)
+        entry = self.entries.get(cache_key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, _, value = entry
+        if expires_at <= self.clock():
+            self._remove(cache_key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(cache_key)
+        self.hits += 1
+        return value
+
+    def set(self, provider, key, value, negative=False):
+        """Сохраняет результат; negative=True для результатов "не найдено" """
+        ttl = self.negative_ttls.get(provider, 0) if negative else self.ttls.get(provider, 0)
+        if ttl <= 0:
+            return
+        if self.on_set:
+            self.on_set(provider, key, value, ttl)
+        self.store(provider, key, value, ttl)
+
+    def store(self, provider, key, value, ttl):
+        """Сохраняет результат с заданным TTL (например, полученный из общего кэша воркеров)"""
+        cache_key = (provider, key)
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+
+        if cache_key in self.entries:
+            self._remove(cache_key)
+        self.entries[cache_key] = (self.clock() + ttl, size, value)
+        self.bytes += size
+
+        # Вытесняем самые давно использованные записи
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        """Очищает кэш"""
+        self.entries.clear()
+        self.bytes = 0
+
+    def get_stats(self):
+        """Счетчики кэша"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+    def format_stats(self):
+        """Статистика кэша для /node_status"""
+        stats = self.get_stats()
+        return (
+            "🗄 Кэш проверок:\n"
+            f"Записей: {stats['entries']} ({stats['bytes']} байт)\n"
+            f"Попаданий: {stats['hits']}, промахов: {stats['misses']} ({stats['hit_rate']}%)\n"
+            f"Вытеснено: {stats['evictions']}, устарело: {stats['expirations']}"
+        )
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from collections import deque
+
+
+class LoopLagMonitor:
+    """Измеряет задержку цикла событий: насколько позже запланированного просыпается таймер"""
+
+    def __init__(self, interval=0.1, window=600):
+        self.interval = interval
+        self.samples = deque(maxlen=window)  # Последние замеры, секунды
+        self.max_lag = 0.0
+        self._task = None
+
+    async def run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self):
+        """Средняя, p99 и максимальная задержка в миллисекундах"""
+        samples = sorted(self.samples)
+        if not samples:
+            return {'avg_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return {
+            'avg_ms': sum(samples) / len(samples) * 1000,
+            'p99_ms': p99 * 1000,
+            'max_ms': self.max_lag * 1000
+        }
+
+    def format_stats(self):
+        stats = self.get_stats()
+        return (
+            "⏱ Задержка цикла событий:\n"
+            f"ср. {stats['avg_ms']:.1f} мс, p99 {stats['p99_ms']:.1f} мс, макс. {stats['max_ms']:.1f} мс"
+        )
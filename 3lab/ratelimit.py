@@ -0,0 +1,142 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+
+class RateLimitBusy(Exception):
+    """Очередь провайдера заполнена или ожидание превысит допустимое"""
+
+    def __init__(self, provider, retry_after):
+        self.provider = provider
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{provider}: лимит запросов, повторите через {self.retry_after} с")
+
+
+class TokenBucket:
+    """Token bucket с очередью ожидания (FIFO) для одного провайдера"""
+
+    def __init__(self, name, rate, capacity, max_queue=100, max_wait=30.0, clock=time.monotonic):
+        self.name = name
+        self.rate = rate  # Токенов в секунду
+        self.capacity = capacity  # Максимальный размер всплеска
+        self.max_queue = max_queue
+        self.max_wait = max_wait  # Максимальное ожидание в очереди, секунды
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.paused_until = 0.0  # Пауза после ответа 429
+        self.lock = asyncio.Lock()  # asyncio.Lock пропускает ожидающих по порядку
+        self.waiting = 0
+
+        # Метрики
+        self.acquired = 0
+        self.rejected = 0
+        self.throttled = 0  # Ответов 429 от провайдера
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.recent_waits = deque(maxlen=1000)
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def _eta(self, position):
+        """Оценка ожидания для запроса на позиции position в очереди"""
+        now = self._refill()
+        pause = max(0.0, self.paused_until - now)
+        return pause + max(0.0, position - self.tokens) / self.rate
+
+    def _record_wait(self, waited):
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.recent_waits.append(waited)
+
+    async def acquire(self):
+        """Ждет свободный токен; при переполнении очереди бросает RateLimitBusy"""
+        now = self._refill()
+        if self.waiting == 0 and self.tokens >= 1 and now >= self.paused_until:
+            self.tokens -= 1
+            self._record_wait(0.0)
+            return
+
+        eta = self._eta(self.waiting + 1)
+        if self.waiting >= self.max_queue or eta > self.max_wait:
+            self.rejected += 1
+            raise RateLimitBusy(self.name, eta)
+
+        self.waiting += 1
+        self.max_depth = max(self.max_depth, self.waiting)
+        started = self.clock()
+        try:
+            async with self.lock:
+                while True:
+                    now = self._refill()
+                    if now < self.paused_until:
+                        await asyncio.sleep(self.paused_until - now)
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    else:
+                        await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+        self._record_wait(self.clock() - started)
+
+    def pause(self, seconds):
+        """Приостанавливает выдачу токенов (провайдер ответил 429)"""
+        self._refill()
+        self.throttled += 1
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def get_stats(self):
+        waits = sorted(self.recent_waits)
+        p95 = waits[int(len(waits) * 0.95) - 1] if waits else 0.0
+        return {
+            'queue_depth': self.waiting,
+            'max_queue_depth': self.max_depth,
+            'acquired': self.acquired,
+            'rejected': self.rejected,
+            'throttled': self.throttled,
+            'avg_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+            'p95_wait': p95,
+            'max_wait': self.max_wait_seen
+        }
+
+
+class RateLimiter:
+    """Набор token bucket'ов по провайдерам"""
+
+    def __init__(self, buckets):
+        self.buckets = {bucket.name: bucket for bucket in buckets}
+
+    async def acquire(self, provider):
+        await self.buckets[provider].acquire()
+
+    def pause(self, provider, seconds):
+        self.buckets[provider].pause(seconds)
+
+    def format_stats(self):
+        """Статистика очередей для /node_status"""
+        lines = []
+        for name, bucket in self.buckets.items():
+            stats = bucket.get_stats()
+            lines.append(
+                f"{name}: в очереди {stats['queue_depth']} (макс. {stats['max_queue_depth']}), "
+                f"ожидание ср. {stats['avg_wait']:.2f} с / p95 {stats['p95_wait']:.2f} с / "
+                f"макс. {stats['max_wait']:.2f} с, отказов {stats['rejected']}, 429: {stats['throttled']}"
+            )
+        return "⏳ Лимиты запросов:\n" + "\n".join(lines)
+
+
+def parse_retry_after(value, default=60.0):
+    """Разбирает заголовок Retry-After (в секундах)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,218 @@
+"""Состояние, общее для воркеров бота: нагрузка узлов и кэш результатов проверок.
+
+Бэкенды (выбираются STATE_BACKEND):
+    local  - один процесс бота, общее хранилище не нужно (прежнее поведение);
+    sqlite - файл SQLite в режиме WAL, который открывают все воркеры.
+
+Горячий путь бэкенд не трогает. Изменения нагрузки узлов копятся в процессе
+как приращения и раз в interval секунд одной транзакцией прибавляются к общим
+значениям (с ограничением 0..max_load); в ответ процесс получает нагрузку,
+накопленную всеми воркерами. Приращения узла между сверками складываются в
+одно число: рост от аренд запросов во всех воркерах и затухание, которое
+выполняет только процесс-владелец балансировки. Новые записи кэша уходят
+той же транзакцией; чтение общего кэша - только при промахе локального.
+
+Общими здесь становятся только нагрузка узлов и кэш; что остается у каждого
+воркера своим, перечислено в workers.py.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_node_loads (
+    node_id INTEGER PRIMARY KEY,
+    load INTEGER NOT NULL,
+    max_load INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shared_cache (
+    provider TEXT NOT NULL,
+    key NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (provider, key)
+);
+"""
+
+
+class LocalState:
+    """Один процесс: нагрузка и кэш остаются в памяти процесса"""
+
+    shared = False
+
+    async def seed_loads(self, loads):
+        return None
+
+    async def sync(self, deltas, cache_entries):
+        return None
+
+    async def cache_get(self, provider, key):
+        return None
+
+    async def close(self):
+        pass
+
+
+class SqliteState:
+    """Общее состояние воркеров в файле SQLite; запросы выполняются в отдельном потоке"""
+
+    shared = True
+
+    def __init__(self, path="bot.db", purge_interval=60.0):
+        self.path = path
+        self.purge_interval = purge_interval  # Как часто удалять устаревшие записи кэша, секунды
+        self.last_purge = time.monotonic()
+        # Один поток - запросы к соединению SQLite выполняются строго по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    def _seed_loads(self, loads):
+        """Добавляет отсутствующие узлы; уже записанную другими воркерами нагрузку не трогает"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO shared_node_loads (node_id, load, max_load) VALUES (?, ?, ?)",
+                [(node_id, load, max_load) for node_id, (load, max_load) in loads.items()]
+            )
+        return self._read_loads()
+
+    def _read_loads(self):
+        return dict(self.conn.execute("SELECT node_id, load FROM shared_node_loads"))
+
+    def _sync(self, deltas, cache_entries):
+        now = time.time()
+        # BEGIN IMMEDIATE: блокировка записи берется сразу, а не при первом UPDATE
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "UPDATE shared_node_loads SET load = MAX(0, MIN(max_load, load + ?)) WHERE node_id = ?",
+                [(delta, node_id) for node_id, delta in deltas.items() if delta]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO shared_cache (provider, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                [(provider, key, json.dumps(value, ensure_ascii=False), now + ttl)
+                 for provider, key, value, ttl in cache_entries]
+            )
+            if time.monotonic() - self.last_purge >= self.purge_interval:
+                self.conn.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (now,))
+                self.last_purge = time.monotonic()
+            loads = self._read_loads()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return loads
+
+    def _cache_get(self, provider, key):
+        row = self.conn.execute(
+            "SELECT value, expires_at FROM shared_cache WHERE provider = ? AND key = ?", (provider, key)
+        ).fetchone()
+        if row is None:
+            return None
+        ttl = row[1] - time.time()
+        return (json.loads(row[0]), ttl) if ttl > 0 else None
+
+    async def seed_loads(self, loads):
+        """loads: id узла -> (нагрузка, максимум); возвращает общую нагрузку узлов"""
+        return await self._run(self._seed_loads, loads)
+
+    async def sync(self, deltas, cache_entries):
+        """Прибавляет приращения нагрузки, сохраняет записи кэша; возвращает общую нагрузку узлов"""
+        return await self._run(self._sync, deltas, cache_entries)
+
+    async def cache_get(self, provider, key):
+        """Возвращает (результат, оставшийся TTL в секундах) или None"""
+        return await self._run(self._cache_get, provider, key)
+
+    async def close(self):
+        await self._run(self.conn.close)
+        self.executor.shutdown(wait=True)
+
+
+STATE_BACKENDS = {
+    "local": lambda path: LocalState(),
+    "sqlite": SqliteState
+}
+
+
+class StateSync:
+    """Периодическая сверка состояния процесса с общим хранилищем"""
+
+    def __init__(self, backend, apply_loads, interval=0.1, on_sync=None):
+        self.backend = backend
+        self.apply_loads = apply_loads  # Вызывается с общей нагрузкой и еще не отправленными приращениями
+        self.interval = interval
+        self.on_sync = on_sync  # Вызывается с длительностью каждой сверки, секунды
+        self.deltas = {}  # id узла -> приращение нагрузки с последней сверки
+        self.cache_entries = []  # (провайдер, ключ, результат, TTL) с последней сверки
+        self.syncs = 0
+        self.changes = 0  # Сколько раз менялась нагрузка узлов процесса
+        self.sent = 0  # Сколько ненулевых приращений ушло в хранилище
+        self.errors = 0
+        self._task = None
+
+    def add_load(self, node_id, delta):
+        if delta:
+            self.deltas[node_id] = self.deltas.get(node_id, 0) + delta
+            self.changes += 1
+
+    def add_cache(self, provider, key, value, ttl):
+        self.cache_entries.append((provider, key, value, ttl))
+
+    async def flush(self):
+        deltas, self.deltas = self.deltas, {}
+        cache_entries, self.cache_entries = self.cache_entries, []
+        started = time.perf_counter()
+        try:
+            loads = await self.backend.sync(deltas, cache_entries)
+        except Exception as e:
+            # Приращения не потеряны: вернем их к накопленным за время запроса
+            for node_id, delta in deltas.items():
+                self.deltas[node_id] = self.deltas.get(node_id, 0) + delta
+            self.cache_entries[:0] = cache_entries
+            self.errors += 1
+            logging.error(f"Ошибка сверки общего состояния: {e}")
+            return
+        if self.on_sync:
+            self.on_sync(time.perf_counter() - started)
+        self.syncs += 1
+        self.sent += sum(1 for delta in deltas.values() if delta)
+        if loads is not None:
+            # Приращения, появившиеся за время запроса, уйдут следующей сверкой
+            self.apply_loads(loads, self.deltas)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает сверку и отправляет последние изменения"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def format_stats(self):
+        return (
+            f"🔗 Общее состояние ({type(self.backend).__name__}): сверок {self.syncs}, "
+            f"изменений нагрузки {self.changes}, отправлено приращений {self.sent}, ошибок {self.errors}"
+        )
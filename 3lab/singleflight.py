@@ -0,0 +1,46 @@
+import asyncio
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые запросы в один вызов"""
+
+    def __init__(self):
+        self.calls = {}  # ключ -> выполняющаяся задача
+        self.executed = 0  # Реально выполненных вызовов
+        self.coalesced = 0  # Запросов, присоединившихся к уже идущему вызову
+
+    async def do(self, key, func):
+        """Выполняет func() один раз для всех одновременных запросов с ключом key.
+
+        Все ожидающие получают один и тот же результат или одно и то же исключение.
+        Вызов выполняется в отдельной задаче, поэтому отмена одного ожидающего
+        не прерывает запрос для остальных.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        """Убирает завершенный вызов, чтобы следующий запрос выполнился заново"""
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Помечаем исключение как полученное, даже если все ожидающие были отменены
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self):
+        return len(self.calls)
+
+    def format_stats(self):
+        """Статистика для /node_status"""
+        return (
+            "🔗 Объединение запросов:\n"
+            f"Выполнено вызовов: {self.executed}, объединено: {self.coalesced}, "
+            f"в процессе: {self.in_flight()}"
+        )
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+HISTORY_TYPES = ("email", "ip", "phone", "url")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    user_id INTEGER PRIMARY KEY,
+    subscribed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    data_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (user_id, data_type, value)
+);
+CREATE INDEX IF NOT EXISTS idx_history_user ON history (user_id, id);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    removed INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'active',
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    broadcast_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (broadcast_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Storage:
+    """Хранилище подписчиков и истории проверок на SQLite (режим WAL)"""
+
+    def __init__(self, path="bot.db", check_same_thread=True):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def import_json(self, subscribers_file, history_file):
+        """Однократно переносит данные из subscribers.json и history.json"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return False
+
+        subscribers = []
+        history = {}
+        try:
+            if os.path.exists(subscribers_file):
+                with open(subscribers_file, "r") as file:
+                    subscribers = json.load(file)
+            if os.path.exists(history_file):
+                with open(history_file, "r") as file:
+                    history = json.load(file)
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Ошибка чтения JSON при импорте: {e}")
+            return False
+
+        now = self._now()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO subscribers (user_id, subscribed_at) VALUES (?, ?)",
+                ((int(user_id), now) for user_id in subscribers)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO history (user_id, data_type, value, created_at) VALUES (?, ?, ?, ?)",
+                (
+                    (int(user_id), data_type, value, now)
+                    for user_id, types in history.items()
+                    for data_type, values in types.items()
+                    for value in values
+                )
+            )
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('json_imported', ?)", (now,))
+        logging.info(f"Импортировано из JSON: {len(subscribers)} подписчиков, {len(history)} пользователей с историей")
+        return True
+
+    def add_subscriber(self, user_id):
+        """Добавляет подписчика; возвращает False, если он уже подписан"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO subscribers (user_id, subscribed_at) VALUES (?, ?)",
+                (user_id, self._now())
+            )
+        return cursor.rowcount > 0
+
+    def remove_subscriber(self, user_id):
+        """Удаляет подписчика; возвращает False, если он не был подписан"""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM subscribers WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def is_subscribed(self, user_id):
+        return self.conn.execute(
+            "SELECT 1 FROM subscribers WHERE user_id = ?", (user_id,)
+        ).fetchone() is not None
+
+    def add_history(self, user_id, data_type, value):
+        """Добавляет значение в историю пользователя (без повторов)"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO history (user_id, data_type, value, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, data_type, value, self._now())
+            )
+
+    def get_user_status(self, user_id):
+        """Статус подписки и история пользователя одним индексированным запросом"""
+        rows = self.conn.execute(
+            """
+            SELECT EXISTS (SELECT 1 FROM subscribers WHERE user_id = u.user_id), h.data_type, h.value
+            FROM (SELECT ? AS user_id) AS u
+            LEFT JOIN history AS h ON h.user_id = u.user_id
+            ORDER BY h.id
+            """,
+            (user_id,)
+        ).fetchall()
+
+        history = {data_type: [] for data_type in HISTORY_TYPES}
+        for _, data_type, value in rows:
+            if data_type is not None:
+                history.setdefault(data_type, []).append(value)
+        return bool(rows[0][0]), history
+
+    def create_broadcast(self, text):
+        """Создает рассылку и возвращает ее id"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO broadcasts (text, created_at) VALUES (?, ?)", (text, self._now())
+            )
+        return cursor.lastrowid
+
+    def get_active_broadcasts(self):
+        """Незавершенные рассылки: [(id, текст, курсор, отправлено, ошибок, удалено)]"""
+        return self.conn.execute(
+            "SELECT id, text, cursor, sent, failed, removed FROM broadcasts WHERE status = 'active' ORDER BY id"
+        ).fetchall()
+
+    def get_broadcast_page(self, broadcast_id, after, limit):
+        """Следующая страница подписчиков после курсора, которым рассылка еще не доставлена"""
+        rows = self.conn.execute(
+            """
+            SELECT s.user_id FROM subscribers AS s
+            WHERE s.user_id > ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM broadcast_deliveries AS d
+                  WHERE d.broadcast_id = ? AND d.user_id = s.user_id
+              )
+            ORDER BY s.user_id
+            LIMIT ?
+            """,
+            (after, broadcast_id, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_delivered(self, broadcast_id, user_id):
+        """Отмечает доставку, чтобы после перезапуска не отправить повторно"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, user_id) VALUES (?, ?)",
+                (broadcast_id, user_id)
+            )
+
+    def advance_broadcast(self, broadcast_id, cursor, sent, failed, removed):
+        """Сдвигает курсор рассылки и удаляет отметки доставки до него"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE broadcasts SET cursor = ?, sent = ?, failed = ?, removed = ? WHERE id = ?",
+                (cursor, sent, failed, removed, broadcast_id)
+            )
+            self.conn.execute(
+                "DELETE FROM broadcast_deliveries WHERE broadcast_id = ? AND user_id <= ?",
+                (broadcast_id, cursor)
+            )
+
+    def finish_broadcast(self, broadcast_id):
+        with self.conn:
+            self.conn.execute("UPDATE broadcasts SET status = 'done' WHERE id = ?", (broadcast_id,))
+            self.conn.execute("DELETE FROM broadcast_deliveries WHERE broadcast_id = ?", (broadcast_id,))
+
+    def close(self):
+        self.conn.close()
+
+
+class AsyncStorage:
+    """Асинхронный интерфейс к Storage: запросы выполняются в отдельном потоке, не блокируя цикл событий"""
+
+    def __init__(self, path="bot.db"):
+        # Один поток - запросы к соединению SQLite выполняются строго по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self.storage = Storage(path, check_same_thread=False)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    async def import_json(self, subscribers_file, history_file):
+        return await self._run(self.storage.import_json, subscribers_file, history_file)
+
+    async def add_subscriber(self, user_id):
+        return await self._run(self.storage.add_subscriber, user_id)
+
+    async def remove_subscriber(self, user_id):
+        return await self._run(self.storage.remove_subscriber, user_id)
+
+    async def is_subscribed(self, user_id):
+        return await self._run(self.storage.is_subscribed, user_id)
+
+    async def add_history(self, user_id, data_type, value):
+        await self._run(self.storage.add_history, user_id, data_type, value)
+
+    async def get_user_status(self, user_id):
+        return await self._run(self.storage.get_user_status, user_id)
+
+    async def create_broadcast(self, text):
+        return await self._run(self.storage.create_broadcast, text)
+
+    async def get_active_broadcasts(self):
+        return await self._run(self.storage.get_active_broadcasts)
+
+    async def get_broadcast_page(self, broadcast_id, after, limit):
+        return await self._run(self.storage.get_broadcast_page, broadcast_id, after, limit)
+
+    async def mark_delivered(self, broadcast_id, user_id):
+        await self._run(self.storage.mark_delivered, broadcast_id, user_id)
+
+    async def advance_broadcast(self, broadcast_id, cursor, sent, failed, removed):
+        await self._run(self.storage.advance_broadcast, broadcast_id, cursor, sent, failed, removed)
+
+    async def finish_broadcast(self, broadcast_id):
+        await self._run(self.storage.finish_broadcast, broadcast_id)
+
+    async def close(self):
+        await self._run(self.storage.close)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,88 @@
+"""События пересечения порогов нагрузки узла.
+
+Узел переходит в состояние high, когда нагрузка выше high, и выходит из него
+только когда опустится до high_clear (гистерезис: колебания у самого порога
+не порождают поток событий). Для low - симметрично через low и low_clear.
+
+RebalanceTrigger получает события и сразу планирует точечную балансировку
+вокруг узла; пока для узла уже запланирована балансировка, новые события
+по нему объединяются с ней.
+"""
+import asyncio
+import logging
+import time
+
+NORMAL = "normal"
+HIGH = "high"
+LOW = "low"
+
+
+class Watermarks:
+    def __init__(self, high=70, high_clear=60, low=30, low_clear=40):
+        if not (low <= low_clear <= high_clear <= high):
+            raise ValueError("Пороги должны удовлетворять low <= low_clear <= high_clear <= high")
+        self.high = high
+        self.high_clear = high_clear
+        self.low = low
+        self.low_clear = low_clear
+
+    def classify(self, state, load):
+        """Новое состояние узла с учетом предыдущего"""
+        if load > self.high:
+            return HIGH
+        if load < self.low:
+            return LOW
+        if state == HIGH and load > self.high_clear:
+            return HIGH
+        if state == LOW and load < self.low_clear:
+            return LOW
+        return NORMAL
+
+
+class RebalanceTrigger:
+    def __init__(self, handler):
+        self.handler = handler  # Корутина handler(node) - точечная балансировка
+        self.pending = set()
+        self.tasks = set()
+        self.events = 0
+        self.rebalances = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.last_reaction = None
+
+    def notify(self, node, state):
+        """Вызывается узлом при смене состояния"""
+        if state == NORMAL:
+            return
+        self.events += 1
+        if node.node_id in self.pending:
+            self.coalesced += 1
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.skipped += 1  # Цикл событий не запущен - дождемся периодической балансировки
+            return
+        self.pending.add(node.node_id)
+        task = loop.create_task(self._run(node, time.monotonic()))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, node, raised_at):
+        try:
+            await self.handler(node)
+            self.rebalances += 1
+            self.last_reaction = time.monotonic() - raised_at
+        except Exception as e:
+            logging.error(f"Ошибка точечной балансировки узла {node.node_id}: {e}")
+        finally:
+            self.pending.discard(node.node_id)
+
+    def format_stats(self):
+        text = (
+            f"События порогов: {self.events}, балансировок {self.rebalances}, "
+            f"объединено {self.coalesced}, пропущено {self.skipped}"
+        )
+        if self.last_reaction is not None:
+            text += f"\nПоследняя реакция: {self.last_reaction * 1000:.1f} мс"
+        return text
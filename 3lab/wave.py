@@ -0,0 +1,142 @@
+"""Обход графа узлов для волнового алгоритма Финна.
+
+Смежность хранится в формате CSR: соседи узла i - targets[offsets[i]:offsets[i + 1]].
+Вместо сброса флагов visited перед каждой волной используется номер эпохи:
+узел посещен в текущей волне, если mark[i] == epoch. Подготовка волны - O(1),
+сам обход - O(V + E) без лишних проходов по всем узлам.
+"""
+import random
+import time
+from array import array
+
+
+class WaveEngine:
+    """Волновой обход (BFS) по CSR-смежности с эпохами посещения"""
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+        size = len(offsets) - 1
+        # Списки, а не array: чтение элемента списка не создает новый объект int
+        self.mark = [0] * size  # Эпоха последнего посещения
+        self.distance = [0] * size  # Валидно для mark[i] == epoch
+        self.epoch = 0
+        self.waves = 0
+        self.total_time = 0.0
+        self.last_visited = 0
+
+    @classmethod
+    def from_adjacency(cls, adjacency):
+        """Строит движок по спискам соседей (индексы узлов)"""
+        offsets = array('q', [0])
+        targets = array('q')
+        for neighbors in adjacency:
+            targets.extend(neighbors)
+            offsets.append(len(targets))
+        return cls(offsets, targets)
+
+    @classmethod
+    def from_edges(cls, size, edges):
+        """Строит движок по списку неориентированных ребер (a, b)"""
+        degree = [0] * (size + 1)
+        for a, b in edges:
+            degree[a + 1] += 1
+            degree[b + 1] += 1
+        for i in range(size):
+            degree[i + 1] += degree[i]
+        offsets = array('q', degree)
+        fill = degree[:-1]
+        targets = array('q', bytes(8 * degree[-1]))
+        for a, b in edges:
+            targets[fill[a]] = b
+            fill[a] += 1
+            targets[fill[b]] = a
+            fill[b] += 1
+        return cls(offsets, targets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def neighbors(self, index):
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+    def visited(self, index):
+        """Посещен ли узел последней волной"""
+        return self.mark[index] == self.epoch
+
+    def run(self, source):
+        """Запускает волну от узла source; возвращает индексы узлов в порядке обхода"""
+        started = time.perf_counter()
+        self.epoch += 1
+        epoch = self.epoch
+        mark, distance = self.mark, self.distance
+        offsets, targets = self.offsets, self.targets
+
+        mark[source] = epoch
+        distance[source] = 0
+        order = [source]
+        # order одновременно служит очередью FIFO: цикл доходит и до добавленных
+        # в него узлов, извлечение из головы не нужно вовсе
+        for current in order:
+            next_distance = distance[current] + 1
+            for neighbor in targets[offsets[current]:offsets[current + 1]]:
+                if mark[neighbor] != epoch:
+                    mark[neighbor] = epoch
+                    distance[neighbor] = next_distance
+                    order.append(neighbor)
+
+        self.waves += 1
+        self.total_time += time.perf_counter() - started
+        self.last_visited = len(order)
+        return order
+
+    def format_stats(self):
+        if not self.waves:
+            return f"Волны: узлов {len(self)}, запусков еще не было"
+        return (
+            f"Волны: узлов {len(self)}, запусков {self.waves}, "
+            f"последняя обошла {self.last_visited}, "
+            f"среднее время {self.total_time / self.waves * 1000:.2f} мс"
+        )
+
+
+def complete_graph(size):
+    """Полный граф: каждый узел связан с каждым"""
+    return [[j for j in range(size) if j != i] for i in range(size)]
+
+
+def ring_graph(size):
+    """Кольцо: соседи - предыдущий и следующий узлы"""
+    if size < 2:
+        return [[] for _ in range(size)]
+    if size == 2:
+        return [[1], [0]]
+    return [[(i - 1) % size, (i + 1) % size] for i in range(size)]
+
+
+def random_edges(size, degree, rng=None):
+    """Случайный связный граф: кольцо плюс случайные ребра до средней степени degree"""
+    rng = rng or random.Random()
+    edges = [(i, (i + 1) % size) for i in range(size)] if size > 1 else []
+    extra = max(0, size * degree // 2 - len(edges))
+    edges.extend((rng.randrange(size), rng.randrange(size)) for _ in range(extra))
+    return [(a, b) for a, b in edges if a != b]
+
+
+def grid_edges(side):
+    """Решетка side × side"""
+    edges = []
+    for row in range(side):
+        for col in range(side):
+            i = row * side + col
+            if col + 1 < side:
+                edges.append((i, i + 1))
+            if row + 1 < side:
+                edges.append((i, i + side))
+    return edges
+
+
+TOPOLOGIES = {
+    'complete': complete_graph,
+    'ring': ring_graph
+}
@@ -0,0 +1,301 @@
+"""Многопроцессный режим бота: процесс-приемник и N воркеров.
+
+Приемник получает обновления от Telegram (polling или webhook), но обработчики
+не выполняет: промежуточный обработчик (outer middleware) dp.update пересылает
+каждое обновление воркеру номер partition(user_id, N). Обновления одного
+пользователя всегда попадают к одному воркеру и выполняются им строго по очереди,
+обновления разных пользователей - параллельно. Воркер - тот же скрипт бота,
+запущенный с WORKER_INDEX и WORKER_SOCKET: он выполняет обработчики и сам
+отвечает пользователю через Bot API. Нагрузка узлов, кэш и история у воркеров
+общие (shared_state.py и SQLite storage.py).
+
+У каждого воркера свое (между процессами не делится):
+    лимиты провайдеров  - token bucket с 1/WORKERS квоты (create_bucket в 3.py);
+    single-flight       - объединяются только одновременные проверки одного воркера,
+                          одинаковый запрос в двух воркерах уйдет к провайдеру дважды
+                          (до сверки общий кэш его еще не содержит);
+    in_flight и EWMA    - выбор узла для запроса видит только запросы своего воркера;
+                          в общую нагрузку узлов аренды попадают через приращения.
+
+Протокол - одна строка JSON на сообщение с полем 'rid', как в 4lab/cluster.py:
+    update {'user_id', 'update'} -> {'ok'}; ответ - когда обработчики закончили
+    stats                        -> {'processed', 'failed', 'in_flight', 'users', 'cpu'}
+    shutdown                     -> {}; ответ - когда принятые обновления обработаны
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+
+from aiogram.types import Update
+
+STREAM_LIMIT = 1 << 24  # Обновление с длинным текстом или подписью не должно упереться в лимит строки
+
+
+def socket_path(socket_dir, index):
+    return os.path.join(socket_dir, f"worker{index}.sock")
+
+
+def partition(user_id, count):
+    """Номер воркера пользователя; id Telegram - целые числа, hash(int) от запуска к запуску не меняется"""
+    return hash(user_id) % count
+
+
+class Connection:
+    """Соединение с воркером: мультиплексирует запросы по полю 'rid'"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.rids = itertools.count(1)
+        self.reader_task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def open(cls, path):
+        reader, writer = await asyncio.open_unix_connection(path, limit=STREAM_LIMIT)
+        return cls(reader, writer)
+
+    async def _read_replies(self):
+        try:
+            while line := await self.reader.readline():
+                reply = json.loads(line)
+                future = self.pending.pop(reply.pop('rid'), None)
+                if future and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Соединение с воркером закрыто"))
+            self.pending.clear()
+
+    async def request(self, message):
+        if self.reader_task.done():
+            raise ConnectionError("Соединение с воркером закрыто")
+        rid = next(self.rids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[rid] = future
+        # Запись - до первого await: порядок запросов в сокете совпадает с порядком вызовов
+        self.writer.write(json.dumps({**message, 'rid': rid}, ensure_ascii=False).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        self.reader_task.cancel()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class UserQueues:
+    """Обновления одного пользователя - по очереди, разных - параллельно (не больше max_concurrency)"""
+
+    def __init__(self, max_concurrency=50):
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.tails = {}  # id пользователя -> его последняя задача
+        self.tasks = set()
+
+    def submit(self, user_id, func):
+        """Ставит func() в очередь пользователя и возвращает задачу"""
+        previous = self.tails.get(user_id)
+        task = asyncio.create_task(self._run(previous, func))
+        self.tails[user_id] = task
+        self.tasks.add(task)
+        task.add_done_callback(partial(self._done, user_id))
+        return task
+
+    async def _run(self, previous, func):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self.slots:
+            return await func()
+
+    def _done(self, user_id, task):
+        self.tasks.discard(task)
+        if self.tails.get(user_id) is task:
+            del self.tails[user_id]
+
+    async def join(self):
+        while self.tasks:
+            await asyncio.wait(set(self.tasks))
+
+
+class WorkerServer:
+    """Воркер: принимает обновления от приемника и выполняет обработчики dp"""
+
+    def __init__(self, dp, bot, path, max_concurrency=50):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.queues = UserQueues(max_concurrency)
+        self.processed = 0
+        self.failed = 0
+        self.stopped = asyncio.Event()
+
+    async def _feed(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+    async def dispatch(self, message):
+        kind = message['type']
+        if kind == 'update':
+            update = Update.model_validate(message['update'], context={"bot": self.bot})
+            await self.queues.submit(message['user_id'], partial(self._feed, update))
+            return {'ok': True}
+        if kind == 'stats':
+            return {
+                'processed': self.processed,
+                'failed': self.failed,
+                'in_flight': len(self.queues.tasks),
+                'users': len(self.queues.tails),
+                'cpu': time.process_time()
+            }
+        if kind == 'shutdown':
+            await self.queues.join()
+            self.stopped.set()
+            return {}
+        return {'error': f"Неизвестный тип сообщения: {kind}"}
+
+    async def _respond(self, message, writer):
+        rid = message.get('rid')
+        try:
+            reply = await self.dispatch(message)
+        except Exception as e:
+            logging.error(f"Воркер: ошибка при обработке {message.get('type')}: {e}")
+            reply = {'error': str(e)}
+        if writer.is_closing():
+            return
+        writer.write(json.dumps({**reply, 'rid': rid}).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle_client(self, reader, writer):
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                # Очередь пользователя задается синхронно внутри dispatch, до первого await,
+                # поэтому порядок строк в сокете сохраняется
+                task = asyncio.create_task(self._respond(json.loads(line), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            # Приемник отключился (в том числе аварийно): дообрабатываем принятое и завершаемся
+            await self.queues.join()
+            self.stopped.set()
+
+    async def serve(self):
+        """Работает до команды shutdown от приемника"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle_client, self.path, limit=STREAM_LIMIT)
+        logging.info(f"Воркер (pid {os.getpid()}) слушает {self.path}")
+        await self.stopped.wait()
+        server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        logging.info(self.format_stats())
+
+    def format_stats(self):
+        return f"Воркер: обработано {self.processed}, ошибок {self.failed}, в работе {len(self.queues.tasks)}"
+
+
+class WorkerPool:
+    """Приемник: запускает процессы воркеров и раздает им обновления по user_id"""
+
+    def __init__(self, script, count, env=None, socket_dir=None, start_timeout=30.0):
+        self.script = script  # Скрипт бота; воркер запускается им же с WORKER_INDEX
+        self.count = count
+        self.env = env or {}
+        self.socket_dir = socket_dir
+        self.own_dir = socket_dir is None
+        self.start_timeout = start_timeout
+        self.processes = []
+        self.connections = []
+        self.dispatched = [0] * count
+        self.failed = 0
+
+    async def start(self):
+        if self.own_dir:
+            self.socket_dir = tempfile.mkdtemp(prefix="workers-")
+        os.makedirs(self.socket_dir, exist_ok=True)
+        for index in range(self.count):
+            env = {
+                **os.environ, **self.env,
+                "WORKER_INDEX": str(index),
+                "WORKER_SOCKET": socket_path(self.socket_dir, index)
+            }
+            self.processes.append(await asyncio.create_subprocess_exec(sys.executable, self.script, env=env))
+
+        deadline = time.monotonic() + self.start_timeout
+        for index, process in enumerate(self.processes):
+            while True:
+                try:
+                    self.connections.append(await Connection.open(socket_path(self.socket_dir, index)))
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if process.returncode is not None or time.monotonic() > deadline:
+                        await self.stop()
+                        raise RuntimeError(f"Воркер {index} не запустился")
+                    await asyncio.sleep(0.05)
+        logging.info(f"Запущено воркеров: {self.count} ({self.socket_dir})")
+
+    async def dispatch(self, user_id, update):
+        """Передает обновление воркеру пользователя и ждет окончания обработки"""
+        index = partition(user_id, self.count)
+        self.dispatched[index] += 1
+        reply = await self.connections[index].request({
+            'type': 'update',
+            'user_id': user_id,
+            'update': update.model_dump(mode="json", exclude_none=True)
+        })
+        if 'error' in reply:
+            self.failed += 1
+            raise RuntimeError(f"Воркер {index}: {reply['error']}")
+
+    async def __call__(self, handler, event, data):
+        """Outer middleware dp.update: обновление уходит воркеру вместо локальных обработчиков"""
+        user = data.get("event_from_user")
+        await self.dispatch(user.id if user else 0, event)
+
+    async def stats(self):
+        return await asyncio.gather(*(connection.request({'type': 'stats'}) for connection in self.connections))
+
+    async def stop(self):
+        """Воркеры дообрабатывают принятые обновления и завершаются"""
+        for connection in self.connections:
+            try:
+                await connection.request({'type': 'shutdown'})
+            except Exception:
+                pass
+            await connection.close()
+        self.connections.clear()
+        for process in self.processes:
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        self.processes.clear()
+        if self.own_dir and self.socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    def format_stats(self):
+        shares = ", ".join(f"{index}: {count}" for index, count in enumerate(self.dispatched))
+        return f"Воркеры ({self.count}): передано обновлений {shares}; ошибок {self.failed}"
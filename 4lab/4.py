@@ -2,10 +2,21 @@ import asyncio
 import os
 import json
 import logging
+import time
+import sys
+from collections import deque
 from aiogram import Bot, Dispatcher, types
 from aiogram.types import Message, BotCommand
+from aiogram.filters import Command
 from dotenv import load_dotenv
 from datetime import datetime
+from cluster import NodeCluster
+from bus import MessageBus
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # common/ лежит в корне репозитория
+from common.scheduler import BalancingScheduler
+from common.metrics import MetricsRegistry, MetricsServer
+from common.webhook import webhook_from_env
+from common.persistence import JsonFileWriter
 
 load_dotenv()
 
@@ -13,10 +24,43 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 bot = Bot(token=TOKEN)
 dp = Dispatcher()
 
+webhook_server = webhook_from_env(dp, bot)
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 NODE_LOADS_FILE = "node_loads.json"
 
+# local - узлы живут в процессе бота; ipc - каждый узел в своем процессе (cluster.py)
+CLUSTER_MODE = os.getenv("CLUSTER_MODE", "local")
+CLUSTER_SOCKET_DIR = os.getenv("CLUSTER_SOCKET_DIR")  # По умолчанию - временный каталог
+cluster = NodeCluster(CLUSTER_SOCKET_DIR) if CLUSTER_MODE == "ipc" else None
+
+# sequential - доставка в одной задаче; actors - каждый узел как asyncio-актор
+MESSAGE_BUS_MODE = os.getenv("MESSAGE_BUS_MODE", "sequential")
+WAVE_MAX_MESSAGES = int(os.getenv("WAVE_MAX_MESSAGES", "100000"))
+
+# Раунды повторяются, пока разброс или коэффициент вариации выше порога
+BALANCE_EPSILON_SPREAD = int(os.getenv("BALANCE_EPSILON_SPREAD", "10"))
+BALANCE_EPSILON_CV = float(os.getenv("BALANCE_EPSILON_CV", "0.1"))
+BALANCE_MAX_ROUNDS = int(os.getenv("BALANCE_MAX_ROUNDS", "10"))
+# Пауза между проверками растет от MIN до MAX, пока сеть сбалансирована
+BALANCE_MIN_INTERVAL = float(os.getenv("BALANCE_MIN_INTERVAL", "5"))
+BALANCE_MAX_INTERVAL = float(os.getenv("BALANCE_MAX_INTERVAL", "300"))
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - сервер выключен)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+WAVE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+metrics = MetricsRegistry("bot")
+handler_latency = metrics.histogram("handler_seconds", "Время обработки сообщения", ("handler",))
+node_load_gauge = metrics.gauge("node_load", "Нагрузка узла", ("node",))
+wave_duration = metrics.histogram(
+    "wave_seconds", "Длительность волны балансировки", ("engine",), buckets=WAVE_BUCKETS)
+persistence_latency = metrics.histogram(
+    "persistence_write_seconds", "Время записи состояния", ("target",))
+metrics_server = MetricsServer(metrics, METRICS_PORT, METRICS_HOST)
+
 class Node:
     def __init__(self, id, max_load):
         self.id = id
@@ -24,7 +68,7 @@ class Node:
         self.load = 0
         self.neighbors = []  # Соседние узлы
         self.visited = False
-        self.message_queue = []
+        self.message_queue = deque()  # Исходящие сообщения, их забирает шина
 
     def update_load(self, amount=1):
         """Увеличивает нагрузку"""
@@ -60,8 +104,8 @@ class Node:
     def handle_transfer(self, message):
         """Обрабатывает сообщение о переносе нагрузки"""
         if message['source'] != self.id:
-            transfer_amount = message['amount']
-            self.decrease_load(transfer_amount)
+            # Отправитель уже списал нагрузку при создании сообщения
+            self.update_load(message['amount'])
             self.message_queue.extend(self.create_transfer_messages())
 
     def create_wave_messages(self):
@@ -69,6 +113,7 @@ class Node:
         return [{
             'type': 'wave',
             'source': self.id,
+            'target': neighbor.id,
             'status': self.get_status()
         } for neighbor in self.neighbors]
 
@@ -78,6 +123,7 @@ class Node:
         for neighbor in self.neighbors:
             transfer_amount = self.calculate_transfer_amount(neighbor)
             if transfer_amount > 0:
+                self.decrease_load(transfer_amount)
                 messages.append({
                     'type': 'transfer',
                     'source': self.id,
@@ -94,32 +140,45 @@ class Node:
 async def propagate_wave(node):
     """Распространяет волну по сети"""
     try:
+        started = time.perf_counter()
         logging.info(f"Начало волны от узла {node.id}")
-        node.visited = True
-        messages = node.create_wave_messages()
+        # Источник обрабатывает волну как любой узел: рассылает ее соседям
+        # и сам переносит нагрузку на менее загруженных соседей
+        node.process_message({'type': 'wave', 'source': node.id, 'target': node.id})
+        message_bus.collect(node)
         
-        for message in messages:
-            await process_message(node, message)
-            
-        while any(node.message_queue for node in NODES):
-            for node in NODES:
-                while node.message_queue:
-                    message = node.message_queue.pop(0)
-                    await process_message(node, message)
+        if MESSAGE_BUS_MODE == "actors":
+            delivered = await message_bus.run_actors()
+        else:
+            delivered = message_bus.run()
+        wave_duration.observe(time.perf_counter() - started, MESSAGE_BUS_MODE)
+        logging.info(f"Волна завершена, доставлено сообщений: {delivered}")
     except Exception as e:
         logging.error(f"Ошибка при распространении волны: {e}")
 
-async def process_message(node, message):
-    """Обрабатывает сообщение в асинхронном режиме"""
-    try:
-        target_node = next(n for n in NODES if n.id == message['target'])
-        target_node.process_message(message)
-    except Exception as e:
-        logging.error(f"Ошибка при обработке сообщения: {e}")
+async def sync_cluster_loads():
+    """Переносит нагрузку процессов-узлов в локальные объекты Node"""
+    for status in await cluster.statuses():
+        NODES[status['id']].load = status['load']
+
+async def balance_load_cluster():
+    """Волна по процессам-узлам: сообщения wave/transfer идут через Unix-сокеты"""
+    await sync_cluster_loads()
+    source_node = max(NODES, key=lambda node: node.load)
+    logging.info(f"Запуск волнового алгоритма от узла {source_node.id} (ipc)")
+    duration = await cluster.start_wave(source_node.id)
+    wave_duration.observe(duration, "ipc")
+    await sync_cluster_loads()
+    logging.info(f"Волна завершена за {duration * 1000:.1f} мс")
 
 async def balance_load():
     """Запускает фазовый волновой алгоритм балансировки"""
     try:
+        if cluster:
+            await balance_load_cluster()
+            await save_node_loads()
+            return
+
         # Выбираем узел с максимальной нагрузкой как источник волны
         source_node = max(NODES, key=lambda node: node.load)
         logging.info(f"Запуск волнового алгоритма от узла {source_node.id}")
@@ -132,23 +191,35 @@ async def balance_load():
         await propagate_wave(source_node)
         
         # Сохраняем состояние нагрузки
-        save_node_loads()
+        await save_node_loads()
     except Exception as e:
         logging.error(f"Ошибка при балансировке нагрузки: {e}")
 
+async def current_loads():
+    """Нагрузки узлов для планировщика балансировки"""
+    if cluster:
+        await sync_cluster_loads()
+    return [node.load for node in NODES]
+
+balancing_scheduler = BalancingScheduler(
+    balance_load, current_loads,
+    epsilon_spread=BALANCE_EPSILON_SPREAD,
+    epsilon_cv=BALANCE_EPSILON_CV,
+    max_rounds=BALANCE_MAX_ROUNDS,
+    min_interval=BALANCE_MIN_INTERVAL,
+    max_interval=BALANCE_MAX_INTERVAL
+)
+
 async def periodic_balancing():
-    """Периодическая балансировка нагрузки"""
-    while True:
-        try:
-            await balance_load()
-            await asyncio.sleep(60)  # Проверяем каждую минуту
-        except Exception as e:
-            logging.error(f"Ошибка при периодической балансировке: {e}")
+    """Периодическая балансировка нагрузки: раунды до баланса, затем пауза с нарастанием"""
+    await balancing_scheduler.run()
 
 @dp.message(Command("node_status"))
 async def node_status(message: types.Message):
     """Обработчик команды /node_status"""
     try:
+        if cluster:
+            await sync_cluster_loads()
         status_text = "📊 Статус узлов:\n\n"
         for node in NODES:
             status = node.get_status()
@@ -158,17 +229,27 @@ async def node_status(message: types.Message):
                 f"Максимальная загрузка: {status['max_load']}%\n"
                 f"Соседи: {', '.join(map(str, status['neighbors']))}\n\n"
             )
+        status_text += message_bus.format_stats()
+        status_text += "\n" + balancing_scheduler.format_stats()
+        if cluster:
+            status_text += "\n" + cluster.format_stats()
         
         await message.answer(status_text)
     except Exception as e:
         logging.error(f"Ошибка при получении статуса узлов: {e}")
         await message.answer("❌ Произошла ошибка при получении статуса узлов")
 
-def save_node_loads():
-    """Сохраняет текущее состояние нагрузки узлов"""
+node_loads_writer = JsonFileWriter(
+    NODE_LOADS_FILE,
+    lambda: {node.id: node.load for node in NODES},
+    indent=None,
+    on_write=lambda seconds: persistence_latency.observe(seconds, "node_loads")
+)
+
+async def save_node_loads():
+    """Сохраняет текущее состояние нагрузки узлов, не блокируя цикл событий"""
     try:
-        with open(NODE_LOADS_FILE, 'w') as f:
-            json.dump({node.id: node.load for node in NODES}, f)
+        await node_loads_writer.write()
     except Exception as e:
         logging.error(f"Ошибка при сохранении нагрузки: {e}")
 
@@ -194,15 +275,44 @@ NODES[0].neighbors = [NODES[1], NODES[2]]
 NODES[1].neighbors = [NODES[0], NODES[2]]
 NODES[2].neighbors = [NODES[0], NODES[1]]
 
+message_bus = MessageBus(NODES, max_messages=WAVE_MAX_MESSAGES)
+
+def collect_node_metrics():
+    """Нагрузка узлов для /metrics"""
+    for node in NODES:
+        node_load_gauge.set(node.load, node.id)
+
+metrics.add_collector(collect_node_metrics)
+
+@dp.message.middleware()
+async def handler_metrics(handler, event, data):
+    """Время работы обработчика"""
+    with handler_latency.time(data["handler"].callback.__name__):
+        return await handler(event, data)
+
 async def main():
     # Загружаем состояние узлов
     load_node_loads()
     
+    if cluster:
+        await cluster.start([node.get_status() for node in NODES])
+    
+    # Сервер метрик (если задан METRICS_PORT)
+    await metrics_server.start()
+    
     # Запускаем периодическую балансировку в отдельном таске
     asyncio.create_task(periodic_balancing())
     
-    # Запускаем бота
-    await dp.start_polling(bot)
+    try:
+        # Запускаем бота
+        if webhook_server:
+            await webhook_server.run()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await metrics_server.stop()
+        if cluster:
+            await cluster.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Доставка волновых сообщений: прежний цикл propagate_wave против MessageBus.
+
+Прежний цикл ищет получателя перебором списка узлов, берет сообщения через
+list.pop(0) и на каждой итерации проверяет очереди всех узлов через any().
+Его запускаем только до --legacy-max узлов.
+
+Запуск: python bench_bus.py --sizes 100 1000 10000 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+
+from bus import MessageBus
+
+
+class BenchNode:
+    """Узел, который только пересылает волну соседям (как Node.handle_wave)"""
+
+    def __init__(self, node_id, outbox_factory):
+        self.id = node_id
+        self.neighbors = []
+        self.visited = False
+        self.message_queue = outbox_factory()
+
+    def process_message(self, message):
+        if not self.visited:
+            self.visited = True
+            self.message_queue.extend(
+                {'type': 'wave', 'source': self.id, 'target': neighbor.id} for neighbor in self.neighbors
+            )
+
+
+def build(size, degree, seed, outbox_factory):
+    rng = random.Random(seed)
+    nodes = [BenchNode(i, outbox_factory) for i in range(size)]
+    for i in range(size):
+        for j in {(i + 1) % size, *(rng.randrange(size) for _ in range(degree // 2 - 1))}:
+            if j != i:
+                nodes[i].neighbors.append(nodes[j])
+                nodes[j].neighbors.append(nodes[i])
+    return nodes
+
+
+def legacy_wave(nodes):
+    """Прежний цикл доставки из propagate_wave/process_message"""
+    delivered = 0
+    nodes[0].process_message({'target': 0})
+    while any(node.message_queue for node in nodes):
+        for node in nodes:
+            while node.message_queue:
+                message = node.message_queue.pop(0)
+                target_node = next(n for n in nodes if n.id == message['target'])
+                target_node.process_message(message)
+                delivered += 1
+    return delivered
+
+
+def bus_wave(nodes, bus):
+    nodes[0].process_message({'target': 0})
+    bus.collect(nodes[0])
+    return bus.run()
+
+
+async def actors_wave(nodes, bus):
+    nodes[0].process_message({'target': 0})
+    bus.collect(nodes[0])
+    return await bus.run_actors()
+
+
+def measure(func):
+    started = time.perf_counter()
+    delivered = func()
+    elapsed = time.perf_counter() - started
+    return delivered, delivered / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--degree", type=int, default=4)
+    parser.add_argument("--legacy-max", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    print(f"{'узлов':>8} {'сообщений':>10} {'прежний, сообщ/с':>17} {'шина, сообщ/с':>14} {'акторы, сообщ/с':>16}")
+    for size in args.sizes:
+        legacy_rate = "-"
+        if size <= args.legacy_max:
+            nodes = build(size, args.degree, args.seed, list)
+            _, rate = measure(lambda: legacy_wave(nodes))
+            legacy_rate = f"{rate:,.0f}"
+
+        nodes = build(size, args.degree, args.seed, deque)
+        bus = MessageBus(nodes, max_messages=10 ** 9)
+        delivered, bus_rate = measure(lambda: bus_wave(nodes, bus))
+
+        nodes = build(size, args.degree, args.seed, deque)
+        bus = MessageBus(nodes, max_messages=10 ** 9)
+        _, actors_rate = measure(lambda: asyncio.run(actors_wave(nodes, bus)))
+
+        print(f"{size:>8} {delivered:>10} {legacy_rate:>17} {bus_rate:>14,.0f} {actors_rate:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
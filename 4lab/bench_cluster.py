@@ -0,0 +1,74 @@
+"""Волновая балансировка на настоящих процессах: длительность волны и разброс нагрузки.
+
+Каждый узел запускается отдельным процессом (cluster.py), сообщения wave/transfer
+идут через Unix-сокеты. Топология - кольцо с хордами на соседей через один.
+
+Запуск: python bench_cluster.py --nodes 3 8 16 --waves 20
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from cluster import NodeCluster
+
+
+def make_nodes(count, rng, max_load=100):
+    nodes = []
+    for i in range(count):
+        neighbors = sorted({(i + step) % count for step in (-2, -1, 1, 2)} - {i})
+        nodes.append({'id': i, 'max_load': max_load, 'load': rng.randint(0, max_load), 'neighbors': neighbors})
+    return nodes
+
+
+def spread(statuses):
+    loads = [status['load'] for status in statuses]
+    return max(loads) - min(loads)
+
+
+async def run(count, args):
+    rng = random.Random(args.seed)
+    cluster = NodeCluster()
+    started = time.perf_counter()
+    await cluster.start(make_nodes(count, rng))
+    startup = time.perf_counter() - started
+    try:
+        initial = spread(await cluster.statuses())
+        durations = []
+        for _ in range(args.waves):
+            statuses = await cluster.statuses()
+            source = max(statuses, key=lambda status: status['load'])
+            durations.append(await cluster.start_wave(source['id']))
+        final = spread(await cluster.statuses())
+    finally:
+        await cluster.stop()
+    durations.sort()
+    return {
+        'startup': startup,
+        'p50': durations[len(durations) // 2],
+        'max': durations[-1],
+        'initial': initial,
+        'final': final
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[3, 8, 16])
+    parser.add_argument("--waves", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{'узлов':>6} {'запуск, мс':>11} {'волна p50, мс':>14} {'волна max, мс':>14} {'разброс до':>11} {'после':>6}")
+    for count in args.nodes:
+        result = asyncio.run(run(count, args))
+        print(
+            f"{count:>6} {result['startup'] * 1000:>11.0f} {result['p50'] * 1000:>14.2f} "
+            f"{result['max'] * 1000:>14.2f} {result['initial']:>11} {result['final']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Проверка и замер NumPy-балансировки (diffusion.py) против поочередной обработки пар.
+
+Сначала на множестве маленьких случайных графов проверяется, что векторный
+раунд поэлементно совпадает с reference_round - той же последовательностью
+переносов, выполненной по одной паре, - и что нагрузка сохраняется. Затем
+замеряется время раунда на больших графах.
+
+Отдельно раунд сверяется с настоящей волной propagate_wave из 4.py (узлы Node
+и MessageBus бота) на треугольнике бота и маленьких случайных графах: сколько
+случаев совпало и какой разброс нагрузки остается после раунда у каждого
+движка. Пока совпадают не все случаи, NumPy-раунд не может заменить волну
+в боте.
+
+Запуск: python bench_diffusion.py --sizes 1000 10000 100000 --rounds 10
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import random
+import time
+
+import numpy as np
+
+from bus import MessageBus
+from diffusion import DiffusionBalancer, edge_matchings, reference_round
+
+
+def random_adjacency(size, degree, rng):
+    """Связный случайный граф: кольцо плюс случайные хорды, списки соседей без повторов"""
+    neighbors = [set() for _ in range(size)]
+    edges = [(i, (i + 1) % size) for i in range(size)] if size > 1 else []
+    edges += [(rng.randrange(size), rng.randrange(size)) for _ in range(max(0, size * degree // 2 - size))]
+    for a, b in edges:
+        if a != b:
+            neighbors[a].add(b)
+            neighbors[b].add(a)
+    adjacency = [sorted(node_neighbors) for node_neighbors in neighbors]
+    for node_neighbors in adjacency:
+        rng.shuffle(node_neighbors)  # Порядок соседей влияет на порядок сообщений
+    return adjacency
+
+
+def verify(cases, rng):
+    for case in range(cases):
+        size = rng.randint(2, 12)
+        adjacency = random_adjacency(size, rng.randint(2, 6), rng)
+        max_loads = [rng.choice([20, 50, 100, 101]) for _ in range(size)]
+        loads = [rng.randint(0, max_load) for max_load in max_loads]
+        balancer = DiffusionBalancer(adjacency, max_loads)
+        matchings = edge_matchings(adjacency)
+        expected, actual = loads, np.array(loads)
+        for _ in range(5):
+            expected = reference_round(expected, max_loads, matchings)
+            actual = balancer.round(actual)
+            if actual.tolist() != expected:
+                raise AssertionError(f"Расхождение в случае {case}: {actual.tolist()} != {expected}")
+            if sum(expected) != sum(loads):
+                raise AssertionError(f"Нагрузка не сохраняется в случае {case}")
+    print(f"Проверено {cases} случайных графов по 5 раундов: совпадает с поочередной обработкой пар")
+
+
+def load_bot_module():
+    """Импортирует 4.py ради Node и propagate_wave; бот при этом не запускается"""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCH")
+    os.environ["CLUSTER_MODE"] = "local"
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "4.py")
+    spec = importlib.util.spec_from_file_location("bot4", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logging.getLogger().setLevel(logging.WARNING)  # Волна пишет в лог каждый запуск
+    return module
+
+
+def message_wave(bot, adjacency, max_loads, loads):
+    """Раунд так, как его выполняет бот: волна propagate_wave от самого загруженного узла"""
+    nodes = [bot.Node(node_id, max_load) for node_id, max_load in enumerate(max_loads)]
+    for node, neighbors, load in zip(nodes, adjacency, loads):
+        node.neighbors = [nodes[neighbor] for neighbor in neighbors]
+        node.load = load
+    bot.message_bus = MessageBus(nodes)  # propagate_wave берет шину из глобальных переменных модуля
+    asyncio.run(bot.propagate_wave(max(nodes, key=lambda node: node.load)))
+    return [node.load for node in nodes]
+
+
+def wave_parity(cases, rng):
+    """Сверка NumPy-раунда с волной 4.py; возвращает число совпавших случаев"""
+    bot = load_bot_module()
+    triangle = [[neighbor.id for neighbor in node.neighbors] for node in bot.NODES]
+    matched = triangle_matched = 0
+    wave_spread = numpy_spread = 0
+    example = None
+    for case in range(cases):
+        if case < cases // 2:
+            adjacency, max_loads = triangle, [node.max_load for node in bot.NODES]
+        else:
+            size = rng.randint(2, 8)
+            adjacency = random_adjacency(size, rng.randint(2, 4), rng)
+            max_loads = [100] * size
+        loads = [rng.randint(0, max_load) for max_load in max_loads]
+        expected = message_wave(bot, adjacency, max_loads, loads)
+        actual = DiffusionBalancer(adjacency, max_loads).round(loads).tolist()
+        wave_spread += max(expected) - min(expected)
+        numpy_spread += max(actual) - min(actual)
+        if actual == expected:
+            matched += 1
+            triangle_matched += adjacency is triangle
+        elif example is None:
+            example = (loads, expected, actual)
+    print(
+        f"Сверка с propagate_wave: совпало {matched} из {cases} "
+        f"(треугольник 4.py: {triangle_matched} из {cases // 2}); "
+        f"средний разброс после раунда: волна {wave_spread / cases:.1f}, NumPy {numpy_spread / cases:.1f}"
+    )
+    if example:
+        print(f"Например, {example[0]}: волна {example[1]}, NumPy {example[2]}")
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--degree", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--cases", type=int, default=500, help="Маленьких графов для проверки")
+    parser.add_argument("--wave-cases", type=int, default=200, help="Случаев для сверки с волной 4.py")
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    verify(args.cases, rng)
+    wave_parity(args.wave_cases, rng)
+
+    print(f"\n{'узлов':>8} {'подготовка, мс':>15} {'по парам, мс/раунд':>20} {'NumPy, мс/раунд':>16} "
+          f"{'ст. откл. до':>13} {'после':>6}")
+    for size in args.sizes:
+        adjacency = random_adjacency(size, args.degree, rng)
+        max_loads = [100] * size
+        loads = [rng.randint(0, 100) for _ in range(size)]
+
+        started = time.perf_counter()
+        balancer = DiffusionBalancer(adjacency, max_loads)
+        build_time = time.perf_counter() - started
+
+        matchings = edge_matchings(adjacency)
+        started = time.perf_counter()
+        expected = loads
+        for _ in range(args.rounds):
+            expected = reference_round(expected, max_loads, matchings)
+        message_time = (time.perf_counter() - started) / args.rounds
+
+        started = time.perf_counter()
+        actual = np.array(loads)
+        for _ in range(args.rounds):
+            actual = balancer.round(actual)
+        numpy_time = (time.perf_counter() - started) / args.rounds
+
+        assert actual.tolist() == expected
+        print(
+            f"{size:>8} {build_time * 1000:>15.0f} {message_time * 1000:>20.1f} {numpy_time * 1000:>16.2f} "
+            f"{np.std(loads):>13.2f} {actual.std():>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
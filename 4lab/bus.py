@@ -0,0 +1,132 @@
+"""Шина сообщений между узлами.
+
+Узел обрабатывает сообщение в process_message(message) и складывает исходящие
+сообщения (с полем 'target') в свой message_queue. Шина находит получателя
+по словарю id -> узел, кладет сообщение во входящую очередь (deque) узла и
+отмечает узел в множестве готовых. Доставка и выбор следующего узла - O(1),
+без поиска по списку узлов и без pop(0).
+
+Два режима:
+- run() - последовательная доставка в текущей задаче;
+- run_actors() - каждый узел работает как отдельная asyncio-задача со своей
+  asyncio.Queue; обработка чередуется с остальными задачами цикла событий.
+"""
+import asyncio
+import logging
+from collections import deque
+
+
+class MessageBus:
+    def __init__(self, nodes=(), max_messages=100_000):
+        self.nodes = {}
+        self.inboxes = {}
+        self.ready = deque()  # Узлы с непустой входящей очередью, в порядке поступления
+        self.ready_set = set()
+        self.max_messages = max_messages  # Защита от бесконечного обмена за одну волну
+        self.delivered = 0
+        self.last_run = 0
+        for node in nodes:
+            self.register(node)
+
+    def register(self, node):
+        self.nodes[node.id] = node
+        self.inboxes[node.id] = deque()
+
+    def send(self, message):
+        """Кладет сообщение во входящую очередь получателя"""
+        target = message['target']
+        self.inboxes[target].append(message)
+        if target not in self.ready_set:
+            self.ready_set.add(target)
+            self.ready.append(target)
+
+    def collect(self, node):
+        """Отправляет все исходящие сообщения узла"""
+        outbox = node.message_queue
+        while outbox:
+            self.send(outbox.popleft())
+
+    @staticmethod
+    def _process(node, message):
+        try:
+            node.process_message(message)
+        except Exception as e:
+            logging.error(f"Ошибка при обработке сообщения узлом {node.id}: {e}")
+
+    def run(self):
+        """Доставляет сообщения, пока очереди не опустеют; возвращает число доставленных"""
+        delivered = 0
+        while self.ready:
+            node_id = self.ready.popleft()
+            self.ready_set.discard(node_id)
+            node, inbox = self.nodes[node_id], self.inboxes[node_id]
+            while inbox:
+                if delivered >= self.max_messages:
+                    self._drop_pending()
+                    break
+                self._process(node, inbox.popleft())
+                delivered += 1
+                self.collect(node)
+        self.delivered += delivered
+        self.last_run = delivered
+        return delivered
+
+    def _drop_pending(self):
+        dropped = sum(len(inbox) for inbox in self.inboxes.values())
+        for inbox in self.inboxes.values():
+            inbox.clear()
+        self.ready.clear()
+        self.ready_set.clear()
+        logging.warning(f"Превышен лимит {self.max_messages} сообщений за волну, отброшено {dropped}")
+
+    async def run_actors(self):
+        """То же, что run(), но каждый узел - asyncio-актор со своей очередью"""
+        queues = {node_id: asyncio.Queue() for node_id in self.nodes}
+        pending = 0
+        delivered = 0
+        done = asyncio.Event()
+
+        def send(message):
+            nonlocal pending
+            pending += 1
+            queues[message['target']].put_nowait(message)
+
+        # Сообщения, накопленные до запуска, переходят в очереди акторов
+        for node_id, inbox in self.inboxes.items():
+            while inbox:
+                send(inbox.popleft())
+        self.ready.clear()
+        self.ready_set.clear()
+
+        async def actor(node, queue):
+            nonlocal pending, delivered
+            while True:
+                message = await queue.get()
+                if delivered < self.max_messages:
+                    self._process(node, message)
+                    delivered += 1
+                    while node.message_queue:
+                        send(node.message_queue.popleft())
+                pending -= 1
+                if pending == 0:
+                    done.set()
+                await asyncio.sleep(0)  # Даем поработать другим узлам и боту
+
+        if pending == 0:
+            self.last_run = 0
+            return 0
+        tasks = [asyncio.create_task(actor(self.nodes[node_id], queue)) for node_id, queue in queues.items()]
+        try:
+            await done.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if delivered >= self.max_messages:
+            logging.warning(f"Превышен лимит {self.max_messages} сообщений за волну")
+        self.delivered += delivered
+        self.last_run = delivered
+        return delivered
+
+    def format_stats(self):
+        return f"Шина сообщений: доставлено {self.delivered}, за последнюю волну {self.last_run}"
@@ -0,0 +1,350 @@
+"""Кластер узлов: каждый узел - отдельный процесс ОС, обмен сообщениями через Unix-сокеты.
+
+Протокол: одна строка JSON на сообщение. Запрос содержит поле 'rid', ответ
+возвращается с тем же 'rid', поэтому по одному соединению может идти
+несколько запросов одновременно (волна рекурсивно возвращается к узлам,
+которые ее отправили, - блокирующий запрос-ответ здесь привел бы к
+взаимоблокировке).
+
+Сообщения:
+    status                         -> {'id', 'load', 'max_load', 'neighbors'}
+    update_load {'amount'}         -> {'load'}
+    decrease_load {'amount'}       -> {'load'}
+    transfer {'source', 'amount'}  -> {'accepted', 'load'}
+    wave {'source', 'wave_id'}     -> {'visited'}; ответ приходит, когда волна
+                                      обошла все подграфы этого узла
+    shutdown                       -> {}
+
+Запуск узла вручную:
+    python cluster.py --id 0 --max-load 100 --load 40 --neighbors 1,2 --socket-dir /tmp/nodes
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+
+STREAM_LIMIT = 1 << 20
+SEEN_WAVES = 256  # Сколько последних волн помнит узел
+
+
+def socket_path(socket_dir, node_id):
+    return os.path.join(socket_dir, f"node{node_id}.sock")
+
+
+class Connection:
+    """Соединение с узлом: мультиплексирует запросы по полю 'rid'"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.rids = itertools.count(1)
+        self.reader_task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def open(cls, path):
+        reader, writer = await asyncio.open_unix_connection(path, limit=STREAM_LIMIT)
+        return cls(reader, writer)
+
+    async def _read_replies(self):
+        try:
+            while line := await self.reader.readline():
+                reply = json.loads(line)
+                future = self.pending.pop(reply.pop('rid'), None)
+                if future and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Соединение с узлом закрыто"))
+            self.pending.clear()
+
+    async def request(self, message):
+        if self.reader_task.done():
+            raise ConnectionError("Соединение с узлом закрыто")
+        rid = next(self.rids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[rid] = future
+        self.writer.write(json.dumps({**message, 'rid': rid}).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        self.reader_task.cancel()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class NodeServer:
+    """Узел в собственном процессе: хранит нагрузку и общается с соседями"""
+
+    def __init__(self, node_id, max_load, load, neighbors, socket_dir):
+        self.id = node_id
+        self.max_load = max_load
+        self.load = load
+        self.neighbors = neighbors  # id соседей
+        self.socket_dir = socket_dir
+        self.connections = {}
+        # Одно открытие соединения на соседа: иначе одновременные вызовы откроют по своему,
+        # и перезаписанное соединение вместе с задачей чтения останется висеть
+        self.connect_locks = defaultdict(asyncio.Lock)
+        self.clients = {}  # writer -> задача обработчика входящего соединения
+        self.seen_waves = deque(maxlen=SEEN_WAVES)
+        self.messages = 0
+        self.stopped = asyncio.Event()
+
+    def get_status(self):
+        return {
+            'id': self.id,
+            'load': self.load,
+            'max_load': self.max_load,
+            'neighbors': self.neighbors,
+            'messages': self.messages
+        }
+
+    async def connection(self, node_id):
+        """Соединение с соседом; открывается при первом вызове или после разрыва"""
+        connection = self.connections.get(node_id)
+        if connection is not None and not connection.reader_task.done():
+            return connection
+        async with self.connect_locks[node_id]:
+            # Пока ждали блокировку, соединение мог открыть другой вызов
+            connection = self.connections.get(node_id)
+            if connection is None or connection.reader_task.done():
+                if connection is not None:
+                    await connection.close()
+                connection = await Connection.open(socket_path(self.socket_dir, node_id))
+                self.connections[node_id] = connection
+            return connection
+
+    async def call(self, node_id, message):
+        connection = await self.connection(node_id)
+        return await connection.request(message)
+
+    def calculate_transfer_amount(self, neighbor_load):
+        """Вычисляет количество нагрузки для переноса (как Node.calculate_transfer_amount)"""
+        max_transfer = (self.load - neighbor_load) // 2
+        return min(max_transfer, self.max_load // 4)
+
+    async def handle_wave(self, message):
+        wave_id = message['wave_id']
+        if wave_id in self.seen_waves:
+            return {'visited': False}
+        self.seen_waves.append(wave_id)
+
+        # Перенос нагрузки на менее загруженных соседей
+        for neighbor in self.neighbors:
+            status = await self.call(neighbor, {'type': 'status'})
+            amount = self.calculate_transfer_amount(status['load'])
+            if amount > 0:
+                reply = await self.call(neighbor, {'type': 'transfer', 'source': self.id, 'amount': amount})
+                self.load = max(self.load - reply['accepted'], 0)
+
+        # Волна идет дальше; отвечаем, когда ее обошли все соседи
+        await asyncio.gather(*(
+            self.call(neighbor, {'type': 'wave', 'source': self.id, 'wave_id': wave_id})
+            for neighbor in self.neighbors
+        ))
+        return {'visited': True}
+
+    def handle_transfer(self, message):
+        accepted = max(min(message['amount'], self.max_load - self.load), 0)
+        self.load += accepted
+        return {'accepted': accepted, 'load': self.load}
+
+    async def dispatch(self, message):
+        self.messages += 1
+        kind = message['type']
+        if kind == 'status':
+            return self.get_status()
+        if kind == 'update_load':
+            self.load = min(self.load + message.get('amount', 1), self.max_load)
+            return {'load': self.load}
+        if kind == 'decrease_load':
+            self.load = max(self.load - message.get('amount', 1), 0)
+            return {'load': self.load}
+        if kind == 'transfer':
+            return self.handle_transfer(message)
+        if kind == 'wave':
+            return await self.handle_wave(message)
+        if kind == 'shutdown':
+            self.stopped.set()
+            return {}
+        return {'error': f"Неизвестный тип сообщения: {kind}"}
+
+    async def _respond(self, message, writer):
+        rid = message.get('rid')
+        try:
+            reply = await self.dispatch(message)
+        except Exception as e:
+            logging.error(f"Узел {self.id}: ошибка при обработке {message.get('type')}: {e}")
+            reply = {'error': str(e)}
+        if writer.is_closing():
+            return
+        writer.write(json.dumps({**reply, 'rid': rid}).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle_client(self, reader, writer):
+        self.clients[writer] = asyncio.current_task()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                # Каждый запрос - отдельная задача: волна может вернуться к узлу,
+                # пока он сам ждет ответа соседей
+                task = asyncio.create_task(self._respond(json.loads(line), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def serve(self):
+        path = socket_path(self.socket_dir, self.id)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.handle_client, path, limit=STREAM_LIMIT)
+        logging.info(f"Узел {self.id} (pid {os.getpid()}) слушает {path}")
+        await self.stopped.wait()
+        # Не ждем wait_closed: входящие соединения соседей закроются вместе с их процессами
+        server.close()
+        handlers = list(self.clients.values())
+        for writer in list(self.clients):
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        for connection in self.connections.values():
+            await connection.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class NodeCluster:
+    """Клиент кластера в процессе бота: запускает процессы узлов и шлет им сообщения"""
+
+    def __init__(self, socket_dir=None, start_timeout=10.0):
+        self.socket_dir = socket_dir
+        self.own_dir = socket_dir is None
+        self.start_timeout = start_timeout
+        self.processes = {}
+        self.connections = {}
+        self.latencies = deque(maxlen=1000)  # Время запрос-ответ, с
+        self.requests = 0
+        self.waves = 0
+        self.last_wave_time = None
+
+    async def start(self, nodes):
+        """Запускает по процессу на каждый узел; nodes - список словарей get_status()"""
+        if self.own_dir:
+            self.socket_dir = tempfile.mkdtemp(prefix="nodes-")
+        os.makedirs(self.socket_dir, exist_ok=True)
+        script = os.path.abspath(__file__)
+        for node in nodes:
+            self.processes[node['id']] = await asyncio.create_subprocess_exec(
+                sys.executable, script,
+                "--id", str(node['id']),
+                "--max-load", str(node['max_load']),
+                "--load", str(node['load']),
+                "--neighbors", ",".join(map(str, node['neighbors'])),
+                "--socket-dir", self.socket_dir
+            )
+
+        deadline = time.monotonic() + self.start_timeout
+        for node_id in self.processes:
+            while True:
+                try:
+                    self.connections[node_id] = await Connection.open(socket_path(self.socket_dir, node_id))
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        await self.stop()
+                        raise TimeoutError(f"Узел {node_id} не запустился за {self.start_timeout} с")
+                    await asyncio.sleep(0.05)
+        logging.info(f"Кластер из {len(self.processes)} узлов запущен в {self.socket_dir}")
+
+    async def call(self, node_id, message):
+        started = time.perf_counter()
+        reply = await self.connections[node_id].request(message)
+        self.latencies.append(time.perf_counter() - started)
+        self.requests += 1
+        if 'error' in reply:
+            raise RuntimeError(f"Узел {node_id}: {reply['error']}")
+        return reply
+
+    async def statuses(self):
+        return await asyncio.gather(*(self.call(node_id, {'type': 'status'}) for node_id in self.connections))
+
+    async def update_load(self, node_id, amount=1):
+        return (await self.call(node_id, {'type': 'update_load', 'amount': amount}))['load']
+
+    async def decrease_load(self, node_id, amount=1):
+        return (await self.call(node_id, {'type': 'decrease_load', 'amount': amount}))['load']
+
+    async def start_wave(self, source_id):
+        """Запускает волну от узла и ждет, пока она обойдет сеть; возвращает длительность, с"""
+        self.waves += 1
+        wave_id = f"{os.getpid()}-{self.waves}-{time.time_ns()}"
+        started = time.perf_counter()
+        await self.call(source_id, {'type': 'wave', 'source': source_id, 'wave_id': wave_id})
+        self.last_wave_time = time.perf_counter() - started
+        return self.last_wave_time
+
+    async def stop(self):
+        for node_id, connection in list(self.connections.items()):
+            try:
+                await asyncio.wait_for(connection.request({'type': 'shutdown'}), 1)
+            except Exception:
+                pass
+            await connection.close()
+        self.connections.clear()
+        for process in self.processes.values():
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        self.processes.clear()
+        if self.own_dir and self.socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    def format_stats(self):
+        text = f"Кластер: {len(self.processes)} процессов, запросов {self.requests}, волн {self.waves}"
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            text += f"\nЗадержка IPC: ср. {sum(ordered) / len(ordered) * 1000:.2f} мс, p99 {p99 * 1000:.2f} мс"
+        if self.last_wave_time is not None:
+            text += f"\nПоследняя волна: {self.last_wave_time * 1000:.1f} мс"
+        return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процесс узла кластера")
+    parser.add_argument("--id", type=int, required=True)
+    parser.add_argument("--max-load", type=int, default=100)
+    parser.add_argument("--load", type=int, default=0)
+    parser.add_argument("--neighbors", default="")
+    parser.add_argument("--socket-dir", required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    neighbors = [int(n) for n in args.neighbors.split(",") if n]
+    node = NodeServer(args.id, args.max_load, args.load, neighbors, args.socket_dir)
+    asyncio.run(node.serve())
+
+
+if __name__ == "__main__":
+    main()
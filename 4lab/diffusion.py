@@ -0,0 +1,117 @@
+"""Векторизованная балансировка на NumPy (обмен по измерениям).
+
+Правило переноса в паре узлов похоже на сообщения transfer в 4.py: более
+загруженный узел пары отдает соседу половину разницы, но не больше своего
+max_load // 4 (и не больше свободного места у соседа).
+
+Это другой алгоритм, а не ускоренная волна propagate_wave, поэтому бот его
+не использует. Волна идет обходом в ширину от самого загруженного узла, узел
+отдает нагрузку всем соседям сразу, а получатель перенаправляет ее дальше -
+каждый перенос зависит от предыдущего, и векторизовать такой порядок нельзя.
+Здесь пары обрабатываются в фиксированном порядке паросочетаний. Общая
+нагрузка сохраняется в обоих случаях, но распределение после раунда обычно
+отличается: для треугольника 4.py [78, 11, 29] волна дает [41, 39, 38],
+а этот раунд - [41, 38, 39]. Насколько часто, показывает сверка с
+propagate_wave в bench_diffusion.py.
+
+Если применять это правило одновременно ко всем ребрам, узел получает половину
+разницы сразу от нескольких соседей и нагрузка раскачивается. Поэтому ребра
+графа заранее раскрашиваются в паросочетания: в одном паросочетании у каждого
+узла не больше одного ребра, переносы в нем независимы и считаются одной
+векторной операцией над массивами. Раунд - проход по всем паросочетаниям;
+результат совпадает с поочередной обработкой пар в том же порядке
+(reference_round).
+
+Топология хранится разреженно: каждое паросочетание - пара массивов индексов
+(a, b), всего O(E) памяти.
+"""
+import numpy as np
+
+
+def edge_matchings(adjacency):
+    """Жадная раскраска ребер: список паросочетаний [(a, b), ...] в порядке обхода"""
+    used = [set() for _ in adjacency]
+    matchings = []
+    for a, neighbors in enumerate(adjacency):
+        for b in neighbors:
+            if b <= a:
+                continue  # Каждое неориентированное ребро - один раз
+            color = 0
+            while color in used[a] or color in used[b]:
+                color += 1
+            used[a].add(color)
+            used[b].add(color)
+            if color == len(matchings):
+                matchings.append([])
+            matchings[color].append((a, b))
+    return matchings
+
+
+def transfer_amount(loads, max_loads, a, b):
+    """Перенос в паре (a, b): (отправитель, получатель, количество)"""
+    source, target = (a, b) if loads[a] >= loads[b] else (b, a)
+    amount = min((loads[source] - loads[target]) // 2, max_loads[source] // 4,
+                 max_loads[target] - loads[target])
+    return source, target, max(amount, 0)
+
+
+def reference_round(loads, max_loads, matchings):
+    """Тот же раунд без векторизации: пары по одной в порядке паросочетаний (эталон для round, не волна 4.py)"""
+    loads = list(loads)
+    for matching in matchings:
+        for a, b in matching:
+            source, target, amount = transfer_amount(loads, max_loads, a, b)
+            loads[source] -= amount
+            loads[target] += amount
+    return loads
+
+
+class DiffusionBalancer:
+    """Раунды балансировки над вектором нагрузок"""
+
+    def __init__(self, adjacency, max_loads):
+        self.size = len(adjacency)
+        self.max_loads = np.broadcast_to(np.asarray(max_loads, dtype=np.int64), (self.size,)).copy()
+        self.caps = self.max_loads // 4
+        self.matchings = [
+            (np.array([a for a, _ in matching], dtype=np.int64), np.array([b for _, b in matching], dtype=np.int64))
+            for matching in edge_matchings(adjacency)
+        ]
+        self.rounds = 0
+        self.transferred = 0
+
+    def round(self, loads):
+        """Один раунд: по очереди все паросочетания; возвращает новый вектор нагрузок"""
+        loads = np.array(loads, dtype=np.int64)
+        transferred = 0
+        for a, b in self.matchings:
+            load_a, load_b = loads[a], loads[b]
+            a_sends = load_a >= load_b
+            source = np.where(a_sends, a, b)
+            target = np.where(a_sends, b, a)
+            amount = np.minimum(np.abs(load_a - load_b) // 2, self.caps[source])
+            np.minimum(amount, self.max_loads[target] - loads[target], out=amount)
+            np.maximum(amount, 0, out=amount)
+            # В паросочетании индексы не повторяются - присваивание по индексам безопасно
+            loads[source] -= amount
+            loads[target] += amount
+            transferred += int(amount.sum())
+        self.rounds += 1
+        self.transferred += transferred
+        return loads
+
+    def run(self, loads, rounds=1):
+        """Несколько раундов подряд; останавливается, если переносов больше нет"""
+        loads = np.asarray(loads, dtype=np.int64)
+        for _ in range(rounds):
+            updated = self.round(loads)
+            if np.array_equal(updated, loads):
+                break
+            loads = updated
+        return loads
+
+    def format_stats(self):
+        return (
+            f"NumPy-балансировка: узлов {self.size}, паросочетаний {len(self.matchings)}, "
+            f"раундов {self.rounds}, перенесено {self.transferred}"
+        )
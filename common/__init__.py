@@ -0,0 +1,6 @@
+"""Модули, общие для ботов 1lab-4lab.
+
+Скрипты лабораторных добавляют корень репозитория в sys.path и импортируют
+их как common.<модуль>; модули, которые есть только в одной лабораторной,
+лежат рядом с ее скриптом.
+"""
@@ -0,0 +1,83 @@
+import logging
+import time
+
+import aiohttp
+
+
+class ProviderSessions:
+    """Долгоживущие HTTP-сессии к внешним API (по одной на провайдера)"""
+
+    def __init__(self, providers, latency, limit_per_host=10, keepalive_timeout=30.0, ttl_dns_cache=300):
+        self.providers = providers
+        self.latency = latency  # Гистограмма времени запросов с метками (provider, status)
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.sessions = {}
+        self.stats = {name: {"new": 0, "reused": 0} for name in providers}
+
+    def _trace_config(self, provider):
+        """Считает новые и переиспользованные соединения и время запросов провайдера"""
+        stats = self.stats[provider]
+
+        async def on_create(session, context, params):
+            stats["new"] += 1
+
+        async def on_reuse(session, context, params):
+            stats["reused"] += 1
+
+        async def on_request_start(session, context, params):
+            context.started = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            self.latency.observe(time.perf_counter() - context.started, provider, str(params.response.status))
+
+        async def on_request_exception(session, context, params):
+            self.latency.observe(time.perf_counter() - context.started, provider, "error")
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    async def start(self):
+        """Создает сессии (вызывается из main() внутри работающего цикла)"""
+        for provider in self.providers:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.ttl_dns_cache
+            )
+            self.sessions[provider] = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self._trace_config(provider)]
+            )
+        logging.info(
+            f"HTTP-сессии созданы: limit_per_host={self.limit_per_host}, "
+            f"keepalive={self.keepalive_timeout}s, dns_ttl={self.ttl_dns_cache}s"
+        )
+
+    def get(self, provider):
+        """Возвращает сессию провайдера"""
+        return self.sessions[provider]
+
+    async def close(self):
+        """Закрывает все сессии при остановке бота"""
+        for provider, session in self.sessions.items():
+            await session.close()
+            logging.info(
+                f"Сессия {provider} закрыта: новых соединений {self.stats[provider]['new']}, "
+                f"переиспользовано {self.stats[provider]['reused']}"
+            )
+        self.sessions = {}
+
+    def format_stats(self):
+        """Статистика соединений для /node_status"""
+        lines = [
+            f"{provider}: новых {stats['new']}, переиспользовано {stats['reused']}"
+            for provider, stats in self.stats.items()
+        ]
+        return "🔌 HTTP-соединения:\n" + "\n".join(lines)
@@ -0,0 +1,94 @@
+import random
+
+
+class NodeRegistry:
+    """Реестр узлов на индексированной min-куче.
+
+    peek() возвращает наименее загруженный узел за O(1), update() после
+    изменения нагрузки восстанавливает кучу за O(log n). При равной нагрузке
+    порядок определяет случайная метка, которая заново выбирается при каждом
+    изменении ключа, - так сохраняется случайный выбор среди равных узлов.
+    """
+
+    def __init__(self, nodes=(), key=lambda node: node.load, rng=None):
+        self.key = key
+        self.rng = rng or random.Random()
+        self.heap = []  # [ключ, случайная метка, узел]
+        self.position = {}  # узел -> индекс в куче
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in self.heap)
+
+    def __contains__(self, node):
+        return node in self.position
+
+    def _less(self, i, j):
+        a, b = self.heap[i], self.heap[j]
+        return (a[0], a[1]) < (b[0], b[1])
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.position[heap[i][2]] = i
+        self.position[heap[j][2]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if not self._less(i, parent):
+                break
+            self._swap(i, parent)
+            i = parent
+        return i
+
+    def _sift_down(self, i):
+        size = len(self.heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self._less(child, smallest):
+                    smallest = child
+            if smallest == i:
+                return i
+            self._swap(i, smallest)
+            i = smallest
+
+    def add(self, node):
+        """Добавляет узел в реестр"""
+        if node in self.position:
+            self.update(node)
+            return
+        self.heap.append([self.key(node), self.rng.random(), node])
+        self.position[node] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def remove(self, node):
+        """Удаляет узел из реестра"""
+        i = self.position.pop(node)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.position[last[2]] = i
+            self._sift_down(self._sift_up(i))
+
+    def update(self, node):
+        """Пересчитывает ключ узла после изменения нагрузки"""
+        i = self.position.get(node)
+        if i is None:
+            return
+        entry = self.heap[i]
+        key = self.key(node)
+        if key == entry[0]:
+            return
+        entry[0] = key
+        entry[1] = self.rng.random()
+        self._sift_down(self._sift_up(i))
+
+    def peek(self):
+        """Наименее загруженный узел"""
+        return self.heap[0][2]
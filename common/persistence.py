@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+
+def atomic_write_json(path, data, indent=4):
+    """Записывает JSON во временный файл и атомарно подменяет им исходный"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=indent)
+    os.replace(tmp_path, path)
+
+
+class JsonFileWriter:
+    """Немедленная запись состояния в отдельном потоке; конкурентные вызовы выполняются по очереди"""
+
+    def __init__(self, path, snapshot, indent=4, on_write=None):
+        self.path = path
+        self.snapshot = snapshot  # Функция, возвращающая данные для записи
+        self.indent = indent
+        self.on_write = on_write  # Вызывается с длительностью каждой записи, секунды
+        self._lock = asyncio.Lock()
+
+    async def write(self):
+        """Записывает текущее состояние; снимок берется под блокировкой, поэтому последним на диск попадает самое свежее"""
+        async with self._lock:
+            data = self.snapshot()
+            started = time.perf_counter()
+            await asyncio.to_thread(atomic_write_json, self.path, data, self.indent)
+            if self.on_write:
+                self.on_write(time.perf_counter() - started)
+
+
+class WriteBehindPersister:
+    """Отложенная запись состояния: изменения помечаются, запись не чаще раза в interval секунд"""
+
+    def __init__(self, path, snapshot, interval=0.5, on_write=None, max_retry_delay=30.0):
+        self.path = path
+        self.snapshot = snapshot  # Функция, возвращающая данные для записи
+        self.interval = interval
+        self.on_write = on_write  # Вызывается с длительностью каждой записи, секунды
+        self.max_retry_delay = max_retry_delay  # Предел паузы между повторами неудачной записи
+        self.dirty = False
+        self.marks = 0  # Сколько раз состояние помечалось измененным
+        self.writes = 0  # Сколько раз файл действительно записан
+        self.errors = 0
+        self.last_write = 0.0
+        self._event = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._writing = None  # Запись в потоке; отмена задачи ее не останавливает
+        self._task = None
+
+    @property
+    def coalesced(self):
+        """Изменения, вошедшие в чужую запись"""
+        return max(0, self.marks - self.writes)
+
+    def mark_dirty(self):
+        """Помечает состояние измененным (без записи на диск)"""
+        self.dirty = True
+        self.marks += 1
+        self._event.set()
+
+    async def flush(self):
+        """Записывает состояние, если оно изменилось; сама запись идет в отдельном потоке.
+
+        Возвращает False, если запись не удалась (состояние остается измененным).
+        """
+        async with self._lock:
+            if self._writing is not None:
+                # Запись, начатая отмененной задачей, еще идет: второй поток писал бы тот же .tmp
+                writing, self._writing = self._writing, None
+                await asyncio.wait([writing])
+                if writing.exception():
+                    logging.error(f"Ошибка записи {self.path}: {writing.exception()}")
+            if not self.dirty:
+                return True
+            self.dirty = False
+            try:
+                # Снимок берется в цикле событий, чтобы не читать узлы из другого потока
+                data = self.snapshot()
+                started = time.perf_counter()
+                self._writing = asyncio.ensure_future(asyncio.to_thread(atomic_write_json, self.path, data))
+                await asyncio.shield(self._writing)
+                self._writing = None
+                if self.on_write:
+                    self.on_write(time.perf_counter() - started)
+                self.writes += 1
+                self.last_write = time.monotonic()
+                return True
+            except asyncio.CancelledError:
+                self.dirty = True  # Дописана ли отмененная запись, неизвестно - запишем еще раз
+                raise
+            except Exception as e:
+                self._writing = None
+                self.dirty = True
+                self.errors += 1
+                logging.error(f"Ошибка записи {self.path}: {e}")
+                return False
+
+    async def run(self):
+        """Фоновая задача: ждет изменений и сбрасывает их не чаще раза в interval"""
+        retry_delay = self.interval
+        while True:
+            await self._event.wait()
+            delay = self.interval - (time.monotonic() - self.last_write)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._event.clear()
+            if await self.flush():
+                retry_delay = self.interval
+            else:
+                # Не ждем следующего изменения: повторяем с нарастающей паузой
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+                self._event.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и сохраняет последние изменения (после начатой записи)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def format_stats(self):
+        return (
+            f"💾 Запись {os.path.basename(self.path)}: изменений {self.marks}, "
+            f"записей {self.writes}, объединено {self.coalesced}, ошибок {self.errors}"
+        )
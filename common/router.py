@@ -0,0 +1,134 @@
+"""Маршрутизация текстовых сообщений.
+
+ButtonRouter - фильтр aiogram для кнопок клавиатуры: вместо цепочки
+lambda message: message.text == "..." один поиск по словарю текст -> обработчик;
+найденный обработчик передается в аргумент button_handler.
+
+Фильтры здесь асинхронные: синхронный фильтр (lambda, F.document) aiogram
+выполняет через asyncio.to_thread, то есть каждое сообщение проходит через
+пул потоков столько раз, сколько синхронных фильтров стоит перед обработчиком.
+
+classify_indicator - тип индикатора по заранее скомпилированным шаблонам:
+email, URL со схемой, IPv4/IPv6, телефон (в том числе международный формат
+с +, пробелами, скобками и дефисами), имя хоста без схемы (считается URL).
+Имя хоста без схемы, оканчивающееся расширением файла (readme.md, file.txt),
+или голый домен реестра (co.uk) URL не считается - на такие тексты не тратится
+квота VirusTotal; сайт в такой зоне проверяется, если указать схему.
+"""
+import ipaddress
+import re
+
+from aiogram.filters import Filter
+
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s.]+")
+URL_RE = re.compile(r"https?://[^\s/?#]+\S*", re.IGNORECASE)
+IPV4_OCTET = r"(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+IPV4_RE = re.compile(rf"(?:{IPV4_OCTET}\.){{3}}{IPV4_OCTET}")
+IPV6_CHARS_RE = re.compile(r"[0-9A-Fa-f:.]*:[0-9A-Fa-f:.]*")
+PHONE_RE = re.compile(r"\+?[\d\s().-]+")
+NON_DIGITS_RE = re.compile(r"\D")
+# Метки хоста (буквы любого алфавита, цифры, дефис), домен верхнего уровня - буквы или punycode
+HOSTNAME_RE = re.compile(
+    r"(?P<host>(?:[^\W_](?:[^\W_]|-){0,62}\.)+(?:[^\W\d_]{2,63}|xn--[a-z0-9-]{1,59}))\.?"
+    r"(?::\d{1,5})?(?:[/?#]\S*)?",
+    re.IGNORECASE
+)
+# Последние метки, которые в сообщениях почти всегда означают расширение файла, а не домен
+FILE_EXTENSIONS = frozenset({
+    "txt", "md", "rst", "log", "csv", "json", "xml", "yml", "yaml", "ini", "cfg", "conf",
+    "pdf", "doc", "docx", "xls", "xlsx", "ppt", "pptx", "odt", "rtf",
+    "py", "js", "ts", "sh", "bat", "ps1", "exe", "dll", "msi", "apk", "jar",
+    "zip", "rar", "gz", "tar", "7z",
+    "jpg", "jpeg", "png", "gif", "bmp", "svg", "webp", "mp3", "mp4", "avi", "mov", "wav", "html", "htm"
+})
+# Домены второго уровня реестров национальных зон: сами по себе сайтом не являются (co.uk, com.au)
+REGISTRY_LABELS = frozenset({"co", "com", "net", "org", "gov", "edu", "ac", "ltd", "plc"})
+
+# Без + номер должен быть не короче 10 цифр (как раньше), с + - от 8; больше 15 цифр не бывает (E.164)
+PHONE_MIN_DIGITS = 10
+PHONE_MIN_DIGITS_INTERNATIONAL = 8
+PHONE_MAX_DIGITS = 15
+
+
+def is_ip(text):
+    if IPV4_RE.fullmatch(text):
+        return True
+    # Полную проверку IPv6 (сокращения ::, IPv4 в конце) оставляем ipaddress
+    if not IPV6_CHARS_RE.fullmatch(text):
+        return False
+    try:
+        ipaddress.IPv6Address(text)
+    except ValueError:
+        return False
+    return True
+
+
+def is_phone(text):
+    if not PHONE_RE.fullmatch(text):
+        return False
+    digits = len(NON_DIGITS_RE.sub("", text))
+    min_digits = PHONE_MIN_DIGITS_INTERNATIONAL if text.startswith("+") else PHONE_MIN_DIGITS
+    return min_digits <= digits <= PHONE_MAX_DIGITS
+
+
+def is_hostname(text):
+    match = HOSTNAME_RE.fullmatch(text)
+    if not match:
+        return False
+    labels = match.group("host").lower().split(".")
+    if labels[-1] in FILE_EXTENSIONS:
+        return False
+    if len(labels) == 2 and labels[0] in REGISTRY_LABELS and len(labels[1]) == 2:
+        return False
+    return True
+
+
+def classify_indicator(text):
+    """Определяет тип индикатора: email, phone, url, ip или None"""
+    # URL со схемой проверяется первым: "@" бывает и в ссылках (https://medium.com/@user)
+    if URL_RE.fullmatch(text):
+        return "url"
+    if "@" in text and EMAIL_RE.fullmatch(text):
+        return "email"
+    if is_ip(text):
+        return "ip"
+    if is_phone(text):
+        return "phone"
+    if is_hostname(text):
+        return "url"
+    return None
+
+
+def with_scheme(url):
+    """Имя хоста без схемы превращается в http:// URL"""
+    return url if "://" in url else f"http://{url}"
+
+
+async def has_text(message):
+    """Фильтр: сообщение с текстом"""
+    return bool(message.text)
+
+
+async def has_document(message):
+    """Фильтр: сообщение с файлом"""
+    return message.document is not None
+
+
+class ButtonRouter(Filter):
+    """Кнопки клавиатуры: текст кнопки -> обработчик"""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def button(self, text):
+        """Декоратор: регистрирует обработчик кнопки"""
+        def register(handler):
+            self.handlers[text] = handler
+            return handler
+        return register
+
+    async def __call__(self, message):
+        handler = self.handlers.get(message.text)
+        if handler is None:
+            return False
+        return {"button_handler": handler}
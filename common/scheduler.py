@@ -0,0 +1,129 @@
+"""Адаптивный планировщик раундов балансировки.
+
+Цикл балансировки повторяет раунды, пока разброс нагрузки (max - min) или
+коэффициент вариации не опустятся до порога, либо пока раунд перестанет
+что-то менять. Если сеть уже сбалансирована или раунды ничего не изменили
+(дисбаланс, с которым правило балансировки не работает), пауза до следующей
+проверки растет экспоненциально до max_interval; если раунды продвинулись -
+сбрасывается до min_interval. wake() прерывает паузу досрочно.
+"""
+import asyncio
+import inspect
+import logging
+import math
+import time
+from collections import deque
+
+
+def imbalance(loads):
+    """Статистика дисбаланса: разброс, среднее и коэффициент вариации"""
+    if not loads:
+        return {'spread': 0, 'mean': 0.0, 'cv': 0.0}
+    mean = sum(loads) / len(loads)
+    variance = sum((load - mean) ** 2 for load in loads) / len(loads)
+    return {
+        'spread': max(loads) - min(loads),
+        'mean': mean,
+        'cv': math.sqrt(variance) / mean if mean else 0.0
+    }
+
+
+class BalancingScheduler:
+    def __init__(self, round_func, loads_func, epsilon_spread=10, epsilon_cv=0.1, max_rounds=10,
+                 min_interval=5.0, max_interval=300.0, backoff=2.0, history=100):
+        self.round_func = round_func  # Один раунд балансировки (корутина)
+        self.loads_func = loads_func  # Текущие нагрузки узлов (функция или корутина)
+        self.epsilon_spread = epsilon_spread
+        self.epsilon_cv = epsilon_cv
+        self.max_rounds = max_rounds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.history = deque(maxlen=history)  # Статистика последних раундов
+        self.cycles = 0
+        self.rounds = 0
+        self.wake_event = asyncio.Event()
+
+    async def _loads(self):
+        loads = self.loads_func()
+        if inspect.isawaitable(loads):
+            loads = await loads
+        return list(loads)
+
+    def is_balanced(self, stats):
+        return stats['spread'] <= self.epsilon_spread or stats['cv'] <= self.epsilon_cv
+
+    async def run_cycle(self):
+        """Повторяет раунды до баланса; возвращает статистику по раундам (раунд 0 - исходное состояние).
+
+        В статистике раунда 'changed' - изменил ли он нагрузку узлов.
+        """
+        self.cycles += 1
+        loads = await self._loads()
+        stats = {'round': 0, **imbalance(loads), 'duration_ms': 0.0}
+        rounds = [stats]
+        while not self.is_balanced(stats) and len(rounds) <= self.max_rounds:
+            started = time.perf_counter()
+            await self.round_func()
+            new_loads = await self._loads()
+            stats = {
+                'round': len(rounds),
+                **imbalance(new_loads),
+                'duration_ms': (time.perf_counter() - started) * 1000,
+                'changed': new_loads != loads
+            }
+            rounds.append(stats)
+            self.rounds += 1
+            if not stats['changed']:
+                break  # Раунд ничего не изменил - дальше повторять бессмысленно
+            loads = new_loads
+        self.history.extend(rounds[1:])
+        return rounds
+
+    @staticmethod
+    def made_progress(rounds):
+        """Изменил ли нагрузку хотя бы один раунд цикла"""
+        return any(stats.get('changed') for stats in rounds[1:])
+
+    def update_interval(self, rounds):
+        """Пауза до следующего цикла: сбрасывается, только если раунды что-то изменили, иначе растет"""
+        if self.made_progress(rounds):
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+    def wake(self):
+        """Запускает следующий цикл, не дожидаясь конца паузы"""
+        self.wake_event.set()
+
+    async def run(self):
+        while True:
+            try:
+                rounds = await self.run_cycle()
+                self.update_interval(rounds)
+                if self.made_progress(rounds):
+                    first, last = rounds[0], rounds[-1]
+                    logging.info(
+                        f"Балансировка: {len(rounds) - 1} раундов, разброс {first['spread']} -> {last['spread']}, "
+                        f"CV {first['cv']:.3f} -> {last['cv']:.3f}"
+                    )
+            except Exception as e:
+                logging.error(f"Ошибка при периодической балансировке: {e}")
+                self.interval = self.min_interval
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake_event.clear()
+
+    def format_stats(self):
+        text = (
+            f"Планировщик балансировки: циклов {self.cycles}, раундов {self.rounds}, "
+            f"следующая проверка через {self.interval:.0f} с"
+        )
+        if self.history:
+            last = self.history[-1]
+            text += f"\nПоследний раунд: разброс {last['spread']}, CV {last['cv']:.3f}, {last['duration_ms']:.1f} мс"
+        return text
@@ -0,0 +1,171 @@
+"""Прием обновлений Telegram через webhook (aiohttp-сервер) вместо long polling.
+
+Каждое обновление обрабатывается отдельной задачей; одновременно - не больше
+max_concurrency. Когда все места заняты, запрос Telegram ждет освобождения места
+и только потом получает ответ 200, поэтому Telegram сам сдерживает поток
+(max_connections в setWebhook равен тому же лимиту).
+
+Остановка (SIGINT/SIGTERM): новые обновления получают 503 и будут повторно
+доставлены Telegram, уже принятые дорабатываются до drain_timeout секунд,
+оставшиеся после этого отменяются.
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from aiohttp import web
+from aiogram.types import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+TELEGRAM_MAX_CONNECTIONS = 100  # Верхняя граница max_connections в setWebhook
+
+
+class WebhookServer:
+    def __init__(self, dp, bot, url=None, path="/webhook", host="0.0.0.0", port=8080,
+                 secret_token=None, max_concurrency=50, drain_timeout=30.0):
+        self.dp = dp
+        self.bot = bot
+        self.url = url  # Публичный адрес сервера; если не задан, setWebhook не вызывается
+        self.path = path
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token
+        self.max_concurrency = max_concurrency
+        self.drain_timeout = drain_timeout
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.tasks = set()
+        self.draining = False
+        self.runner = None
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        if self.secret_token and request.headers.get(SECRET_HEADER) != self.secret_token:
+            return web.Response(status=401)
+        if self.draining:
+            self.rejected += 1
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logging.error(f"Некорректное обновление webhook: {e}")
+            return web.Response(status=400)
+
+        # Ждем свободное место, не отвечая Telegram, - так он не присылает больше, чем мы успеваем
+        await self.slots.acquire()
+        if self.draining:
+            self.slots.release()
+            self.rejected += 1
+            return web.Response(status=503)
+        self.received += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        task = asyncio.create_task(self._process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp, bots=[self.bot], **self.dp.workflow_data)
+        if self.url:
+            await self.bot.set_webhook(
+                f"{self.url.rstrip('/')}{self.path}",
+                secret_token=self.secret_token,
+                max_connections=min(self.max_concurrency, TELEGRAM_MAX_CONNECTIONS),
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+        logging.info(
+            f"Webhook слушает http://{self.host}:{self.port}{self.path}, "
+            f"одновременно до {self.max_concurrency} обновлений"
+        )
+
+    async def drain(self):
+        """Перестает принимать обновления и дожидается уже принятых"""
+        self.draining = True
+        if self.tasks:
+            logging.info(f"Завершение: ожидание {len(self.tasks)} обновлений в работе")
+            started = time.monotonic()
+            _, pending = await asyncio.wait(set(self.tasks), timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            logging.info(
+                f"Обновления дообработаны за {time.monotonic() - started:.1f} с, отменено {len(pending)}"
+            )
+
+    async def stop(self):
+        await self.drain()
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+        try:
+            await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp, bots=[self.bot], **self.dp.workflow_data)
+        finally:
+            await self.bot.session.close()
+        logging.info(self.format_stats())
+
+    async def run(self):
+        """Работает до SIGINT/SIGTERM, затем корректно останавливается"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        signals = (signal.SIGINT, signal.SIGTERM)
+        for sig in signals:
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:  # Windows
+                pass
+        await self.start()
+        try:
+            await stop_event.wait()
+        finally:
+            for sig in signals:
+                try:
+                    loop.remove_signal_handler(sig)
+                except NotImplementedError:
+                    pass
+            await self.stop()
+
+    def format_stats(self):
+        return (
+            f"Webhook: принято {self.received}, обработано {self.processed}, ошибок {self.failed}, "
+            f"отклонено при остановке {self.rejected}, в работе {self.in_flight} "
+            f"(макс. {self.max_in_flight} из {self.max_concurrency})"
+        )
+
+
+def webhook_from_env(dp, bot):
+    """WebhookServer с настройками WEBHOOK_* при BOT_MODE=webhook, иначе None (long polling)"""
+    if os.getenv("BOT_MODE", "polling") != "webhook":
+        return None
+    return WebhookServer(
+        dp, bot,
+        url=os.getenv("WEBHOOK_URL"),
+        path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        secret_token=os.getenv("WEBHOOK_SECRET"),
+        max_concurrency=int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "50")),
+        drain_timeout=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+    )
@@ -0,0 +1,507 @@
+"""Сквозной нагрузочный тест ботов 2lab и 3lab без Telegram и платных API.
+
+- Входящие сообщения - синтетические Update, которые подаются прямо в dp.feed_update
+  (как при polling, но без сети).
+- LeakCheck, VirusTotal и IPQS заменяет локальный aiohttp-сервер-заглушка: задержка
+  ответа (--latency, --jitter), доля ответов 500 (--error-rate), доля ответов 429
+  (--throttle-rate) и лимит запросов в секунду на провайдера (--provider-rps),
+  сверх которого заглушка отвечает 429 с Retry-After. Бот обращается к ней через
+  LEAKCHECK_API_URL, VIRUSTOTAL_API_URL и IPQS_API_URL.
+- Исходящие вызовы Bot API (sendMessage и др.) перехватывает сессия aiogram без сети.
+
+Нагрузка - смесь email/URL/IP (--mix) от --users пользователей; значения берутся из
+пула по --pool на тип, поэтому повторы попадают в кэш и single-flight 3lab.
+Отчет: сообщений в секунду, p50/p95/p99 задержки обработчика по типам, запросы
+к заглушке по провайдерам и исходящие вызовы бота.
+
+По умолчанию лимиты token bucket 3lab сняты (RATE_LIMIT_*), чтобы мерить сам бот;
+--lab-limits оставляет лимиты лабораторной.
+
+Режим --workers: 3lab в многопроцессном режиме (WORKERS=N, STATE_BACKEND=sqlite) -
+этот процесс работает приемником и раздает обновления воркерам по user_id, воркеры
+отвечают через Bot API заглушки (TELEGRAM_API_URL). Для каждого N печатается
+пропускная способность и доля от линейного масштабирования относительно первого N.
+
+Запуск:  python loadtest.py
+         python loadtest.py --labs 3lab --messages 5000 --concurrency 50 --latency 80
+         python loadtest.py --error-rate 0.05 --provider-rps 20
+         python loadtest.py --workers 1 2 4 --messages 4000 --concurrency 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from aiohttp import web
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update, User
+
+from simulate import load_lab, percentile
+
+PROVIDERS = ("leakcheck", "virustotal", "ipqs")
+DATA_TYPES = ("email", "url", "ip")
+
+
+# --- Заглушка внешних API ---
+
+class ProviderStub:
+    """Локальный сервер, отвечающий как LeakCheck, VirusTotal и IPQS"""
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0,
+                 provider_rps=0, retry_after=1, seed=1, telegram_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.provider_rps = provider_rps  # 0 - без ограничения
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.windows = {provider: (0, 0) for provider in PROVIDERS}  # Секунда и число запросов в ней
+        self.stats = {provider: Counter() for provider in PROVIDERS}
+        self.telegram_latency = telegram_latency
+        self.telegram_calls = Counter()  # Вызовы Bot API воркеров (режим --workers)
+        self.message_id = 0
+        self.runner = None
+        self.url = None
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_get("/api", self.leakcheck)                        # 2lab
+        app.router.add_get("/api/v2/search", self.leakcheck)              # 3lab
+        app.router.add_post("/api/v3/urls", self.virustotal)              # 2lab
+        app.router.add_get("/api/v3/urls/{target:.*}", self.virustotal)   # 3lab
+        app.router.add_get("/api/json/ip/{key}/{ip}", self.ipqs)          # 2lab
+        app.router.add_get("/ip-api/json/{ip}", self.ipqs)                # 3lab
+        app.router.add_post("/bot{token}/{method}", self.telegram)        # Bot API (TELEGRAM_API_URL)
+        return app
+
+    async def start(self):
+        self.runner = web.AppRunner(self._app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def _over_limit(self, provider):
+        if not self.provider_rps:
+            return False
+        second = int(time.monotonic())
+        window, count = self.windows[provider]
+        if window != second:
+            window, count = second, 0
+        self.windows[provider] = (window, count + 1)
+        return count >= self.provider_rps
+
+    async def _respond(self, provider, payload):
+        stats = self.stats[provider]
+        stats["requests"] += 1
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        if self._over_limit(provider) or self.rng.random() < self.throttle_rate:
+            stats["429"] += 1
+            return web.json_response({"error": "rate limit"}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        if self.rng.random() < self.error_rate:
+            stats["500"] += 1
+            return web.json_response({"error": "internal"}, status=500)
+        stats["200"] += 1
+        return web.json_response(payload)
+
+    async def leakcheck(self, request):
+        found = self.rng.random() < 0.3
+        return await self._respond("leakcheck", {
+            "success": True,
+            "found": 2 if found else 0,
+            "sources": ["StubBreach", "StubLeak"] if found else []
+        })
+
+    async def virustotal(self, request):
+        malicious = 1 if self.rng.random() < 0.1 else 0
+        return await self._respond("virustotal", {"data": {"attributes": {"last_analysis_stats": {
+            "malicious": malicious, "suspicious": 0, "harmless": 70, "undetected": 20
+        }}}})
+
+    async def ipqs(self, request):
+        return await self._respond("ipqs", {
+            "success": True,
+            "fraud_score": self.rng.randint(0, 100),
+            "proxy": False,
+            "tor": False,
+            "bot": False
+        })
+
+    async def telegram(self, request):
+        method = request.match_info["method"]
+        self.telegram_calls[method] += 1
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+        form = await request.post()
+        self.message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(form["chat_id"]), "type": "private"},
+            "text": form["text"]
+        }})
+
+    def format_stats(self):
+        lines = []
+        for provider, stats in self.stats.items():
+            lines.append(
+                f"  {provider:<11} запросов {stats['requests']:>6}, 200: {stats['200']}, "
+                f"429: {stats['429']}, 500: {stats['500']}"
+            )
+        return "Заглушка API:\n" + "\n".join(lines)
+
+
+# --- Исходящие вызовы бота ---
+
+class CapturingSession(BaseSession):
+    """Сессия aiogram без сети: считает вызовы Bot API и отвечает как Telegram"""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency  # Имитация времени ответа Telegram, с
+        self.calls = Counter()
+        self.replies = Counter()  # Ответы пользователям по первому символу (✅, ⚠️, ❌, ⏳ ...)
+        self.message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, SendMessage):
+            self.message_id += 1
+            self.replies[method.text[:1]] += 1
+            return Message(
+                message_id=self.message_id,
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError("Загрузка файлов в нагрузочном тесте не поддерживается")
+        yield b""
+
+    async def close(self):
+        pass
+
+    def format_stats(self):
+        calls = ", ".join(f"{name}: {count}" for name, count in self.calls.most_common())
+        replies = ", ".join(f"{mark or '?'} {count}" for mark, count in self.replies.most_common())
+        return f"Вызовы Bot API: {calls}\nОтветы по первому символу: {replies}"
+
+
+# --- Нагрузка ---
+
+def indicator(data_type, index):
+    """Значение индикатора из пула: одинаковый index - одинаковое значение"""
+    if data_type == "email":
+        return f"user{index}@example.com"
+    if data_type == "url":
+        return f"https://site{index}.example.com/page"
+    return f"{11 + index // 65536 % 200}.{index // 256 % 256}.{index % 256}.7"
+
+
+def make_workload(count, mix, pool, users, seed):
+    rng = random.Random(seed)
+    types, weights = zip(*mix.items())
+    workload = []
+    for _ in range(count):
+        data_type = rng.choices(types, weights)[0]
+        workload.append((data_type, indicator(data_type, rng.randrange(pool)), rng.randrange(1, users + 1)))
+    return workload
+
+
+def make_update(update_id, user_id, text):
+    user = User(id=user_id, is_bot=False, first_name="Load")
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=user,
+        text=text
+    ))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DATA_TYPES:
+            raise argparse.ArgumentTypeError(f"Неизвестный тип {name!r}, допустимы: {', '.join(DATA_TYPES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# --- Запуск лабораторных ---
+
+class Lab2Runner:
+    def __init__(self, module):
+        self.module = module
+
+    async def start(self):
+        await self.module.http_sessions.start()
+
+    async def stop(self):
+        await self.module.http_sessions.close()
+        await self.module.storage.close()
+
+    def stats(self):
+        return self.module.http_sessions.format_stats()
+
+
+class Lab3Runner:
+    def __init__(self, module, balancing):
+        self.module = module
+        self.balancing = balancing
+        self.balancing_task = None
+
+    async def start(self):
+        module = self.module
+        await module.initialize_network()
+        await module.http_sessions.start()
+        module.node_loads_persister.start()
+        module.loop_lag_monitor.start()
+        if self.balancing:
+            self.balancing_task = asyncio.create_task(module.periodic_balancing())
+
+    async def stop(self):
+        module = self.module
+        if self.balancing_task:
+            self.balancing_task.cancel()
+            await asyncio.gather(self.balancing_task, return_exceptions=True)
+        await module.http_sessions.close()
+        await module.node_loads_persister.stop()
+        await module.loop_lag_monitor.stop()
+        await module.storage.close()
+
+    def stats(self):
+        module = self.module
+        return "\n".join((
+            module.http_sessions.format_stats(),
+            module.result_cache.format_stats(),
+            module.single_flight.format_stats(),
+            module.rate_limiter.format_stats(),
+            module.loop_lag_monitor.format_stats()
+        ))
+
+
+def lab_env(stub_url, args):
+    env = {
+        "LEAKCHECK_API_URL": stub_url,
+        "VIRUSTOTAL_API_URL": stub_url,
+        "IPQS_API_URL": stub_url,
+        "LEAKCHECK_API_KEY": "stub",
+        "VIRUSTOTAL_API_KEY": "stub",
+        "IPQS_API_KEY": "stub",
+        "WAVE_LOG": "off"
+    }
+    if not args.lab_limits:
+        for provider in PROVIDERS:
+            for name in (f"RATE_LIMIT_{provider.upper()}", f"RATE_BURST_{provider.upper()}"):
+                env[name] = os.environ.get(name, "1000000")
+    return env
+
+
+async def run_lab(lab, args):
+    stub = ProviderStub(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, provider_rps=args.provider_rps,
+        retry_after=args.retry_after, seed=args.seed
+    )
+    await stub.start()
+    module = load_lab(lab, lab_env(stub.url, args))
+    logging.getLogger().setLevel(args.log_level)
+    runner = Lab2Runner(module) if lab == "2lab" else Lab3Runner(module, args.balancing)
+    session = CapturingSession(latency=args.telegram_latency / 1000)
+    bot = module.Bot(token=module.TOKEN, session=session)
+    workload = make_workload(args.messages, args.mix, args.pool, args.users, args.seed)
+    latencies = defaultdict(list)
+    failures = Counter()
+    cursor = iter(enumerate(workload, start=1))
+
+    async def worker():
+        for update_id, (data_type, text, user_id) in cursor:
+            update = make_update(update_id, user_id, text)
+            started = time.perf_counter()
+            try:
+                await module.dp.feed_update(bot, update)
+            except Exception as e:
+                failures[type(e).__name__] += 1
+            latencies[data_type].append(time.perf_counter() - started)
+
+    await runner.start()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        lab_stats = runner.stats()
+    finally:
+        await runner.stop()
+        await stub.stop()
+
+    report(lab, elapsed, latencies, failures)
+    print(stub.format_stats())
+    print(session.format_stats())
+    if failures:
+        print("Исключения в обработчиках: " + ", ".join(f"{name}: {count}" for name, count in failures.items()))
+    if args.verbose:
+        print(lab_stats)
+    print()
+
+
+async def run_workers(count, args):
+    """3lab в многопроцессном режиме: этот процесс - приемник, воркеры - отдельные процессы 3.py"""
+    stub = ProviderStub(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, provider_rps=args.provider_rps,
+        retry_after=args.retry_after, seed=args.seed, telegram_latency=args.telegram_latency / 1000
+    )
+    await stub.start()
+    env = {
+        **lab_env(stub.url, args),
+        "TELEGRAM_API_URL": stub.url,
+        "WORKERS": str(count),
+        "STATE_BACKEND": "sqlite",
+        "LOG_LEVEL": args.log_level
+    }
+    module = load_lab("3lab", env)
+    logging.getLogger().setLevel(args.log_level)
+    pool = module.WorkerPool(os.path.join(os.path.dirname(module.__file__), "3.py"), count, env=env)
+    # Как в run_receiver: обновления проходят dp приемника и уходят воркерам через outer middleware
+    module.dp.update.outer_middleware(pool)
+    workload = make_workload(args.messages, args.mix, args.pool, args.users, args.seed)
+    latencies = defaultdict(list)
+    failures = Counter()
+    cursor = iter(enumerate(workload, start=1))
+
+    async def worker():
+        for update_id, (data_type, text, user_id) in cursor:
+            # Обновления polling и webhook уже привязаны к боту - без этого feed_update пересобирает Update
+            update = make_update(update_id, user_id, text).as_(module.bot)
+            started = time.perf_counter()
+            try:
+                await module.dp.feed_update(module.bot, update)
+            except Exception as e:
+                failures[type(e).__name__] += 1
+            latencies[data_type].append(time.perf_counter() - started)
+
+    await pool.start()
+    try:
+        stats_before = await pool.stats()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        receiver_cpu = time.process_time() - cpu_started
+        worker_stats = await pool.stats()
+        workers_cpu = sum(after['cpu'] - before['cpu'] for before, after in zip(stats_before, worker_stats))
+    finally:
+        await pool.stop()
+        await module.shared_state.close()
+        await module.storage.close()
+        await module.bot.session.close()
+        await stub.stop()
+
+    report(f"3lab, воркеров {count}", elapsed, latencies, failures)
+    print(pool.format_stats())
+    print("Обработано воркерами: " + ", ".join(
+        f"{index}: {stats['processed']} (ошибок {stats['failed']})" for index, stats in enumerate(worker_stats)
+    ))
+    total = len(workload)
+    print(
+        f"Процессор на сообщение: приемник с заглушкой {receiver_cpu / total * 1e6:,.0f} мкс, "
+        f"воркеры {workers_cpu / total * 1e6:,.0f} мкс (ядер: {os.cpu_count()})"
+    )
+    print(stub.format_stats())
+    print("Вызовы Bot API: " + ", ".join(f"{name}: {count}" for name, count in stub.telegram_calls.most_common()))
+    if failures:
+        print("Исключения: " + ", ".join(f"{name}: {count}" for name, count in failures.items()))
+    print()
+    return sum(len(values) for values in latencies.values()) / elapsed
+
+
+def report(lab, elapsed, latencies, failures):
+    total = sum(len(values) for values in latencies.values())
+    print(f"{lab}: {total} сообщений за {elapsed:.2f} с - {total / elapsed:,.0f} сообщ/с")
+    print(f"  {'тип':<6} {'сообщ.':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'макс, мс':>9}")
+    rows = [(data_type, latencies[data_type]) for data_type in DATA_TYPES if latencies[data_type]]
+    rows.append(("все", [value for values in latencies.values() for value in values]))
+    for name, values in rows:
+        values = sorted(values)
+        print(
+            f"  {name:<6} {len(values):>7} {percentile(values, 0.5) * 1000:>9.1f} "
+            f"{percentile(values, 0.95) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f} "
+            f"{values[-1] * 1000:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labs", nargs="+", choices=("2lab", "3lab"), default=["2lab", "3lab"])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременно обрабатываемых сообщений")
+    parser.add_argument("--mix", type=parse_mix, default="email=4,url=3,ip=3", help="Доли типов: email=4,url=3,ip=3")
+    parser.add_argument("--pool", type=int, default=500, help="Различных значений каждого типа")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=50, help="Задержка заглушки API, мс")
+    parser.add_argument("--jitter", type=float, default=20, help="Разброс задержки заглушки, ± мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Доля случайных ответов 429")
+    parser.add_argument("--provider-rps", type=int, default=0, help="Лимит запросов/с на провайдера (0 - нет)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After в ответах 429, с")
+    parser.add_argument("--telegram-latency", type=float, default=0, help="Задержка ответа Bot API, мс")
+    parser.add_argument("--lab-limits", action="store_true", help="Оставить лимиты запросов 3lab")
+    parser.add_argument("--no-balancing", dest="balancing", action="store_false",
+                        help="Не запускать периодическую балансировку 3lab")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--log-level", default="CRITICAL",
+                        help="Уровень логов ботов (ошибки обработчиков и так видны в отчете)")
+    parser.add_argument("--verbose", action="store_true", help="Статистика кэша, лимитов и сессий лабораторной")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        help="Вместо --labs: 3lab в многопроцессном режиме с указанным числом воркеров")
+    args = parser.parse_args()
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)  # bot.db, node_loads.json и history.json лабораторных - во временном каталоге
+    try:
+        if args.workers:
+            rates = {}
+            for count in args.workers:
+                rates[count] = asyncio.run(run_workers(count, args))
+                # Общее состояние предыдущего прогона (нагрузка узлов, кэш) не должно влиять на следующий
+                for name in os.listdir(workdir):
+                    os.remove(os.path.join(workdir, name))
+            base = rates[args.workers[0]] / args.workers[0]
+            print(f"{'воркеров':>8} {'сообщ/с':>9} {'на воркер':>10} {'масштабирование':>16}")
+            for count, rate in rates.items():
+                print(f"{count:>8} {rate:>9,.0f} {rate / count:>10,.0f} {rate / (base * count):>15.0%}")
+        else:
+            for lab in args.labs:
+                asyncio.run(run_lab(lab, args))
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,561 @@
+"""Офлайн-симулятор балансировщиков 1lab, 3lab и 4lab (без Telegram).
+
+Модули лабораторных загружаются как есть, а запросы идут в виртуальном времени:
+- 1lab: узел выбирает LoadBalancer.select_node() (стратегия из strategies.py);
+- 3lab: узел выбирает select_node() по запросам в работе (in_flight) и EWMA;
+  каждый запрос держит Node.lease() от поступления до завершения, часы модуля
+  идут по виртуальному времени, поэтому EWMA, модельная нагрузка от аренд и ее
+  затухание (decay_node_loads) считаются как в боте; события порогов и волна
+  Финна + make_balancing_decision через balancing_scheduler переносят модельную
+  нагрузку, а запросы остаются на своих узлах;
+- 4lab: запросы приходят на узлы неравномерно (--skew), фазовая волна balance_load
+  запускается планировщиком balancing_scheduler.
+
+У каждого узла есть несколько обработчиков (--slots) и очередь. Если алгоритм
+балансировки 1lab или 4lab перенес нагрузку между узлами, симулятор переносит
+столько же ожидающих в очереди запросов - так решения балансировщика влияют на задержки.
+
+Отчет: p50/p95/p99 задержки, пропускная способность, загрузка обработчиков каждого
+узла, разброс и коэффициент вариации очередей во времени. Все генераторы случайных
+чисел получают фиксированные seed, поэтому повторный запуск дает те же числа.
+
+Запуск всего набора:          python simulate.py
+Сохранить эталон:             python simulate.py --save baseline.json
+Сравнить с эталоном:          python simulate.py --compare baseline.json --tolerance 0.1
+Один сценарий:                python simulate.py --labs 3lab --arrivals bursty --duration 600
+"""
+import argparse
+import asyncio
+import contextlib
+import heapq
+import importlib.util
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+LAB_SCENARIOS = {
+    '1lab/least_loaded': ('1lab', 'least_loaded'),
+    '1lab/round_robin': ('1lab', 'round_robin'),
+    '1lab/weighted_least_connections': ('1lab', 'weighted_least_connections'),
+    '1lab/power_of_two': ('1lab', 'power_of_two'),
+    '3lab': ('3lab', None),
+    '4lab': ('4lab', None)
+}
+
+
+# --- Загрузка модулей лабораторных ---
+
+def load_lab(lab, env):
+    """Импортирует <n>lab/<n>.py; одноименные вспомогательные модули разных лабораторных не смешиваются"""
+    lab_dir = os.path.join(ROOT, lab)
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if path.startswith(ROOT + os.sep) and os.path.dirname(path) != ROOT:
+            del sys.modules[name]
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:SIMULATION")
+    os.environ.update(env)
+    sys.path.insert(0, lab_dir)
+    try:
+        number = lab.replace("lab", "")
+        spec = importlib.util.spec_from_file_location(f"sim_lab{number}", os.path.join(lab_dir, f"{number}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(lab_dir)
+    return module
+
+
+# --- Адаптеры: как лабораторная выбирает узел и балансирует ---
+
+class OccupancyAdapter:
+    """Лабораторная видит занятость узла (запросы в работе и в очереди) как его нагрузку"""
+
+    migrates = True  # Перенос нагрузки балансировкой переносит и ожидающие запросы
+
+    def advance(self, now):
+        pass
+
+    async def arrive(self, index, request, load):
+        self.set_load(index, load)
+
+    async def depart(self, index, request, load):
+        self.set_load(index, load)
+
+
+class Lab1Adapter(OccupancyAdapter):
+    def __init__(self, strategy, slots, seed):
+        self.module = load_lab("1lab", {"NODE_EXECUTOR": "thread", "NODE_COUNT": str(len(slots))})
+        self.nodes = [
+            self.module.Node(i, max_load=count * 25, executor="thread", workers=1)
+            for i, count in enumerate(slots)
+        ]
+        self.balancer = self.module.LoadBalancer(
+            self.nodes, self.module.create_strategy(strategy, rng=random.Random(seed))
+        )
+        self.scheduler = None
+
+    async def start(self):
+        pass
+
+    def route(self, rng):
+        with contextlib.redirect_stdout(io.StringIO()):  # select_node печатает каждый выбор
+            return self.balancer.select_node().node_id
+
+    def capacity(self, index):
+        return math.inf
+
+    def lab_loads(self):
+        return [node.load for node in self.nodes]
+
+    def set_load(self, index, load):
+        node = self.nodes[index]
+        node.load = load
+        node._notify_balancer()
+
+    async def balance(self):
+        return []
+
+    def stats(self):
+        return {}
+
+    async def close(self):
+        self.balancer.shutdown()
+        self.module.balancer.shutdown()
+
+
+class VirtualTime:
+    """Замена модуля time в 3lab: monotonic() возвращает виртуальное время симуляции"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class Lab3Adapter:
+    migrates = False  # 3lab переносит модельную нагрузку, запросы в работе остаются на своих узлах
+
+    def __init__(self, slots, service_mean, seed):
+        # 100% модельной нагрузки - поток запросов, полностью занимающий узел со средним числом обработчиков
+        load_decay = 100 * service_mean * len(slots) / sum(slots)
+        self.module = load_lab("3lab", {
+            "NODE_COUNT": str(len(slots)), "WAVE_LOG": "off", "NODE_LOAD_DECAY": str(load_decay)
+        })
+        self.clock = VirtualTime()
+        self.module.time = self.clock
+        self.seed = seed
+        self.scheduler = self.module.balancing_scheduler
+        self.leases = {}  # (узел, время поступления) -> открытые аренды
+        self.decayed_at = 0.0
+
+    async def start(self):
+        module = self.module
+        await module.initialize_network()
+        # Метки равенства в куче - из фиксированного seed
+        module.node_registry = module.NodeRegistry(
+            module.NODES, key=lambda node: node.expected_completion(), rng=random.Random(self.seed)
+        )
+        for node in module.NODES:
+            node.ewma_updated = self.clock.now
+
+    def advance(self, now):
+        self.clock.now = now
+        elapsed = now - self.decayed_at
+        if elapsed >= self.module.NODE_LOAD_DECAY_INTERVAL:
+            self.module.decay_node_loads(elapsed)
+            self.decayed_at = now
+
+    async def arrive(self, index, request, load):
+        lease = self.module.NODES[index].lease()
+        await lease.__aenter__()
+        self.leases.setdefault((index, request), []).append(lease)
+
+    async def depart(self, index, request, load):
+        leases = self.leases[(index, request)]
+        lease = leases.pop()
+        if not leases:
+            del self.leases[(index, request)]
+        await lease.__aexit__(None, None, None)
+
+    def route(self, rng):
+        return self.module.select_node().node_id
+
+    def capacity(self, index):
+        return self.module.NODES[index].max_load
+
+    def lab_loads(self):
+        return [node.load for node in self.module.NODES]
+
+    async def balance(self):
+        return await self.scheduler.run_cycle()
+
+    def stats(self):
+        trigger = self.module.rebalance_trigger
+        return {'watermark_events': trigger.events, 'targeted_rebalances': trigger.rebalances}
+
+    async def close(self):
+        await self.module.storage.close()
+
+
+class Lab4Adapter(OccupancyAdapter):
+    def __init__(self, skew, seed):
+        self.module = load_lab("4lab", {"CLUSTER_MODE": "local"})
+        self.skew = skew
+        self.scheduler = self.module.balancing_scheduler
+
+    async def start(self):
+        pass
+
+    def route(self, rng):
+        return rng.choices(range(len(self.module.NODES)), weights=self.skew)[0]
+
+    def capacity(self, index):
+        return self.module.NODES[index].max_load
+
+    def lab_loads(self):
+        return [node.load for node in self.module.NODES]
+
+    def set_load(self, index, load):
+        self.module.NODES[index].load = load
+
+    async def balance(self):
+        return await self.scheduler.run_cycle()
+
+    def stats(self):
+        return {'messages': self.module.message_bus.delivered}
+
+    async def close(self):
+        pass
+
+
+# --- Потоки запросов и время обслуживания ---
+
+def poisson_arrivals(rate, duration, rng):
+    now = 0.0
+    while True:
+        now += rng.expovariate(rate)
+        if now >= duration:
+            return
+        yield now
+
+
+def bursty_arrivals(rate, duration, rng, burst_share=0.2, burst_factor=4.0, burst_length=2.0):
+    """Всплески: доля времени burst_share с интенсивностью rate * burst_factor, остальное - тише"""
+    quiet_rate = rate * (1 - burst_share * burst_factor) / (1 - burst_share)
+    quiet_length = burst_length * (1 - burst_share) / burst_share
+    now, bursting = 0.0, False
+    switch_at = rng.expovariate(1 / quiet_length)
+    while now < duration:
+        current_rate = rate * burst_factor if bursting else quiet_rate
+        step = rng.expovariate(current_rate) if current_rate > 0 else math.inf
+        if now + step >= switch_at:
+            now = switch_at
+            bursting = not bursting
+            switch_at = now + rng.expovariate(1 / (burst_length if bursting else quiet_length))
+            continue
+        now += step
+        if now < duration:
+            yield now
+
+
+def diurnal_arrivals(rate, duration, rng, amplitude=0.8, periods=2):
+    """Суточный профиль: rate * (1 + amplitude * sin), «сутки» сжаты до duration / periods"""
+    peak = rate * (1 + amplitude)
+    period = duration / periods
+    now = 0.0
+    while True:
+        now += rng.expovariate(peak)
+        if now >= duration:
+            return
+        if rng.random() * peak <= rate * (1 + amplitude * math.sin(2 * math.pi * now / period)):
+            yield now
+
+
+ARRIVALS = {'poisson': poisson_arrivals, 'bursty': bursty_arrivals, 'diurnal': diurnal_arrivals}
+
+
+def make_service(name, mean, rng):
+    if name == "exp":
+        return lambda: rng.expovariate(1 / mean)
+    if name == "lognormal":
+        sigma = 1.0
+        mu = math.log(mean) - sigma ** 2 / 2
+        return lambda: rng.lognormvariate(mu, sigma)
+    if name == "const":
+        return lambda: mean
+    raise ValueError(f"Неизвестное распределение времени обслуживания: {name}")
+
+
+# --- Модель узлов ---
+
+class SimNode:
+    def __init__(self, slots):
+        self.slots = slots
+        self.busy = 0
+        self.queue = deque()  # Время поступления ожидающих запросов
+        self.busy_area = 0.0  # Интеграл числа занятых обработчиков по времени
+        self.changed_at = 0.0
+
+    @property
+    def count(self):
+        return self.busy + len(self.queue)
+
+    def account(self, now):
+        self.busy_area += self.busy * (now - self.changed_at)
+        self.changed_at = now
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def imbalance(counts):
+    mean = sum(counts) / len(counts)
+    variance = sum((count - mean) ** 2 for count in counts) / len(counts)
+    return max(counts) - min(counts), (math.sqrt(variance) / mean if mean else 0.0)
+
+
+class Simulation:
+    def __init__(self, adapter, slots, args, seed):
+        self.adapter = adapter
+        self.nodes = [SimNode(count) for count in slots]
+        self.args = args
+        self.rng = random.Random(seed)
+        self.service = make_service(args.service, args.service_mean, random.Random(seed + 1))
+        self.events = []
+        self.seq = 0
+        self.latencies = []
+        self.series = []
+        self.migrations = 0
+        self.balance_rounds = 0
+        self.finished_at = 0.0  # Завершение последнего запроса
+
+    def push(self, time, kind, data=None):
+        self.seq += 1
+        heapq.heappush(self.events, (time, self.seq, kind, data))
+
+    def view(self, index):
+        """Нагрузка узла, как ее видит лабораторная (с учетом max_load)"""
+        return min(self.nodes[index].count, self.adapter.capacity(index))
+
+    def start_waiting(self, index, now):
+        node = self.nodes[index]
+        while node.busy < node.slots and node.queue:
+            arrived = node.queue.popleft()
+            node.account(now)
+            node.busy += 1
+            self.push(now + self.service(), "done", (index, arrived))
+
+    def reconcile(self, now):
+        """Переносит ожидающие запросы вслед за переносом нагрузки в лабораторной"""
+        loads = self.adapter.lab_loads()
+        givers, takers = [], []
+        for index, node in enumerate(self.nodes):
+            delta = loads[index] - self.view(index)
+            if delta < 0 and node.queue:
+                givers.append([index, min(-delta, len(node.queue))])
+            elif delta > 0:
+                takers.append([index, delta])
+        for giver in givers:
+            while giver[1] and takers:
+                taker = takers[0]
+                moved = min(giver[1], taker[1])
+                for _ in range(moved):
+                    self.nodes[taker[0]].queue.append(self.nodes[giver[0]].queue.pop())
+                self.migrations += moved
+                giver[1] -= moved
+                taker[1] -= moved
+                self.start_waiting(taker[0], now)
+                if taker[1] == 0:
+                    takers.pop(0)
+        for index in range(len(self.nodes)):
+            if self.adapter.lab_loads()[index] != self.view(index):
+                self.adapter.set_load(index, self.view(index))
+
+    async def settle(self, now):
+        await asyncio.sleep(0)  # Точечные балансировки 3lab выполняются задачами цикла событий
+        if self.adapter.migrates:
+            self.reconcile(now)
+
+    async def run(self, arrival_name):
+        args = self.args
+        capacity = sum(node.slots for node in self.nodes) / args.service_mean
+        arrivals = ARRIVALS[arrival_name](capacity * args.utilization, args.duration, self.rng)
+        first = next(arrivals, None)
+        if first is not None:
+            self.push(first, "arrival")
+        self.push(args.sample_interval, "sample")
+        if self.adapter.scheduler:
+            self.push(self.adapter.scheduler.min_interval, "balance")
+
+        now = 0.0
+        while self.events:
+            now, _, kind, data = heapq.heappop(self.events)
+            self.adapter.advance(now)
+            if kind == "arrival":
+                index = self.adapter.route(self.rng)
+                self.nodes[index].queue.append(now)
+                self.start_waiting(index, now)
+                await self.adapter.arrive(index, now, self.view(index))
+                following = next(arrivals, None)
+                if following is not None:
+                    self.push(following, "arrival")
+            elif kind == "done":
+                index, arrived = data
+                node = self.nodes[index]
+                node.account(now)
+                node.busy -= 1
+                self.latencies.append(now - arrived)
+                self.finished_at = now
+                self.start_waiting(index, now)
+                await self.adapter.depart(index, arrived, self.view(index))
+            elif kind == "sample":
+                spread, cv = imbalance([node.count for node in self.nodes])
+                self.series.append({'t': round(now, 3), 'spread': spread, 'cv': round(cv, 4)})
+                if now < args.duration:
+                    self.push(now + args.sample_interval, "sample")
+            elif kind == "balance":
+                rounds = await self.adapter.balance()
+                self.balance_rounds += max(0, len(rounds) - 1)
+                following = now + self.adapter.scheduler.update_interval(rounds)
+                if following < args.duration:
+                    self.push(following, "balance")
+            await self.settle(now)
+
+        for node in self.nodes:
+            node.account(self.finished_at)
+        return self.report(self.finished_at)
+
+    def report(self, end):
+        latencies = sorted(self.latencies)
+        spreads = [point['spread'] for point in self.series] or [0]
+        cvs = [point['cv'] for point in self.series] or [0]
+        return {
+            'completed': len(latencies),
+            'throughput': len(latencies) / end if end else 0.0,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'utilization': [round(node.busy_area / (node.slots * end), 4) if end else 0.0 for node in self.nodes],
+            'spread_mean': sum(spreads) / len(spreads),
+            'spread_max': max(spreads),
+            'cv_mean': sum(cvs) / len(cvs),
+            'balance_rounds': self.balance_rounds,
+            'migrations': self.migrations,
+            **self.adapter.stats(),
+            'series': self.series
+        }
+
+
+def make_adapter(lab, strategy, slots, args, seed):
+    if lab == "1lab":
+        return Lab1Adapter(strategy, slots, seed)
+    if lab == "3lab":
+        return Lab3Adapter(slots, args.service_mean, seed)
+    return Lab4Adapter(args.skew, seed)
+
+
+async def run_scenario(name, arrival_name, args):
+    lab, strategy = LAB_SCENARIOS[name]
+    # В 4lab топология фиксирована - три узла
+    slots = args.slots if lab != "4lab" else (args.slots * 3)[:3]
+    random.seed(args.seed)  # random.choice источника волны в 3lab
+    adapter = make_adapter(lab, strategy, slots, args, args.seed)
+    await adapter.start()
+    try:
+        return await Simulation(adapter, slots, args, args.seed).run(arrival_name)
+    finally:
+        await adapter.close()
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно эталона: рост p99 или падение пропускной способности больше допуска"""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        if result['p99'] > reference['p99'] * (1 + tolerance):
+            regressions.append(f"{key}: p99 {reference['p99'] * 1000:.1f} -> {result['p99'] * 1000:.1f} мс")
+        if result['throughput'] < reference['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{key}: пропускная способность {reference['throughput']:.1f} -> {result['throughput']:.1f} запр/с"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labs", nargs="+", choices=list(LAB_SCENARIOS), default=list(LAB_SCENARIOS))
+    parser.add_argument("--arrivals", nargs="+", choices=list(ARRIVALS), default=list(ARRIVALS))
+    parser.add_argument("--service", choices=("exp", "lognormal", "const"), default="exp")
+    parser.add_argument("--service-mean", type=float, default=0.1, help="Среднее время обслуживания, с")
+    parser.add_argument("--slots", type=lambda text: [int(x) for x in text.split(",")], default=[4, 4, 2],
+                        help="Обработчиков на узел, через запятую")
+    parser.add_argument("--utilization", type=float, default=0.8, help="Доля от суммарной емкости узлов")
+    parser.add_argument("--skew", type=lambda text: [float(x) for x in text.split(",")], default=[0.6, 0.3, 0.1],
+                        help="Доли запросов, приходящих на узлы 4lab")
+    parser.add_argument("--duration", type=float, default=300, help="Виртуальное время, с")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--save", help="Сохранить результаты в JSON (эталон)")
+    parser.add_argument("--compare", help="Сравнить с эталоном из JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="simulate-")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)  # Файлы состояния лабораторных (node_loads.json, bot.db) - во временном каталоге
+    results = {}
+    try:
+        width = max(len(f"{name}/{arrival_name}") for name in args.labs for arrival_name in args.arrivals)
+        print(f"{'сценарий':<{width}} {'запр/с':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+              f"{'загрузка узлов':>20} {'разброс ср/макс':>16} {'раундов':>8}")
+        for name in args.labs:
+            for arrival_name in args.arrivals:
+                key = f"{name}/{arrival_name}"
+                result = asyncio.run(run_scenario(name, arrival_name, args))
+                results[key] = result
+                utilization = "/".join(f"{value:.2f}" for value in result['utilization'])
+                print(
+                    f"{key:<{width}} {result['throughput']:>8.1f} {result['p50'] * 1000:>9.1f} "
+                    f"{result['p95'] * 1000:>9.1f} {result['p99'] * 1000:>9.1f} {utilization:>20} "
+                    f"{result['spread_mean']:>8.1f}/{result['spread_max']:<7} {result['balance_rounds']:>8}"
+                )
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, ensure_ascii=False, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("\nРегрессии:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nРегрессий относительно эталона нет")
+
+
+if __name__ == "__main__":
+    main()